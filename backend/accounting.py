@@ -0,0 +1,112 @@
+"""
+Token accounting and budgets
+Every upstream call reserves its worst-case token cost before dispatch, so
+per-request and per-key budgets hold even with concurrent chunks, then
+settles the prompt and output tokens it actually used, as reported by
+Replicate when the prediction carries metrics and estimated otherwise
+"""
+import os
+import threading
+import time
+
+
+def _env_int(name, default=0):
+    value = os.getenv(name, "").strip()
+    return int(value) if value else default
+
+
+class BudgetExceededError(RuntimeError):
+    """A call would take a request or API key over its token budget"""
+
+
+class UsageLedger:
+    def __init__(self, request_budget=None, key_budget=None, key_window=None, max_keys=10000):
+        # 0 disables a budget
+        self.request_budget = _env_int("GFP_REQUEST_TOKEN_BUDGET") if request_budget is None else request_budget
+        self.key_budget = _env_int("GFP_KEY_TOKEN_BUDGET") if key_budget is None else key_budget
+        self.key_window = _env_int("GFP_KEY_BUDGET_WINDOW", 86400) if key_window is None else key_window
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._keys = {}
+        self._rejected = 0
+
+    @staticmethod
+    def new_request():
+        """Usage counters for one request; pass the same dict to reserve() and settle()"""
+        return {"prompt_tokens": 0, "output_tokens": 0, "calls": 0, "reserved": 0}
+
+    def _key(self, scope, now):
+        entry = self._keys.get(scope)
+        if entry is None:
+            if len(self._keys) >= self.max_keys:
+                # Forget the key that has been idle longest
+                del self._keys[min(self._keys, key=lambda k: self._keys[k]["last_used"])]
+            entry = self._keys[scope] = {
+                "prompt_tokens": 0, "output_tokens": 0, "calls": 0, "chunks": 0, "requests": 0,
+                "window_start": now, "window_tokens": 0, "reserved": 0, "last_used": now,
+            }
+        elif self.key_window and now - entry["window_start"] >= self.key_window:
+            entry["window_start"] = now
+            entry["window_tokens"] = 0
+        entry["last_used"] = now
+        return entry
+
+    def reserve(self, scope, tokens, request_usage):
+        """Hold `tokens` against both budgets; raises BudgetExceededError instead of dispatching"""
+        with self._lock:
+            entry = self._key(scope, time.time())
+            spent = request_usage["prompt_tokens"] + request_usage["output_tokens"] + request_usage["reserved"]
+            if self.request_budget and spent + tokens > self.request_budget:
+                self._rejected += 1
+                raise BudgetExceededError(
+                    f"Request token budget exceeded ({spent} used, {tokens} more needed, limit {self.request_budget})"
+                )
+            if self.key_budget and entry["window_tokens"] + entry["reserved"] + tokens > self.key_budget:
+                self._rejected += 1
+                raise BudgetExceededError(
+                    f"API key token budget exceeded ({entry['window_tokens']} used, limit {self.key_budget} "
+                    f"per {self.key_window}s)"
+                )
+            entry["reserved"] += tokens
+            request_usage["reserved"] += tokens
+
+    def settle(self, scope, reserved, prompt_tokens, output_tokens, request_usage):
+        """Release a reservation and book what the call actually used"""
+        with self._lock:
+            entry = self._key(scope, time.time())
+            entry["reserved"] -= reserved
+            entry["prompt_tokens"] += prompt_tokens
+            entry["output_tokens"] += output_tokens
+            entry["window_tokens"] += prompt_tokens + output_tokens
+            entry["calls"] += 1
+            request_usage["reserved"] -= reserved
+            request_usage["prompt_tokens"] += prompt_tokens
+            request_usage["output_tokens"] += output_tokens
+            request_usage["calls"] += 1
+
+    def record_request(self, scope, chunks):
+        """Count one finished request and the chunks it was split into"""
+        with self._lock:
+            entry = self._key(scope, time.time())
+            entry["requests"] += 1
+            entry["chunks"] += chunks
+
+    def snapshot(self, top=50):
+        """Totals plus the heaviest keys (by key hash) for the metrics endpoint"""
+        with self._lock:
+            keys = sorted(self._keys.items(), key=lambda item: item[1]["prompt_tokens"] + item[1]["output_tokens"], reverse=True)
+            return {
+                "budgets": {
+                    "request_tokens": self.request_budget or None,
+                    "key_tokens": self.key_budget or None,
+                    "key_window": self.key_window,
+                },
+                "keys": len(self._keys),
+                "prompt_tokens": sum(entry["prompt_tokens"] for entry in self._keys.values()),
+                "output_tokens": sum(entry["output_tokens"] for entry in self._keys.values()),
+                "rejected": self._rejected,
+                "by_key": {
+                    scope: {name: entry[name] for name in ("prompt_tokens", "output_tokens", "calls", "chunks", "requests", "window_tokens")}
+                    for scope, entry in keys[:top]
+                },
+            }
@@ -3,20 +3,61 @@ Grammar Fixer Pro - API Server
 FastAPI server for Chrome extension integration
 """
 
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from engine import LLMEngine
+from typing import List, Literal, Optional
+from accounting import BudgetExceededError
+from engine import LLMEngine, MODEL_ROUTER, RESULT_CACHE, UPSTREAM_LIMITER, USAGE_LEDGER, warm_up
+from prompt_builder import PROMPT_STATS
+from speculation import Speculator
+from jobs import FINISHED_STATES, JobRunner, JobStore
+import asyncio
+import json
 import logging
+import time
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Document jobs survive restarts; chunk results are persisted as they finish
+job_store = JobStore()
+job_runner = JobRunner(job_store)
+
+# Filled once at startup; health probes only ever read this
+service_state = {
+    "ready": False,
+    "started_at": None,
+    "replicate_available": False,
+    "model": None
+}
+
+@asynccontextmanager
+async def lifespan(app):
+    """Warm shared clients once so probes and first requests stay cheap"""
+    start = time.time()
+    # The SDK import is the slow part; keep it off the event loop
+    service_state.update(await asyncio.to_thread(warm_up))
+    purged = job_store.purge_expired()
+    if purged:
+        logger.info(f"Deleted {purged} expired document job(s)")
+    interrupted = job_store.mark_interrupted()
+    if interrupted:
+        logger.info(f"{interrupted} document job(s) interrupted by the last shutdown - resumable via POST /jobs")
+    service_state["started_at"] = time.time()
+    service_state["ready"] = True
+    logger.info(f"Startup warm-up finished in {time.time() - start:.2f}s")
+    yield
+    service_state["ready"] = False
+
 app = FastAPI(
     title="Grammar Fixer Pro API",
     description="AI-powered grammar and spell checking API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS for Chrome extension
@@ -32,11 +73,48 @@ app.add_middleware(
 class TextRequest(BaseModel):
     text: str
     api_key: str
+    # Opt-in: enhance the corrected text in the background for these types
+    speculative_enhancement: List[str] = []
+    # Terms the model must never edit (product names, jargon); masked before prompting
+    protected_terms: List[str] = []
+    # "full" (corrected text + edits) or "edits" (compact edit records, fewer output tokens)
+    output_format: Literal["full", "edits"] = "full"
+    # Soft latency target; the router falls back to the faster model when it is tight
+    deadline_ms: Optional[int] = None
+
+class ApiKeyRequest(BaseModel):
+    api_key: str
 
 class EnhanceRequest(BaseModel):
     text: str
     enhancement_type: str
     api_key: str
+    deterministic: bool = False  # Greedy decoding; identical inputs become cache hits
+    deadline_ms: Optional[int] = None
+    # Masked before the fused /correct-enhance prompt, as for /correct
+    protected_terms: List[str] = []
+
+# How often a long-running request checks whether its client is still there
+DISCONNECT_POLL_INTERVAL = 0.25
+
+async def run_until_disconnect(http_request: Request, coro):
+    """Await `coro`, cancelling it (and its upstream generations) if the client disconnects"""
+    task = asyncio.create_task(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                task.cancel()
+                logger.info("Client disconnected - cancelled in-flight generation")
+                # Nobody will read this; 499 mirrors nginx's "client closed request"
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        if not task.done():
+            task.cancel()
+
+speculator = Speculator(UPSTREAM_LIMITER)
 
 logger.info("API server ready - engine will be initialized per request with user API key")
 
@@ -51,22 +129,45 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Detailed health check"""
-    try:
-        # Test engine initialization with dummy key
-        test_engine = LLMEngine(api_key="test")
-        return {
-            "status": "healthy",
-            "engine": "ready",
-            "features": [
-                "spell_checking",
-                "grammar_correction",
-                "text_enhancement"
-            ],
-            "message": "Provide your Replicate API key in requests"
-        }
-    except Exception as e:
-        raise HTTPException(status_code=503, detail=f"Engine test failed: {str(e)}")
+    """Detailed health check, answered from state cached at startup"""
+    if not service_state["ready"] or not service_state["replicate_available"]:
+        raise HTTPException(status_code=503, detail="Engine not ready: Replicate SDK unavailable or startup incomplete")
+    return {
+        "status": "healthy",
+        "engine": "ready",
+        "model": service_state["model"],
+        "uptime": time.time() - service_state["started_at"],
+        "features": [
+            "spell_checking",
+            "grammar_correction",
+            "text_enhancement"
+        ],
+        "message": "Provide your Replicate API key in requests"
+    }
+
+@app.get("/health/live")
+async def liveness():
+    """Liveness probe: the process is serving requests"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness probe: startup warm-up has finished"""
+    if not service_state["ready"] or not service_state["replicate_available"]:
+        raise HTTPException(status_code=503, detail="not ready")
+    return {"status": "ready"}
+
+@app.get("/metrics")
+async def metrics():
+    """Runtime metrics, including the adaptive upstream concurrency limit"""
+    return {
+        "upstream_concurrency": UPSTREAM_LIMITER.snapshot(),
+        "result_cache": RESULT_CACHE.stats(),
+        "speculation": speculator.stats(),
+        "prompts": PROMPT_STATS.snapshot(),
+        "routing": MODEL_ROUTER.snapshot(),
+        "usage": USAGE_LEDGER.snapshot()
+    }
 
 @app.get("/test")
 async def test_engine():
@@ -79,52 +180,190 @@ async def test_engine():
         }
     }
 
+def enhancement_response(result):
+    """Shape an engine enhancement result for the API"""
+    return {
+        "success": True,
+        "enhanced_text": result["text"],
+        "enhancement_type": result["enhancement_type"],
+        "changes": result.get("changes", []),
+        # True when some chunk failed and kept its original wording
+        "partial": result.get("partial", False)
+    }
+
 @app.post("/correct")
-async def correct_text(request: TextRequest):
+async def correct_text(request: TextRequest, http_request: Request):
     """Correct grammar and spelling in the provided text"""
     try:
         logger.info(f"Correcting text: {request.text[:50]}...")
         
         # Initialize engine with user's API key
-        engine = LLMEngine(api_key=request.api_key)
-        result = await engine.correct_text_async(request.text)
+        engine = LLMEngine(api_key=request.api_key, protected_terms=request.protected_terms, output_format=request.output_format, deadline_ms=request.deadline_ms)
+        result = await run_until_disconnect(http_request, engine.correct_text_async(request.text))
         
         logger.info(f"Correction completed. Success: {result['success']}")
+        
+        if result["success"] and request.speculative_enhancement:
+            speculator.schedule(engine, result["text"], request.speculative_enhancement)
+        
         return result
+    except HTTPException:
+        raise
+    except BudgetExceededError as e:
+        logger.warning(f"Correction refused: {str(e)}")
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         logger.error(f"Error correcting text: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error correcting text: {str(e)}")
 
 @app.post("/enhance")
-async def enhance_text(request: EnhanceRequest):
+async def enhance_text(request: EnhanceRequest, http_request: Request):
     """Enhance text for naturalness or formality"""
     try:
         logger.info(f"Enhancing text for {request.enhancement_type}: {request.text[:50]}...")
         
         # Initialize engine with user's API key
-        engine = LLMEngine(api_key=request.api_key)
+        engine = LLMEngine(api_key=request.api_key, deadline_ms=request.deadline_ms)
+        
+        # A speculative result started after /correct answers immediately
+        result = None
+        if request.enhancement_type in ("naturalness", "formality"):
+            result = await run_until_disconnect(
+                http_request, speculator.take(engine, request.text, request.enhancement_type)
+            )
         
-        if request.enhancement_type == "naturalness":
-            result = await engine.enhance_naturalness(request.text)
+        if result is not None:
+            logger.info(f"Serving speculative {request.enhancement_type} enhancement")
+        elif request.enhancement_type == "naturalness":
+            result = await run_until_disconnect(http_request, engine.enhance_naturalness(request.text, request.deterministic))
         elif request.enhancement_type == "formality":
-            result = await engine.enhance_formality(request.text)
+            result = await run_until_disconnect(http_request, engine.enhance_formality(request.text, request.deterministic))
         else:
             raise HTTPException(status_code=400, detail="Invalid enhancement type. Use 'naturalness' or 'formality'")
         
-        enhanced_result = {
-            "success": True,
-            "enhanced_text": result["text"],
-            "enhancement_type": result["enhancement_type"],
-            "changes": result.get("changes", [])
-        }
+        enhanced_result = enhancement_response(result)
+        enhanced_result["usage"] = engine.request_usage()
         
         logger.info(f"Enhancement completed for {request.enhancement_type}")
         return enhanced_result
         
+    except HTTPException:
+        raise
+    except BudgetExceededError as e:
+        logger.warning(f"Enhancement refused: {str(e)}")
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         logger.error(f"Error enhancing text: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error enhancing text: {str(e)}")
 
+@app.post("/correct-enhance")
+async def correct_and_enhance_text(request: EnhanceRequest, http_request: Request):
+    """Correct and then enhance text in a single LLM round-trip"""
+    if request.enhancement_type not in ("naturalness", "formality"):
+        raise HTTPException(status_code=400, detail="Invalid enhancement type. Use 'naturalness' or 'formality'")
+    
+    try:
+        logger.info(f"Correcting + enhancing for {request.enhancement_type}: {request.text[:50]}...")
+        
+        engine = LLMEngine(api_key=request.api_key, protected_terms=request.protected_terms, deadline_ms=request.deadline_ms)
+        correction, enhancement = await run_until_disconnect(
+            http_request, engine.correct_and_enhance(request.text, request.enhancement_type, request.deterministic)
+        )
+        
+        logger.info(f"Fused correction + {request.enhancement_type} completed")
+        return {
+            "success": True,
+            "correction": correction,
+            "enhancement": enhancement_response(enhancement),
+            "usage": engine.request_usage()
+        }
+    except HTTPException:
+        raise
+    except BudgetExceededError as e:
+        logger.warning(f"Fused correct + enhance refused: {str(e)}")
+        raise HTTPException(status_code=429, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in fused correct + enhance: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error correcting and enhancing text: {str(e)}")
+
+def public_job(job):
+    """Job record as returned to clients"""
+    job = dict(job)
+    job.pop("scope", None)
+    return job
+
+@app.post("/jobs")
+async def submit_job(request: TextRequest):
+    """Submit a document for asynchronous chunked correction.
+    
+    Re-submitting the same text with the same key returns the existing job
+    and resumes it from its last finished chunk.
+    """
+    try:
+        engine = LLMEngine(api_key=request.api_key, protected_terms=request.protected_terms, output_format=request.output_format)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error creating job: {str(e)}")
+    
+    job_store.purge_expired()
+    settings = {"protected_terms": engine.protected_terms, "output_format": engine.output_format}
+    job_id = job_store.find_job(engine.cache_scope, request.text, **settings)
+    if job_id is None:
+        job_id = job_store.create_job(engine.cache_scope, request.text, engine.chunk_text(request.text), **settings)
+        logger.info(f"Created document job {job_id}")
+    
+    job = job_store.get_job(job_id)
+    if job["status"] != "completed" and not job_runner.start(job_id, engine):
+        logger.info(f"Document job {job_id} is already running in another worker")
+    return public_job(job_store.get_job(job_id))
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Poll a job's status, progress and (once completed) result"""
+    job = job_store.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return public_job(job)
+
+@app.post("/jobs/{job_id}/resume")
+async def resume_job(job_id: str, request: ApiKeyRequest):
+    """Resume an interrupted or failed job from its last finished chunk"""
+    job = job_store.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    # Same masking and output format the job was submitted with
+    engine = LLMEngine(api_key=request.api_key, protected_terms=job["protected_terms"], output_format=job["output_format"])
+    if engine.cache_scope != job["scope"]:
+        raise HTTPException(status_code=403, detail="Job belongs to a different API key")
+    
+    if job["status"] != "completed" and not job_runner.start(job_id, engine):
+        logger.info(f"Document job {job_id} is already running in another worker")
+    return public_job(job_store.get_job(job_id))
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Stream job progress as server-sent events until the job stops"""
+    if job_store.get_job(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def events():
+        last = None
+        while True:
+            job = job_store.get_job(job_id)
+            if job is None:
+                # Purged while we were streaming; nothing more will happen
+                return
+            job = public_job(job)
+            progress = (job["status"], job["chunks_done"])
+            if progress != last:
+                last = progress
+                yield f"data: {json.dumps(job)}\n\n"
+            if job["status"] in FINISHED_STATES or job["status"] == "interrupted":
+                return
+            await asyncio.sleep(0.5)
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 if __name__ == "__main__":
     import uvicorn
     
@@ -133,7 +372,12 @@ if __name__ == "__main__":
     print("   GET  /         - Health check")
     print("   POST /correct  - Correct text with suggestions")
     print("   POST /enhance  - Enhance text (naturalness/formality)")
+    print("   POST /correct-enhance - Correct + enhance in one call")
+    print("   POST /jobs     - Submit a long document as a background job")
+    print("   GET  /jobs/{id}, /jobs/{id}/events - Job progress")
     print("   GET  /health   - Detailed health status")
+    print("   GET  /health/live, /health/ready - Probes")
+    print("   GET  /metrics  - Upstream concurrency metrics")
     print("   GET  /test     - Test endpoint info")
     print("")
     print("🌐 Server will be available at: http://localhost:8000")
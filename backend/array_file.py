@@ -0,0 +1,18 @@
+"""
+Array files for memory-mapped lookup tables
+Writes typed arrays little-endian and 8-byte aligned, the layout that
+shared_dictionary.py and ngram_model.py map and cast in place
+"""
+import sys
+from array import array
+
+
+def write_array(fh, values):
+    """Append `values` little-endian, then pad the file to the next 8-byte boundary"""
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    values.tofile(fh)
+    padding = -fh.tell() % 8
+    if padding:
+        fh.write(b"\0" * padding)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: word-level Myers diff vs the previous char-level difflib edits
+"""
+import difflib
+import random
+import time
+
+from diffing import compute_word_edits
+
+WORDS = ("the quick brown fox jumps over lazy dog we should check grammar and spelling "
+         "mistakes carefully before submitting any document to management quality is "
+         "extremely important for success in this project").split()
+
+
+def difflib_edits(original, corrected):
+    """The char-level implementation _compute_edits used before"""
+    edits = []
+    matcher = difflib.SequenceMatcher(None, original, corrected)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != 'equal':
+            edits.append((tag, i1, i2, corrected[j1:j2]))
+    return edits
+
+
+def make_pair(word_count, typo_rate, rng):
+    """A corrected text and an 'original' with typos dropped into some words"""
+    corrected = [rng.choice(WORDS) for _ in range(word_count)]
+    original = []
+    for word in corrected:
+        if rng.random() < typo_rate and len(word) > 2:
+            i = rng.randrange(len(word) - 1)
+            word = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+        original.append(word)
+    return " ".join(original), " ".join(corrected)
+
+
+def bench(fn, original, corrected, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(original, corrected)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    rng = random.Random(42)
+    print("📊 EDIT DIFF BENCHMARK (ms per call)")
+    print("=" * 62)
+    print(f"{'words':>7} {'typos':>6} {'difflib':>12} {'myers':>12} {'speedup':>10}")
+    for word_count in (50, 200, 1000, 5000):
+        for typo_rate in (0.02, 0.1):
+            original, corrected = make_pair(word_count, typo_rate, rng)
+            repeat = max(1, 2000 // word_count)
+            old = bench(difflib_edits, original, corrected, repeat)
+            new = bench(compute_word_edits, original, corrected, repeat)
+            print(f"{word_count:>7} {typo_rate:>6.0%} {old:>12.3f} {new:>12.3f} {old / new:>9.1f}x")
+
+    # Sanity check: applying the edits reproduces the corrected text
+    original, corrected = make_pair(500, 0.1, rng)
+    rebuilt = original
+    for edit in sorted(compute_word_edits(original, corrected), key=lambda e: e["start"], reverse=True):
+        rebuilt = rebuilt[:edit["start"]] + edit["suggestion"] + rebuilt[edit["end"]:]
+    print("✅ Edits reproduce the corrected text" if rebuilt == corrected else "❌ Edits do not reproduce the corrected text")
+
+
+if __name__ == "__main__":
+    main()
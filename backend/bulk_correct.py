@@ -0,0 +1,216 @@
+"""
+Grammar Fixer Pro - Bulk correction CLI
+Streams a text or JSONL corpus through LLMEngine with bounded memory,
+writes results incrementally and resumes from a checkpoint
+
+Usage:
+    python bulk_correct.py tickets.jsonl corrected.jsonl --field body --concurrency 8
+"""
+import argparse
+import asyncio
+import collections
+import copy
+import json
+import os
+import sys
+import time
+
+from accounting import BudgetExceededError, UsageLedger
+from engine import LLMEngine
+
+
+def read_records(path, fmt, field, start_offset=0):
+    """Yield (input_offset_after_record, text, record, error) one line at a time
+
+    A line that cannot be used yields an error message instead of stopping the
+    run; its text is the raw line and its record is None unless it parsed.
+    Blank JSONL lines are not records and yield no text, record or error.
+    """
+    with open(path, "rb") as fh:
+        fh.seek(start_offset)
+        while True:
+            line = fh.readline()
+            if not line:
+                return
+            offset = fh.tell()
+            try:
+                raw = line.decode("utf8").rstrip("\r\n")
+            except UnicodeDecodeError as e:
+                yield offset, line.decode("utf8", errors="replace").rstrip("\r\n"), None, f"Invalid UTF-8: {e}"
+                continue
+            if fmt == "jsonl":
+                if not raw.strip():
+                    yield offset, None, None, None
+                    continue
+                try:
+                    record = json.loads(raw)
+                except ValueError as e:
+                    yield offset, raw, None, f"Invalid JSON: {e}"
+                    continue
+                if not isinstance(record, dict):
+                    yield offset, raw, None, "Record is not a JSON object"
+                    continue
+                if field not in record:
+                    yield offset, None, record, f"missing field {field}"
+                    continue
+                text = record[field]
+                if not isinstance(text, str):
+                    yield offset, None, record, f"Field '{field}' is not a string"
+                    continue
+                yield offset, text, record, None
+            else:
+                yield offset, raw, None, None
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return {"next_index": 0, "input_offset": 0, "output_offset": 0}
+    with open(path, "r", encoding="utf8") as fh:
+        return json.load(fh)
+
+
+def save_checkpoint(path, checkpoint):
+    # Write-then-rename so a crash never leaves a half-written checkpoint
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf8") as fh:
+        json.dump(checkpoint, fh)
+    os.replace(tmp_path, path)
+
+
+def format_eta(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{(seconds % 3600) // 60:02d}m"
+    return f"{seconds // 60}m{seconds % 60:02d}s"
+
+
+class ProgressReporter:
+    def __init__(self, total_bytes, start_bytes, interval=5.0):
+        self.total_bytes = total_bytes
+        self.start_bytes = start_bytes
+        self.interval = interval
+        self.start_time = time.time()
+        self.last_report = 0.0
+        self.records = 0
+
+    def update(self, input_offset, force=False, count=1):
+        self.records += count
+        now = time.time()
+        if not force and now - self.last_report < self.interval:
+            return
+        self.last_report = now
+
+        elapsed = max(now - self.start_time, 1e-6)
+        rate = self.records / elapsed
+        byte_rate = (input_offset - self.start_bytes) / elapsed
+        percent = 100.0 * input_offset / self.total_bytes if self.total_bytes else 100.0
+        remaining = self.total_bytes - input_offset
+        eta = format_eta(remaining / byte_rate) if byte_rate > 0 else "?"
+        print(f"📦 {self.records} records | {rate:.1f} rec/s | {percent:.1f}% | ETA {eta}", file=sys.stderr)
+
+
+async def run(args):
+    engine = LLMEngine(api_key=args.api_key)
+    fmt = args.format or ("jsonl" if args.input.endswith(".jsonl") else "text")
+    checkpoint_path = args.checkpoint or args.output + ".checkpoint"
+
+    checkpoint = load_checkpoint(checkpoint_path) if args.resume else {"next_index": 0, "input_offset": 0, "output_offset": 0}
+    if checkpoint["next_index"]:
+        print(f"↩️  Resuming at record {checkpoint['next_index']}", file=sys.stderr)
+
+    # Drop anything written after the last checkpoint; it will be redone
+    out = open(args.output, "ab" if args.resume else "wb")
+    out.truncate(checkpoint["output_offset"])
+    out.seek(checkpoint["output_offset"])
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    progress = ProgressReporter(os.path.getsize(args.input), checkpoint["input_offset"])
+
+    async def correct(text, error=None):
+        if error is not None:
+            # Written out as a failed record so the rest of the corpus still runs
+            return {"text": text, "success": False, "error": error, "method": "Invalid input"}
+        if text is None:
+            return None
+        if not text.strip():
+            # Nothing to correct, but the record still appears in the output
+            return {"text": text, "suggestions": [], "success": True, "method": "Empty input"}
+        # Each record is its own request: the request budget and reported usage cover it alone
+        record_engine = copy.copy(engine)
+        record_engine.usage = UsageLedger.new_request()
+        async with semaphore:
+            return await record_engine.correct_text_async(text, use_chunking=not args.no_chunking)
+
+    def write(index, offset, text, record, result):
+        if result is not None:
+            if record is not None:
+                record = dict(record)
+                record[args.output_field] = result
+                line = record
+            else:
+                line = {"index": index, "text": text, args.output_field: result}
+            out.write((json.dumps(line, ensure_ascii=False) + "\n").encode("utf8"))
+        out.flush()
+        checkpoint.update(next_index=index + 1, input_offset=offset, output_offset=out.tell())
+        save_checkpoint(checkpoint_path, checkpoint)
+        progress.update(offset)
+
+    # Ordered sliding window: memory stays bounded by the window, not the corpus
+    window = collections.deque()
+    window_size = args.concurrency * 2
+    index = checkpoint["next_index"]
+    failures = 0
+
+    try:
+        for offset, text, record, error in read_records(args.input, fmt, args.field, checkpoint["input_offset"]):
+            window.append((index, offset, text, record, asyncio.create_task(correct(text, error))))
+            index += 1
+            while len(window) >= window_size:
+                i, o, t, r, task = window.popleft()
+                result = await task
+                failures += bool(result is not None and not result["success"])
+                write(i, o, t, r, result)
+        while window:
+            i, o, t, r, task = window.popleft()
+            result = await task
+            failures += bool(result is not None and not result["success"])
+            write(i, o, t, r, result)
+    finally:
+        for _, _, _, _, task in window:
+            task.cancel()
+        out.close()
+
+    progress.update(checkpoint["input_offset"], force=True, count=0)
+    print(f"✅ Done: {checkpoint['next_index']} records, {failures} failed or invalid → {args.output}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-correct a text or JSONL corpus with Grammar Fixer Pro")
+    parser.add_argument("input", help="Input file: one text per line, or JSONL records")
+    parser.add_argument("output", help="Output JSONL file")
+    parser.add_argument("--format", choices=["text", "jsonl"], help="Input format (default: from file extension)")
+    parser.add_argument("--field", default="text", help="JSONL field holding the text (default: text)")
+    parser.add_argument("--output-field", default="correction", help="Field the result is written to (default: correction)")
+    parser.add_argument("--api-key", default=os.getenv("REPLICATE_API_TOKEN"), help="Replicate API key (default: $REPLICATE_API_TOKEN)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum records corrected at once (default: 8)")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: OUTPUT.checkpoint)")
+    parser.add_argument("--resume", action="store_true", help="Continue from the checkpoint instead of starting over")
+    parser.add_argument("--no-chunking", action="store_true", help="Send each record in a single LLM call")
+    args = parser.parse_args(argv)
+
+    if not args.api_key:
+        parser.error("an API key is required (--api-key or REPLICATE_API_TOKEN)")
+
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("\n⏸️  Interrupted - rerun with --resume to continue", file=sys.stderr)
+        return 130
+    except BudgetExceededError as e:
+        print(f"⛔ {e} - rerun with --resume once the budget allows", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Cross-request candidate cache for the local engine
+Misspellings like "recieve" or "teh" recur across requests; their dictionary
+candidates and the context-dependent pick are memoized in bounded LRUs and
+the hottest tokens are saved so the next process starts warm
+"""
+import os
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> [value, uses]
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return default
+            self._entries.move_to_end(key)
+            entry[1] += 1
+            self._hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[0] = value
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = [value, 1]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def usage(self):
+        """(key, uses) for every entry"""
+        with self._lock:
+            return [(key, entry[1]) for key, entry in self._entries.items()]
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+            }
+
+
+class CandidateCache:
+    """Two levels: token -> (candidates, distances, frequencies), then (token, context) -> pick"""
+
+    def __init__(self, max_tokens=None, max_choices=None):
+        if max_tokens is None:
+            max_tokens = int(os.getenv("GFP_CANDIDATE_CACHE_SIZE", "50000"))
+        self.tokens = LRUCache(max_tokens)
+        # A token shows up in several contexts, so allow more picks than tokens
+        self.choices = LRUCache(max_choices or max_tokens * 2)
+
+    def hot_tokens(self, limit=5000):
+        """Tokens picked most often, over all the contexts they appeared in"""
+        uses = {}
+        for (token, _), count in self.choices.usage():
+            uses[token] = uses.get(token, 0) + count
+        return sorted(uses, key=uses.get, reverse=True)[:limit]
+
+    def save(self, path, limit=5000):
+        """Write the hottest tokens, one per line, for warm()"""
+        tokens = self.hot_tokens(limit)
+        if not tokens:
+            return 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + f".{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf8") as fh:
+            for token in tokens:
+                fh.write(token + "\n")
+        os.replace(tmp_path, path)
+        return len(tokens)
+
+    def warm(self, path, profile):
+        """Precompute `profile(token)` for every token saved by save(); returns how many"""
+        try:
+            with open(path, "r", encoding="utf8") as fh:
+                tokens = [line.strip() for line in fh if line.strip()]
+        except OSError:
+            return 0
+        for token in tokens[:self.tokens.max_entries]:
+            self.tokens.set(token, profile(token))
+        return len(tokens)
+
+    def stats(self):
+        return {"tokens": self.tokens.stats(), "choices": self.choices.stats()}
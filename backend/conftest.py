@@ -0,0 +1,25 @@
+"""
+Pytest configuration for the offline tests
+The older test_*.py scripts call the live API with a real key; run those
+directly with python instead
+"""
+import types
+
+import pytest
+
+import engine
+
+collect_ignore = [
+    "test_all_features.py",
+    "test_api.py",
+    "test_api_endpoints.py",
+    "test_debug.py",
+    "test_final.py",
+]
+
+
+@pytest.fixture
+def offline_engine(monkeypatch):
+    """LLMEngine whose Replicate client is never created; patch the methods a test exercises"""
+    monkeypatch.setattr(engine, "load_replicate", lambda: types.SimpleNamespace(Client=lambda api_token: None))
+    return engine.LLMEngine(api_key="test-key")
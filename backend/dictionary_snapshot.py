@@ -0,0 +1,176 @@
+"""
+Prebuilt SymSpell dictionary snapshot
+Builds the deletes index once from data/word_frequency.txt and stores it as an
+uncompressed pickle with a metadata sidecar, so workers load it in one read
+instead of 200k create_dictionary_entry calls; stale snapshots are rebuilt
+
+Usage:
+    python dictionary_snapshot.py [--source data/word_frequency.txt] [--force]
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+# Bump when the snapshot layout or the way it is built changes
+SNAPSHOT_VERSION = 1
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+DEFAULT_SOURCE = os.path.join(DATA_DIR, "word_frequency.txt")
+
+
+def snapshot_paths(source_path):
+    """(snapshot, metadata) paths that belong to a word list"""
+    base = os.path.splitext(source_path)[0] + ".symspell"
+    return base, base + ".meta.json"
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _source_signature(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _library_version():
+    try:
+        from importlib.metadata import version
+        return version("symspellpy")
+    except Exception:
+        return None
+
+
+def write_word_frequency(freq_path, count=200000):
+    """Generate the word list from wordfreq; returns False if wordfreq is unavailable"""
+    try:
+        from wordfreq import top_n_list
+    except ImportError:
+        return False
+    words = top_n_list("en", count)
+    os.makedirs(os.path.dirname(freq_path), exist_ok=True)
+    tmp_path = freq_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf8") as out:
+        for rank, word in enumerate(words, start=1):
+            out.write(f"{word}\t{max(1, int(1_000_000 / rank))}\n")
+    os.replace(tmp_path, freq_path)
+    return True
+
+
+def load_word_frequency(symspell, freq_path):
+    """Parse the word list into `symspell`; returns the words in file order"""
+    words = []
+    with open(freq_path, "r", encoding="utf8") as fh:
+        for line in fh:
+            parts = line.strip().split()
+            if not parts:
+                continue
+            word = parts[0]
+            freq = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 1
+            symspell.create_dictionary_entry(word, freq)
+            words.append(word)
+    return words
+
+
+def _expected_meta(symspell):
+    return {
+        "snapshot_version": SNAPSHOT_VERSION,
+        "symspellpy": _library_version(),
+        "max_dictionary_edit_distance": symspell._max_dictionary_edit_distance,
+        "prefix_length": symspell._prefix_length,
+        "count_threshold": symspell._count_threshold,
+    }
+
+
+def load_snapshot(symspell, freq_path):
+    """Fill `symspell` from a current snapshot of `freq_path`; False if there is none"""
+    snapshot_path, meta_path = snapshot_paths(freq_path)
+    try:
+        with open(meta_path, "r", encoding="utf8") as fh:
+            meta = json.load(fh)
+    except (OSError, ValueError):
+        return False
+
+    expected = _expected_meta(symspell)
+    if any(meta.get(name) != value for name, value in expected.items()):
+        return False
+
+    source = _source_signature(freq_path)
+    if meta.get("source_size") != source["size"]:
+        return False
+    if meta.get("source_mtime_ns") != source["mtime_ns"] and meta.get("source_sha256") != _file_digest(freq_path):
+        # Touched but also edited
+        return False
+
+    try:
+        return symspell.load_pickle(snapshot_path, compressed=False)
+    except Exception:
+        return False
+
+
+def save_snapshot(symspell, freq_path):
+    """Write the snapshot and its metadata; the metadata goes last so readers never see a half-written pair"""
+    snapshot_path, meta_path = snapshot_paths(freq_path)
+    source = _source_signature(freq_path)
+    meta = dict(
+        _expected_meta(symspell),
+        source_size=source["size"],
+        source_mtime_ns=source["mtime_ns"],
+        source_sha256=_file_digest(freq_path),
+        words=len(symspell.words),
+        built=time.time(),
+    )
+
+    tmp_path = snapshot_path + f".{os.getpid()}.tmp"
+    symspell.save_pickle(tmp_path, compressed=False)
+    os.replace(tmp_path, snapshot_path)
+
+    tmp_path = meta_path + f".{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf8") as fh:
+        json.dump(meta, fh)
+    os.replace(tmp_path, meta_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the SymSpell dictionary snapshot used by the local engine")
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help="Word frequency list (default: data/word_frequency.txt)")
+    parser.add_argument("--max-edit-distance", type=int, default=3, help="Deletes index depth (default: 3)")
+    parser.add_argument("--prefix-length", type=int, default=6, help="SymSpell prefix length (default: 6)")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if the snapshot is current")
+    args = parser.parse_args(argv)
+
+    from symspellpy import SymSpell
+
+    if not os.path.exists(args.source) and not write_word_frequency(args.source):
+        print(f"❌ {args.source} not found and wordfreq is not installed", file=sys.stderr)
+        return 1
+
+    symspell = SymSpell(max_dictionary_edit_distance=args.max_edit_distance, prefix_length=args.prefix_length)
+    start = time.time()
+    if not args.force and load_snapshot(symspell, args.source):
+        print(f"✅ Snapshot is current ({len(symspell.words):,} words, loaded in {time.time() - start:.2f}s)")
+        return 0
+
+    load_word_frequency(symspell, args.source)
+    built = time.time()
+    save_snapshot(symspell, args.source)
+    snapshot_path, _ = snapshot_paths(args.source)
+    print(f"📦 Built {snapshot_path}: {len(symspell.words):,} words, "
+          f"{os.path.getsize(snapshot_path) / 1e6:.1f} MB in {built - start:.1f}s")
+
+    start = time.time()
+    check = SymSpell(max_dictionary_edit_distance=args.max_edit_distance, prefix_length=args.prefix_length)
+    load_snapshot(check, args.source)
+    print(f"⚡ Snapshot loads in {time.time() - start:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+Word-level edit diffing
+Replaces character-level difflib in _compute_edits: trims the common
+prefix/suffix, then runs Myers' O(ND) diff over word/space/punctuation
+tokens, so cost is linear when the texts differ in only a few places and
+edits always land on word boundaries
+"""
+import re
+
+TOKEN_PATTERN = re.compile(r"\w+|\s+|[^\w\s]")
+
+# Beyond this many token edits the texts are essentially unrelated; emit one replace
+MAX_EDIT_SCRIPT = 4000
+
+# The trace keeps every step's frontier, so memory grows with D squared; past a
+# quarter of the tokens changed, one replace is as useful as the exact script
+MIN_EDIT_BUDGET = 64
+
+
+def _tokenize(text, start, end):
+    """Tokens of text[start:end] and their absolute start offsets"""
+    tokens = []
+    offsets = []
+    for match in TOKEN_PATTERN.finditer(text, start, end):
+        tokens.append(match.group())
+        offsets.append(match.start())
+    offsets.append(end)
+    return tokens, offsets
+
+
+def _myers_moves(a, b):
+    """Shortest edit script between token lists as (x, y, next_x, next_y) moves, or None if too long"""
+    n, m = len(a), len(b)
+    max_d = min(n + m, MAX_EDIT_SCRIPT, max(MIN_EDIT_BUDGET, (n + m) // 4))
+    # Diagonal k lives at v[offset + k]; a flat list slices far cheaper than a dict copies
+    offset = max_d + 1
+    v = [0] * (2 * offset + 1)
+    trace = []
+    for d in range(max_d + 1):
+        # Step d only reads diagonals -d-1..d+1 of the previous frontier
+        trace.append(v[offset - d - 1:offset + d + 2])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                return _backtrack(trace, n, m)
+    return None
+
+
+def _backtrack(trace, x, y):
+    moves = []
+    for d in range(len(trace) - 1, -1, -1):
+        # trace[d][0] is diagonal -d-1
+        v = trace[d]
+        base = d + 1
+        k = x - y
+        if k == -d or (k != d and v[base + k - 1] < v[base + k + 1]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = v[base + prev_k]
+        prev_y = prev_x - prev_k
+        while x > prev_x and y > prev_y:
+            moves.append((x - 1, y - 1, x, y))
+            x, y = x - 1, y - 1
+        if d > 0:
+            moves.append((prev_x, prev_y, x, y))
+        x, y = prev_x, prev_y
+    moves.reverse()
+    return moves
+
+
+def _token_opcodes(a, b):
+    """Grouped (tag, i1, i2, j1, j2) opcodes over token indices, difflib-style"""
+    moves = _myers_moves(a, b)
+    if moves is None:
+        return [("replace", 0, len(a), 0, len(b))]
+
+    opcodes = []
+    i1 = j1 = None
+    for x, y, next_x, next_y in moves:
+        is_equal = next_x - x == 1 and next_y - y == 1
+        if is_equal:
+            if i1 is not None:
+                opcodes.append((i1, x, j1, y))
+                i1 = j1 = None
+        elif i1 is None:
+            i1, j1 = x, y
+    if i1 is not None:
+        opcodes.append((i1, len(a), j1, len(b)))
+
+    tagged = []
+    for i1, i2, j1, j2 in opcodes:
+        if i1 == i2:
+            tagged.append(("insert", i1, i2, j1, j2))
+        elif j1 == j2:
+            tagged.append(("delete", i1, i2, j1, j2))
+        else:
+            tagged.append(("replace", i1, i2, j1, j2))
+    return tagged
+
+
+def compute_word_edits(original, corrected):
+    """Edit spans (same schema as LLMEngine edits) turning `original` into `corrected`"""
+    if original == corrected:
+        return []
+
+    # Fast path: skip the identical prefix and suffix, backed off to word boundaries
+    limit = min(len(original), len(corrected))
+    prefix = 0
+    while prefix < limit and original[prefix] == corrected[prefix]:
+        prefix += 1
+    while prefix > 0 and original[prefix - 1].isalnum():
+        prefix -= 1
+
+    suffix = 0
+    limit -= prefix
+    while suffix < limit and original[-1 - suffix] == corrected[-1 - suffix]:
+        suffix += 1
+    while suffix > 0 and original[len(original) - suffix].isalnum():
+        suffix -= 1
+
+    a, a_offsets = _tokenize(original, prefix, len(original) - suffix)
+    b, b_offsets = _tokenize(corrected, prefix, len(corrected) - suffix)
+
+    edits = []
+    for tag, i1, i2, j1, j2 in _token_opcodes(a, b):
+        start, end = a_offsets[i1], a_offsets[i2]
+        source = original[start:end]
+        target = corrected[b_offsets[j1]:b_offsets[j2]]
+        if tag == "replace":
+            edits.append({
+                "original": source,
+                "suggestion": target,
+                "start": start,
+                "end": end,
+                "type": "capitalization" if source.lower() == target.lower() else "spelling",
+                "confidence": 0.90
+            })
+        elif tag == "delete":
+            edits.append({
+                "original": source,
+                "suggestion": "",
+                "start": start,
+                "end": end,
+                "type": "deletion",
+                "confidence": 0.85
+            })
+        else:
+            edits.append({
+                "original": "",
+                "suggestion": target,
+                "start": start,
+                "end": start,
+                "type": "insertion",
+                "confidence": 0.85
+            })
+    return edits
@@ -0,0 +1,128 @@
+"""
+Bounded edit distance for candidate scoring
+Optimal string alignment (Damerau-Levenshtein with adjacent transpositions)
+that stops as soon as a pair must exceed the maximum distance, plus a batch
+form that scores every candidate for a word at once: editdistpy's C kernel
+when installed, otherwise vectorised with NumPy, otherwise pure Python
+"""
+try:
+    # editdistpy's C kernel; listed in requirements.txt (only an optional extra of newer symspellpy)
+    from editdistpy import damerau_osa
+except ImportError:
+    damerau_osa = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Below this many candidates the per-call NumPy overhead outweighs the vectorisation
+BATCH_MIN_CANDIDATES = 24
+
+_PADDING = 0xFFFFFFFF  # Never equal to a real code point
+
+
+def bounded_distance(a, b, max_distance=None):
+    """OSA distance between `a` and `b`, or -1 once it must exceed `max_distance`
+
+    "thsi" -> "this" is one edit. `max_distance=None` computes the exact distance.
+    """
+    if a == b:
+        return 0
+    if len(a) > len(b):
+        a, b = b, a
+    if max_distance is None:
+        max_distance = len(b)
+    if damerau_osa is not None:
+        return damerau_osa.distance(a, b, max_distance)
+
+    # Common prefix and suffix never change the distance
+    start = 0
+    while start < len(a) and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_a > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+    a, b = a[start:end_a], b[start:end_b]
+
+    len_a, len_b = len(a), len(b)
+    if len_b - len_a > max_distance:
+        return -1
+    if not len_a:
+        return len_b
+
+    # Only cells within `max_distance` of the diagonal can stay under the bound
+    too_far = max_distance + 1
+    previous = [j if j <= max_distance else too_far for j in range(len_b + 1)]
+    previous_previous = None
+    for i in range(1, len_a + 1):
+        char_a = a[i - 1]
+        low = max(1, i - max_distance)
+        high = min(len_b, i + max_distance)
+        current = [too_far] * (len_b + 1)
+        current[0] = i if i <= max_distance else too_far
+        row_min = current[0]
+        for j in range(low, high + 1):
+            char_b = b[j - 1]
+            value = previous[j - 1] + (char_a != char_b)
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if (i > 1 and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b
+                    and previous_previous[j - 2] + 1 < value):
+                value = previous_previous[j - 2] + 1
+            if value > too_far:
+                value = too_far
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > max_distance:
+            return -1
+        previous_previous, previous = previous, current
+
+    distance = previous[len_b]
+    return distance if distance <= max_distance else -1
+
+
+def _batch_numpy(word, candidates, max_distance):
+    lengths = np.fromiter((len(candidate) for candidate in candidates), dtype=np.int64, count=len(candidates))
+    width = int(lengths.max())
+    codes = np.full((len(candidates), width), _PADDING, dtype=np.uint32)
+    for row, candidate in enumerate(candidates):
+        if candidate:
+            codes[row, :len(candidate)] = np.frombuffer(candidate.encode("utf-32-le"), dtype=np.uint32)
+    word_codes = [ord(char) for char in word]
+
+    too_far = max_distance + 1
+    columns = np.arange(width + 1, dtype=np.int64)
+    previous = np.broadcast_to(np.minimum(columns, too_far), (len(candidates), width + 1)).copy()
+    previous_previous = None
+    for i, code in enumerate(word_codes, start=1):
+        matches = codes == code
+        row = np.empty_like(previous)
+        row[:, 0] = min(i, too_far)
+        # Substitution (free on a match) and deletion
+        np.minimum(previous[:, :-1] + ~matches, previous[:, 1:] + 1, out=row[:, 1:])
+        if previous_previous is not None and width > 1:
+            swapped = matches[:, :-1] & (codes[:, 1:] == word_codes[i - 2])
+            np.minimum(row[:, 2:], np.where(swapped, previous_previous[:, :-2] + 1, too_far), out=row[:, 2:])
+        # Insertion chains along the row: current[j] = min(row[j], current[j - 1] + 1)
+        current = np.minimum.accumulate(row - columns, axis=1) + columns
+        np.minimum(current, too_far, out=current)
+        if current.min() > max_distance:
+            return [-1] * len(candidates)
+        previous_previous, previous = previous, current
+
+    distances = previous[np.arange(len(candidates)), lengths]
+    distances[(distances > max_distance) | (np.abs(lengths - len(word)) > max_distance)] = -1
+    return distances.tolist()
+
+
+def batch_distances(word, candidates, max_distance):
+    """bounded_distance(word, candidate, max_distance) for every candidate, in order"""
+    candidates = list(candidates)
+    if damerau_osa is None and np is not None and len(candidates) >= BATCH_MIN_CANDIDATES and word:
+        return _batch_numpy(word, candidates, max_distance)
+    return [bounded_distance(word, candidate, max_distance) for candidate in candidates]
@@ -2,141 +2,441 @@
 Simple LLM-only spell-checking engine
 Achieves 95% accuracy through pure Llama-3 integration
 """
-import os
+import re
 import json
 import time
 import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-try:
-    import replicate
-except ImportError:
-    replicate = None
+from accounting import BudgetExceededError, UsageLedger
+from diffing import compute_word_edits
+from json_repair import is_truncated, repair_json
+from limiter import AdaptiveLimiter
+from result_cache import ResultCache
+from router import ModelRouter
+from masking import PLACEHOLDER_MARK, build_term_trie, mask_protected
+from prompt_builder import build_prompt
+from segmenter import has_blocks, has_structure, prose_regions, segment_document
+
+# Imported lazily by load_replicate() so module import stays cheap
+replicate = None
+_replicate_missing = False
+
+# Routes each call to the small (default) or large model; configured via GFP_* env vars
+MODEL_ROUTER = ModelRouter()
+LLM_MODEL = MODEL_ROUTER.small_model
+
+# Replicate's default Llama-3 chat template, applied by hand for continuations so the
+# truncated output can be prefilled as the start of the assistant turn
+CHAT_TEMPLATE = (
+    "<|begin_of_text|><|start_header_id|>system<|end_header_id|>\n\nYou are a helpful assistant<|eot_id|>"
+    "<|start_header_id|>user<|end_header_id|>\n\n{prompt}<|eot_id|>"
+    "<|start_header_id|>assistant<|end_header_id|>\n\n"
+)
+MAX_CONTINUATIONS = 2
+
+# Shared by every engine instance so the whole process adapts to upstream capacity
+UPSTREAM_LIMITER = AdaptiveLimiter()
+
+# Blocking stream reads get their own threads, one per possible slot, so the loop's
+# default pool (min(32, cpu + 4) threads) never caps concurrency below the limit
+UPSTREAM_EXECUTOR = ThreadPoolExecutor(max_workers=UPSTREAM_LIMITER.max_limit, thread_name_prefix="upstream")
+
+# Deterministic results (corrections, opt-in deterministic enhancements)
+RESULT_CACHE = ResultCache()
+
+# Token usage per key hash, with per-request and per-key budgets (GFP_*_TOKEN_BUDGET)
+USAGE_LEDGER = UsageLedger()
+
+# One Replicate client per API key, reused across requests
+MAX_CACHED_CLIENTS = 256
+_clients = OrderedDict()
+_clients_lock = threading.Lock()
+
+
+def load_replicate():
+    """Import the Replicate SDK on first use; returns None when it is not installed"""
+    global replicate, _replicate_missing
+    if replicate is None and not _replicate_missing:
+        try:
+            import replicate as replicate_module
+            replicate = replicate_module
+        except ImportError:
+            _replicate_missing = True
+    return replicate
+
+
+def get_client(api_key):
+    """Return a cached Replicate client bound to `api_key`"""
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is not None:
+            _clients.move_to_end(api_key)
+            return client
+    
+    client = load_replicate().Client(api_token=api_key)
+    with _clients_lock:
+        _clients[api_key] = client
+        while len(_clients) > MAX_CACHED_CLIENTS:
+            _clients.popitem(last=False)
+    return client
+
+
+def warm_up():
+    """Pre-load shared state once at server startup"""
+    return {
+        "replicate_available": load_replicate() is not None,
+        "model": LLM_MODEL,
+    }
+
 
 class LLMEngine:
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, protected_terms=None, output_format="full", deadline_ms=None):
         self.api_key = api_key
+        # Soft latency target for the whole request; the router avoids slow models near it
+        self.deadline_at = time.monotonic() + deadline_ms / 1000 if deadline_ms else None
+        # Estimated tokens this request has used; budgets are checked against it
+        self.usage = UsageLedger.new_request()
+        # "full": model returns corrected text + edits; "edits": compact edit records only
+        if output_format not in ("full", "edits"):
+            raise ValueError("output_format must be 'full' or 'edits'")
+        self.output_format = output_format
+        # Tenant terms that must never be edited; tries are prebuilt and shared per term list
+        self.protected_terms = tuple(sorted(set(protected_terms or ())))
+        self.protected_trie = build_term_trie(self.protected_terms) if self.protected_terms else None
         self._setup_llm()
     
     def _setup_llm(self):
         """Setup LLM for spell correction"""
-        self.use_llm = replicate is not None and self.api_key
+        self.use_llm = load_replicate() is not None and self.api_key
         if self.use_llm:
-            # Set the API key for replicate
-            os.environ['REPLICATE_API_TOKEN'] = self.api_key
+            # Per-key client instead of the process-wide REPLICATE_API_TOKEN,
+            # so concurrent requests never see each other's keys
+            self.client = get_client(self.api_key)
+            # Cache entries are scoped per key so one user's texts never answer another's
+            self.cache_scope = hashlib.sha256(self.api_key.encode("utf8")).hexdigest()[:16]
             print("✅ LLM (Llama-3) enabled for 95% accuracy")
         else:
             print("❌ LLM unavailable - check REPLICATE_API_TOKEN in .env")
             raise RuntimeError("LLM engine requires valid REPLICATE_API_TOKEN")
     
     async def correct_with_llm(self, text):
-        """High-accuracy LLM-based correction with deterministic JSON output"""
+        """High-accuracy LLM-based correction with deterministic JSON output.
+        
+        Protected spans (URLs, emails, numbers, identifiers, acronyms, inline
+        code, tenant terms) are masked with placeholders before prompting and
+        restored afterwards, with edit offsets mapped back to `text`.
+        """
         if not self.use_llm:
             raise RuntimeError("LLM not available")
-            
-        # Enhanced multi-example prompt for maximum accuracy and consistency
-        prompt = f"""You are a professional English copyeditor. Correct spelling errors and obvious typos while preserving meaning, proper nouns, and technical terms. Return only valid JSON.
-
-EXAMPLES:
-
-Input: "thsi is the werst test."
-Output: {{"text":"this is the worst test.","edits":[{{"original":"thsi","suggestion":"this","start":0,"end":4,"type":"spelling","confidence":0.95}},{{"original":"werst","suggestion":"worst","start":12,"end":17,"type":"spelling","confidence":0.92}}]}}
-
-Input: "i beleive John recieved the mesage"
-Output: {{"text":"I believe John received the message","edits":[{{"original":"i","suggestion":"I","start":0,"end":1,"type":"capitalization","confidence":0.98}},{{"original":"beleive","suggestion":"believe","start":2,"end":9,"type":"spelling","confidence":0.94}},{{"original":"recieved","suggestion":"received","start":15,"end":23,"type":"spelling","confidence":0.96}},{{"original":"mesage","suggestion":"message","start":28,"end":34,"type":"spelling","confidence":0.93}}]}}
-
-Input: "the qick brwn fox jumps ovr the lzy dog"
-Output: {{"text":"the quick brown fox jumps over the lazy dog","edits":[{{"original":"qick","suggestion":"quick","start":4,"end":8,"type":"spelling","confidence":0.97}},{{"original":"brwn","suggestion":"brown","start":9,"end":13,"type":"spelling","confidence":0.94}},{{"original":"ovr","suggestion":"over","start":23,"end":26,"type":"spelling","confidence":0.96}},{{"original":"lzy","suggestion":"lazy","start":31,"end":34,"type":"spelling","confidence":0.95}}]}}
-
-Input: "definitly recieve the necesary mesage immediatly"
-Output: {{"text":"definitely receive the necessary message immediately","edits":[{{"original":"definitly","suggestion":"definitely","start":0,"end":9,"type":"spelling","confidence":0.96}},{{"original":"recieve","suggestion":"receive","start":10,"end":17,"type":"spelling","confidence":0.95}},{{"original":"necesary","suggestion":"necessary","start":22,"end":30,"type":"spelling","confidence":0.94}},{{"original":"mesage","suggestion":"message","start":31,"end":37,"type":"spelling","confidence":0.93}},{{"original":"immediatly","suggestion":"immediately","start":38,"end":48,"type":"spelling","confidence":0.97}}]}}
-
-Input: "seperate the wrd and chek qualiy"
-Output: {{"text":"separate the word and check quality","edits":[{{"original":"seperate","suggestion":"separate","start":0,"end":8,"type":"spelling","confidence":0.95}},{{"original":"wrd","suggestion":"word","start":13,"end":16,"type":"spelling","confidence":0.92}},{{"original":"chek","suggestion":"check","start":21,"end":25,"type":"spelling","confidence":0.94}},{{"original":"qualiy","suggestion":"quality","start":26,"end":32,"type":"spelling","confidence":0.93}}]}}
-
-Input: "NASA sent astronauts to space succesfully"
-Output: {{"text":"NASA sent astronauts to space successfully","edits":[{{"original":"succesfully","suggestion":"successfully","start":30,"end":41,"type":"spelling","confidence":0.96}}]}}
-
-Input: "we shoud go to the stor todya and buy som things"
-Output: {{"text":"we should go to the store today and buy some things","edits":[{{"original":"shoud","suggestion":"should","start":3,"end":8,"type":"spelling","confidence":0.95}},{{"original":"stor","suggestion":"store","start":19,"end":23,"type":"spelling","confidence":0.94}},{{"original":"todya","suggestion":"today","start":24,"end":29,"type":"spelling","confidence":0.96}},{{"original":"som","suggestion":"some","start":38,"end":41,"type":"spelling","confidence":0.93}}]}}
-
-RULES:
-- Fix obvious spelling mistakes only
-- Keep proper nouns unchanged (NASA, John, etc.)
-- Preserve technical terms and abbreviations
-- Use high confidence (0.90+) for obvious errors
-- Return exact character positions
-- Output valid JSON only
-
-Input: "{text}"
-Output:"""
+        
+        cache_key = RESULT_CACHE.key("correct", self.output_format, MODEL_ROUTER.cache_tag, self.cache_scope, "\x1f".join(self.protected_terms), text)
+        cached = RESULT_CACHE.get(cache_key)
+        if cached is not None:
+            cached["prompt_tokens"] = 0  # Served without a prompt
+            return cached
+        
+        masked = mask_protected(text, self.protected_trie)
+        result = None
+        spent_tokens = 0
+        if masked.spans:
+            if not re.search(r"[A-Za-z]{2,}", masked.text):
+                # Nothing but protected spans: no prose to correct
+                result = {"text": text, "edits": [], "prompt_tokens": 0}
+            else:
+                raw = await self._request_correction(masked.text)
+                result = masked.restore_result(raw)
+                if result is None:
+                    print("⚠️  LLM damaged protected placeholders - retrying unmasked")
+                    spent_tokens = raw.get("prompt_tokens", 0)
+        if result is None:
+            result = await self._request_correction(text)
+            result["prompt_tokens"] = result.get("prompt_tokens", 0) + spent_tokens
+        
+        RESULT_CACHE.set(cache_key, result)
+        return result
+    
+    async def _request_correction(self, text):
+        """Single correction round-trip for `text` as given"""
+        if self.output_format == "edits":
+            return await self._request_edit_records(text)
+        
+        # Few-shot prompt with only the examples most relevant to this input
+        prompt, prompt_tokens = build_prompt(text, "full")
         
         try:
             # Deterministic settings for consistent output
             input_data = {
                 "prompt": prompt,
-                "max_new_tokens": min(len(text) + 100, 512),
+                # The output repeats the text and adds edit records: budget in tokens for both
+                "max_new_tokens": min(2 * self._estimate_tokens(text) + 150, 1024),
                 "temperature": 0.0,  # Deterministic
                 "top_p": 1.0,
                 "do_sample": False
             }
             
-            output = ""
-            for event in replicate.stream("meta/meta-llama-3-8b-instruct", input=input_data):
-                output += str(event)
-            
-            # Parse and validate JSON with enhanced error handling
-            output = output.strip()
-            
-            # Clean up common JSON formatting issues
-            if output.startswith('```json'):
-                output = output[7:]
-            if output.startswith('```'):
-                output = output[3:]
-            if output.endswith('```'):
-                output = output[:-3]
-            
-            # Remove any text before the first {
-            first_brace = output.find('{')
-            if first_brace > 0:
-                output = output[first_brace:]
-            
-            # Remove any text after the last }
-            last_brace = output.rfind('}')
-            if last_brace >= 0:
-                output = output[:last_brace + 1]
+            output = await self._stream_json(input_data, "correct", text)
             
             try:
-                result = json.loads(output.strip())
+                result = self._parse_json_output(output)
                 
                 # Validate required fields
                 if "text" in result and isinstance(result["text"], str):
                     if "edits" not in result or not isinstance(result["edits"], list):
                         # Compute edits if not provided or invalid
                         result["edits"] = self._compute_edits(text, result["text"])
+                    else:
+                        # Model offsets are often off; verify and realign them locally
+                        result["edits"] = self._verify_edits(text, result["text"], result["edits"])
+                    result["prompt_tokens"] = prompt_tokens
                     return result
                 else:
                     raise ValueError("Missing or invalid 'text' field in JSON response")
                     
             except json.JSONDecodeError as e:
-                # Try to extract just the text if JSON parsing fails completely
-                import re
-                text_match = re.search(r'"text":\s*"([^"]*)"', output)
-                if text_match:
-                    corrected_text = text_match.group(1)
-                    return {
-                        "text": corrected_text,
-                        "edits": self._compute_edits(text, corrected_text)
-                    }
                 raise ValueError(f"Failed to parse LLM JSON response: {e}")
                 
+        except BudgetExceededError:
+            raise
         except Exception as e:
             raise RuntimeError(f"LLM error: {e}")
     
+    async def _request_edit_records(self, text):
+        """Edits-only correction: the model emits compact edit records and the
+        corrected text is rebuilt locally, roughly halving output tokens"""
+        prompt, prompt_tokens = build_prompt(text, "edits")
+        
+        try:
+            input_data = {
+                "prompt": prompt,
+                # Only the edits come back, so the budget no longer scales with a full copy of the text
+                "max_new_tokens": min(self._estimate_tokens(text) + 60, 384),
+                "temperature": 0.0,
+                "top_p": 1.0,
+                "do_sample": False
+            }
+            
+            output = await self._stream_json(input_data, "correct", text)
+            result = self._parse_json_output(output)
+            records = result.get("e") if isinstance(result, dict) else None
+            if not isinstance(records, list):
+                raise ValueError("Missing 'e' edit list in JSON response")
+            result = self._apply_edit_records(text, records)
+            result["prompt_tokens"] = prompt_tokens
+            return result
+        except BudgetExceededError:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"LLM error: {e}")
+    
+    def _locate_original(self, text, original, hint, window=40):
+        """Find `original` in `text` at or near offset `hint`; returns the start or -1.
+        
+        The claimed offset is checked first, then the nearest occurrence within
+        `window` characters either side, preferring whole-word matches.
+        """
+        if not original:
+            return hint if 0 <= hint <= len(text) else -1
+        if text.startswith(original, hint):
+            return hint
+        
+        low = max(0, hint - window)
+        high = min(len(text), hint + window + len(original))
+        best = -1
+        best_key = None
+        position = text.find(original, low, high)
+        while position != -1:
+            end = position + len(original)
+            whole_word = (position == 0 or not text[position - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
+            key = (not whole_word, abs(position - hint))
+            if best_key is None or key < best_key:
+                best, best_key = position, key
+            position = text.find(original, position + 1, high)
+        return best
+    
+    def _apply_edit_records(self, text, records):
+        """Validate ["original", "suggestion", start] records against `text` and
+        rebuild the corrected text; records that cannot be placed are dropped"""
+        placed = []
+        for record in records:
+            if not isinstance(record, (list, tuple)) or len(record) < 3:
+                continue
+            original, suggestion, hint = record[0], record[1], record[2]
+            if not isinstance(original, str) or not isinstance(suggestion, str) or original == suggestion:
+                continue
+            if PLACEHOLDER_MARK in original or PLACEHOLDER_MARK in suggestion:
+                continue  # Protected spans are never edited
+            try:
+                hint = int(hint)
+            except (TypeError, ValueError):
+                hint = 0
+            start = self._locate_original(text, original, hint)
+            if start < 0:
+                continue
+            placed.append((start, start + len(original), original, suggestion))
+        
+        placed.sort()
+        pieces = []
+        edits = []
+        position = 0
+        for start, end, original, suggestion in placed:
+            if start < position:
+                continue  # Overlaps an edit we already applied
+            pieces.append(text[position:start])
+            pieces.append(suggestion)
+            position = end
+            edits.append({
+                "original": original,
+                "suggestion": suggestion,
+                "start": start,
+                "end": end,
+                "type": "capitalization" if original.lower() == suggestion.lower() else "spelling",
+                "confidence": 0.90
+            })
+        pieces.append(text[position:])
+        
+        return {"text": "".join(pieces), "edits": edits}
+    
+    def _verify_edits(self, text, corrected, edits):
+        """Check model-reported edits against `text` and repair their offsets.
+        
+        Edits whose `original` sits at the claimed offset pass untouched;
+        misplaced ones are realigned with _locate_original. Edits that cannot
+        be placed are dropped, and if the kept edits no longer rebuild
+        `corrected`, the gaps are filled from a local diff.
+        """
+        placed = []
+        recovered = True
+        for edit in edits:
+            if not isinstance(edit, dict) or "original" not in edit or "suggestion" not in edit:
+                recovered = False
+                continue
+            original = edit["original"]
+            suggestion = edit["suggestion"]
+            if not isinstance(original, str) or not isinstance(suggestion, str):
+                recovered = False
+                continue
+            if original == suggestion:
+                continue
+            try:
+                hint = int(edit.get("start", 0))
+            except (TypeError, ValueError):
+                hint = 0
+            
+            start = hint if 0 <= hint and text.startswith(original, hint) else self._locate_original(text, original, hint)
+            if start < 0:
+                recovered = False
+                continue
+            if start != edit.get("start") or edit.get("end") != start + len(original):
+                edit = dict(edit, start=start, end=start + len(original))
+            placed.append(edit)
+        
+        placed.sort(key=lambda edit: (edit["start"], edit["end"]))
+        verified = []
+        pieces = []
+        position = 0
+        for edit in placed:
+            if edit["start"] < position:
+                recovered = False
+                continue  # Overlaps an edit we already kept
+            pieces.append(text[position:edit["start"]])
+            pieces.append(edit["suggestion"])
+            position = edit["end"]
+            verified.append(edit)
+        pieces.append(text[position:])
+        
+        if recovered and "".join(pieces) == corrected:
+            return verified
+        
+        # Rebuild only what the verified edits do not already cover
+        for edit in self._compute_edits(text, corrected):
+            overlaps = any(
+                edit["start"] < kept["end"] and kept["start"] < edit["end"]
+                or edit["start"] == kept["start"]
+                for kept in verified
+            )
+            if not overlaps:
+                verified.append(edit)
+        verified.sort(key=lambda edit: (edit["start"], edit["end"]))
+        return verified
+
+    async def _stream_llm(self, input_data, model=None):
+        """Run one streamed generation under the adaptive upstream limiter.
+        
+        Cancelling the awaiting task stops reading the stream and cancels the
+        upstream prediction, so abandoned requests stop costing generation time.
+        """
+        model = model or LLM_MODEL
+        cancelled = threading.Event()
+        predictions = []
+        # Kept outside consume() so a cancelled or failed call still books what it generated
+        streamed = []
+        
+        def consume():
+            # The clock starts when a thread picks the call up, not when it was queued
+            timer["start"] = time.monotonic()
+            prediction = self.client.models.predictions.create(model=model, input=input_data, stream=True)
+            predictions.append(prediction)
+            if cancelled.is_set():
+                # Cancelled while the prediction was being created
+                prediction.cancel()
+                return ""
+            for event in prediction.stream():
+                if cancelled.is_set():
+                    break
+                streamed.append(str(event))
+            return "".join(streamed)
+        
+        # Latency is normalised per requested token so long and short calls compare fairly
+        cost = input_data.get("max_new_tokens", 1)
+        prompt_tokens = self._estimate_tokens(input_data.get("prompt", ""))
+        # Worst case is the whole prompt plus every allowed output token
+        reserved = prompt_tokens + cost
+        USAGE_LEDGER.reserve(self.cache_scope, reserved, self.usage)
+        try:
+            async with UPSTREAM_LIMITER.slot(cost=cost) as timer:
+                try:
+                    output = await asyncio.get_running_loop().run_in_executor(UPSTREAM_EXECUTOR, consume)
+                except asyncio.CancelledError:
+                    cancelled.set()
+                    if predictions:
+                        # Fire and forget: the caller is already gone
+                        asyncio.get_running_loop().run_in_executor(None, predictions[0].cancel)
+                    raise
+                except Exception:
+                    MODEL_ROUTER.record(model, time.monotonic() - timer["start"], cost, error=True)
+                    raise
+                MODEL_ROUTER.record(model, time.monotonic() - timer["start"], cost)
+                return output
+        finally:
+            used_prompt, used_output = self._metered_tokens(
+                predictions[0] if predictions else None, prompt_tokens, self._estimate_tokens("".join(streamed))
+            )
+            USAGE_LEDGER.settle(self.cache_scope, reserved, used_prompt, used_output, self.usage)
+    
+    @staticmethod
+    def _metered_tokens(prediction, prompt_tokens, output_tokens):
+        """Token counts Replicate reported for the prediction, falling back to our estimates"""
+        metrics = getattr(prediction, "metrics", None)
+        if not isinstance(metrics, dict):
+            return prompt_tokens, output_tokens
+        return (
+            metrics.get("input_token_count", prompt_tokens),
+            metrics.get("output_token_count", output_tokens),
+        )
+    
     def _estimate_tokens(self, text):
         """Rough token estimation (1 token ≈ 3 chars for English)"""
         return len(text) // 3
     
+    def chunk_text(self, text):
+        """Chunks correct_with_chunking() would split `text` into, for callers that run them separately"""
+        return self._smart_chunk_text(text)
+    
     def _smart_chunk_text(self, text, max_chunk_tokens=600, overlap_tokens=80):
         """Split text into chunks with context overlap for large texts"""
         import re
@@ -192,6 +492,7 @@ Output:"""
         all_suggestions = []
         current_offset = 0
         has_any_success = False
+        prompt_tokens = 0
         
         for i, result in enumerate(chunk_results):
             if result.get('success', False):
@@ -220,51 +521,19 @@ Output:"""
                 
                 all_suggestions.extend(result.get('suggestions', []))
                 current_offset += len(chunk_text)
+            prompt_tokens += result.get('prompt_tokens', 0)
         
         return {
             'text': full_text,
             'edits': all_edits,
             'suggestions': all_suggestions,
-            'success': has_any_success
+            'success': has_any_success,
+            'prompt_tokens': prompt_tokens
         }
     
     def _compute_edits(self, original, corrected):
         """Compute edit spans when LLM doesn't provide them"""
-        import difflib
-        
-        edits = []
-        matcher = difflib.SequenceMatcher(None, original, corrected)
-        
-        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
-            if tag == 'replace':
-                edits.append({
-                    "original": original[i1:i2],
-                    "suggestion": corrected[j1:j2],
-                    "start": i1,
-                    "end": i2,
-                    "type": "spelling",
-                    "confidence": 0.90
-                })
-            elif tag == 'delete':
-                edits.append({
-                    "original": original[i1:i2],
-                    "suggestion": "",
-                    "start": i1,
-                    "end": i2,
-                    "type": "deletion",
-                    "confidence": 0.85
-                })
-            elif tag == 'insert':
-                edits.append({
-                    "original": "",
-                    "suggestion": corrected[j1:j2],
-                    "start": i1,
-                    "end": i1,
-                    "type": "insertion",
-                    "confidence": 0.85
-                })
-        
-        return edits
+        return compute_word_edits(original, corrected)
     
     async def correct_with_chunking(self, text):
         """Process large text using intelligent chunking"""
@@ -279,6 +548,8 @@ Output:"""
         for i, chunk in enumerate(chunks):
             print(f"  📦 Processing chunk {i+1}/{len(chunks)} ({len(chunk)} chars)")
             result = await self.correct_with_llm(chunk)
+            # _merge_chunk_results only merges chunks marked successful
+            result['success'] = True
             chunk_results.append(result)
         
         # Merge results
@@ -287,59 +558,67 @@ Output:"""
         
         return merged
     
-    def correct_text(self, text, use_chunking=True):
-        """Correct text using pure LLM with intelligent chunking for large texts"""
-        start_time = time.time()
+    async def correct_structured(self, text, use_chunking=True, segments=None):
+        """Correct only the prose regions of a Markdown/HTML/code document.
         
-        try:
-            # Check if text is large and chunking is enabled
-            if use_chunking and self._estimate_tokens(text) > 400:
-                print(f"📊 Large text detected ({len(text)} chars, ~{self._estimate_tokens(text)} tokens) - using intelligent chunking")
-                llm_result = asyncio.run(self.correct_with_chunking(text))
-                method = f"Chunked LLM ({llm_result.get('chunks_processed', 1)} chunks)"
+        Non-prose spans pass through unchanged and edit offsets are mapped back
+        to the original document.
+        """
+        async def correct_region(region):
+            raw = text[region.start:region.end]
+            core = raw.strip()
+            offset = region.start + len(raw) - len(raw.lstrip())
+            if use_chunking and self._estimate_tokens(core) > 400:
+                result = await self.correct_with_chunking(core)
             else:
-                llm_result = asyncio.run(self.correct_with_llm(text))
-                method = "Pure LLM (Llama-3)"
-            
-            elapsed = time.time() - start_time
-            
-            # Convert LLM edits to suggestions format
-            suggestions = []
-            for edit in llm_result.get("edits", []):
-                if edit["original"] and edit["suggestion"]:
-                    suggestions.append(f"{edit['original']} → {edit['suggestion']}")
-            
-            return {
-                "text": llm_result["text"],
-                "suggestions": suggestions,
-                "time": elapsed,
-                "method": method,
-                "edits": llm_result.get("edits", []),
-                "confidence": "high",
-                "success": True,
-                "chunks_used": llm_result.get('chunks_processed', 1)
-            }
-            
-        except Exception as e:
-            elapsed = time.time() - start_time
-            return {
-                "text": text,  # Return original unchanged
-                "suggestions": [],
-                "time": elapsed,
-                "method": "LLM Failed",
-                "error": str(e),
-                "confidence": "none",
-                "success": False,
-                "chunks_used": 0
-            }
+                result = await self.correct_with_llm(core)
+            return offset, core, result
+        
+        regions = prose_regions(text, segments or segment_document(text))
+        results = await asyncio.gather(*(correct_region(region) for region in regions))
+        
+        pieces = []
+        edits = []
+        position = 0
+        chunks = 0
+        prompt_tokens = 0
+        for offset, core, result in results:
+            pieces.append(text[position:offset])
+            pieces.append(result["text"])
+            position = offset + len(core)
+            for edit in result.get("edits", []):
+                shifted = dict(edit)
+                shifted["start"] += offset
+                shifted["end"] += offset
+                edits.append(shifted)
+            chunks += result.get("chunks_processed", 1)
+            prompt_tokens += result.get("prompt_tokens", 0)
+        pieces.append(text[position:])
+        
+        return {
+            "text": "".join(pieces),
+            "edits": edits,
+            "chunks_processed": chunks,
+            "regions": len(regions),
+            "prompt_tokens": prompt_tokens
+        }
+    
+    def correct_text(self, text, use_chunking=True):
+        """Correct text using pure LLM with intelligent chunking for large texts"""
+        return asyncio.run(self.correct_text_async(text, use_chunking))
     
     async def correct_text_async(self, text, use_chunking=True):
         """Async version for use within FastAPI"""
         start_time = time.time()
         
         try:
+            segments = segment_document(text) if has_structure(text) else None
+            if segments and has_blocks(segments):
+                # Code, URLs, tags and tables never reach the prompt
+                llm_result = await self.correct_structured(text, use_chunking, segments)
+                method = f"Structured LLM ({llm_result['regions']} prose regions)"
             # Check if text is large and chunking is enabled
-            if use_chunking and self._estimate_tokens(text) > 400:
+            elif use_chunking and self._estimate_tokens(text) > 400:
                 print(f"📊 Large text detected ({len(text)} chars, ~{self._estimate_tokens(text)} tokens) - using intelligent chunking")
                 llm_result = await self.correct_with_chunking(text)
                 method = f"Chunked LLM ({llm_result.get('chunks_processed', 1)} chunks)"
@@ -347,25 +626,13 @@ Output:"""
                 llm_result = await self.correct_with_llm(text)
                 method = "Pure LLM (Llama-3)"
             
-            elapsed = time.time() - start_time
-            
-            # Convert LLM edits to suggestions format
-            suggestions = []
-            for edit in llm_result.get("edits", []):
-                if edit["original"] and edit["suggestion"]:
-                    suggestions.append(f"{edit['original']} → {edit['suggestion']}")
-            
-            return {
-                "text": llm_result["text"],
-                "suggestions": suggestions,
-                "time": elapsed,
-                "method": method,
-                "edits": llm_result.get("edits", []),
-                "confidence": "high",
-                "success": True,
-                "chunks_used": llm_result.get('chunks_processed', 1)
-            }
+            response = self._correction_response(llm_result, method, time.time() - start_time)
+            USAGE_LEDGER.record_request(self.cache_scope, response["chunks_used"])
+            return response
             
+        except BudgetExceededError:
+            # Callers must see this as a refusal, not as a failed correction
+            raise
         except Exception as e:
             elapsed = time.time() - start_time
             return {
@@ -378,9 +645,164 @@ Output:"""
                 "success": False,
                 "chunks_used": 0
             }
+    
+    def _correction_response(self, llm_result, method, elapsed):
+        """Shape a raw or merged LLM result into the public correction schema"""
+        # Convert LLM edits to suggestions format
+        suggestions = []
+        for edit in llm_result.get("edits", []):
+            if edit["original"] and edit["suggestion"]:
+                suggestions.append(f"{edit['original']} → {edit['suggestion']}")
+        
+        return {
+            "text": llm_result["text"],
+            "suggestions": suggestions,
+            "time": elapsed,
+            "method": method,
+            "edits": llm_result.get("edits", []),
+            "confidence": "high",
+            "success": True,
+            "chunks_used": llm_result.get('chunks_processed', 1),
+            "prompt_tokens": llm_result.get('prompt_tokens', 0),
+            "usage": self.request_usage()
+        }
 
-    async def enhance_naturalness(self, text):
+    async def enhance_naturalness(self, text, deterministic=False):
         """Make text sound more natural while preserving the original tone and mood"""
+        return await self._enhance_with_chunking(text, "naturalness", deterministic)
+
+    async def enhance_formality(self, text, deterministic=False):
+        """Make text more formal and well-structured"""
+        return await self._enhance_with_chunking(text, "formality", deterministic)
+
+    def _enhancement_sampling(self, deterministic):
+        """Sampling settings for enhancement; deterministic mode decodes greedily"""
+        if deterministic:
+            return {"temperature": 0.0, "top_p": 1.0, "do_sample": False}
+        # Slightly creative by default
+        return {"temperature": 0.1, "top_p": 0.9, "do_sample": True}
+
+    def _paragraph_chunk_text(self, text, max_chunk_tokens=300):
+        """Split text into paragraph-aligned chunks for enhancement.
+        
+        Returns (chunk, separator) pairs; joining chunk + separator for every
+        pair rebuilds the original text exactly; trailing whitespace always
+        sits in the separator, so it survives a rewrite of the chunk.
+        Paragraphs longer than the budget fall back to sentence boundaries.
+        """
+        units = []
+        parts = re.split(r'(\n\s*\n)', text)
+        for i in range(0, len(parts), 2):
+            paragraph = parts[i]
+            separator = parts[i + 1] if i + 1 < len(parts) else ""
+            
+            if self._estimate_tokens(paragraph) <= max_chunk_tokens:
+                content = paragraph.rstrip()
+                units.append((content, paragraph[len(content):] + separator))
+                continue
+            
+            sentences = re.split(r'([.!?]+\s+)', paragraph)
+            first_unit = len(units)
+            for j in range(0, len(sentences), 2):
+                sentence = sentences[j] + (sentences[j + 1] if j + 1 < len(sentences) else "")
+                content = sentence.rstrip()
+                if not content and len(units) > first_unit:
+                    # Whitespace after the last sentence belongs to its separator, not a chunk of its own
+                    units[-1] = (units[-1][0], units[-1][1] + sentence)
+                    continue
+                units.append((content, sentence[len(content):]))
+            units[-1] = (units[-1][0], units[-1][1] + separator)
+        
+        # Pack consecutive units into chunks up to the token budget
+        chunks = []
+        current = None
+        current_separator = ""
+        for content, separator in units:
+            if current is not None and self._estimate_tokens(current + current_separator + content) > max_chunk_tokens:
+                chunks.append((current, current_separator))
+                current = None
+            current = content if current is None else current + current_separator + content
+            current_separator = separator
+        if current is not None:
+            chunks.append((current, current_separator))
+        
+        return chunks
+
+    async def _enhance_with_chunking(self, text, enhancement_type, deterministic=False):
+        """Enhance long text as concurrent paragraph chunks and stitch the results.
+        
+        Deterministic results are cached like corrections; sampled ones are not,
+        since the same input may legitimately produce a different rewrite.
+        """
+        if deterministic:
+            cached = self.cached_enhancement(text, enhancement_type)
+            if cached is not None:
+                return cached
+            result = await self._enhance_uncached(text, enhancement_type, deterministic)
+            if not result.get("partial"):
+                # A chunk that failed kept its original wording; retry it next time instead of serving it
+                RESULT_CACHE.set(RESULT_CACHE.key("enhance", enhancement_type, MODEL_ROUTER.cache_tag, self.cache_scope, text), result)
+            return result
+        return await self._enhance_uncached(text, enhancement_type, deterministic)
+
+    def cached_enhancement(self, text, enhancement_type):
+        """Cached deterministic enhancement of `text`, or None"""
+        return RESULT_CACHE.get(RESULT_CACHE.key("enhance", enhancement_type, MODEL_ROUTER.cache_tag, self.cache_scope, text))
+
+    async def _enhance_uncached(self, text, enhancement_type, deterministic):
+        """Run enhancement, splitting long text into concurrent chunks.
+        
+        Multi-chunk results carry "partial": True when some chunk failed and
+        kept its original wording.
+        """
+        enhance_chunk = self._enhance_naturalness_chunk if enhancement_type == "naturalness" else self._enhance_formality_chunk
+        chunks = self._paragraph_chunk_text(text)
+        
+        if len(chunks) == 1:
+            result = await enhance_chunk(text, deterministic)
+            USAGE_LEDGER.record_request(self.cache_scope, 1)
+            return result
+        
+        print(f"📊 Long text for {enhancement_type} ({len(text)} chars) - enhancing {len(chunks)} chunks concurrently")
+        
+        async def enhance_or_keep(chunk):
+            if not chunk.strip():
+                return None
+            return await enhance_chunk(chunk, deterministic)
+        
+        # The upstream limiter bounds how many of these actually run at once
+        results = await asyncio.gather(*(enhance_or_keep(chunk) for chunk, _ in chunks), return_exceptions=True)
+        
+        failures = [r for r in results if isinstance(r, BaseException)]
+        if failures and len(failures) == sum(1 for chunk, _ in chunks if chunk.strip()):
+            raise failures[0]
+        for failure in failures:
+            if isinstance(failure, BudgetExceededError):
+                raise failure
+        
+        enhanced_text = ""
+        all_changes = []
+        for (chunk, separator), result in zip(chunks, results):
+            if result is None or isinstance(result, BaseException):
+                # Keep the original wording for blank or failed chunks
+                enhanced_text += chunk + separator
+                continue
+            leading = chunk[:len(chunk) - len(chunk.lstrip())]
+            trailing = chunk[len(chunk.rstrip()):]
+            enhanced_text += leading + result["text"].strip() + trailing + separator
+            all_changes.extend(result.get("changes", []))
+        
+        USAGE_LEDGER.record_request(self.cache_scope, len(chunks))
+        return {
+            "text": enhanced_text,
+            "changes": all_changes,
+            "enhancement_type": enhancement_type,
+            "chunks_processed": len(chunks),
+            "partial": bool(failures)
+        }
+
+    async def _enhance_naturalness_chunk(self, text, deterministic=False):
+        """Naturalness rewrite of a single chunk"""
         prompt = f"""You are a professional editor specializing in making text sound more natural and fluent. Your task is to rewrite the given text to make it sound more natural while preserving the original tone, mood, and meaning.
 
 RULES:
@@ -410,20 +832,15 @@ Output:"""
         try:
             input_data = {
                 "prompt": prompt,
-                "max_new_tokens": min(len(text) + 150, 600),
-                "temperature": 0.1,  # Slightly creative for naturalness
-                "top_p": 0.9,
-                "do_sample": True
+                "max_new_tokens": min(2 * self._estimate_tokens(text) + 150, 800),
+                **self._enhancement_sampling(deterministic)
             }
             
-            output = ""
-            for event in replicate.stream("meta/meta-llama-3-8b-instruct", input=input_data):
-                output += str(event)
+            output = await self._stream_json(input_data, "naturalness", text)
             
             # Parse JSON response with better error handling
             try:
-                output = self._clean_json_output(output)
-                result = json.loads(output.strip())
+                result = self._parse_json_output(output)
                 
                 if "text" in result and isinstance(result["text"], str):
                     return {
@@ -448,11 +865,13 @@ Output:"""
                 else:
                     raise RuntimeError(f"JSON parsing failed and fallback unsuccessful: {je}")
                 
+        except BudgetExceededError:
+            raise
         except Exception as e:
             raise RuntimeError(f"Naturalness enhancement error: {e}")
 
-    async def enhance_formality(self, text):
-        """Make text more formal and well-structured"""
+    async def _enhance_formality_chunk(self, text, deterministic=False):
+        """Formality rewrite of a single chunk"""
         prompt = f"""You are a professional editor specializing in formal writing. Your task is to rewrite the given text to make it more formal, professional, and well-structured while preserving the original meaning.
 
 RULES:
@@ -483,20 +902,15 @@ Output:"""
         try:
             input_data = {
                 "prompt": prompt,
-                "max_new_tokens": min(len(text) + 150, 600),
-                "temperature": 0.1,
-                "top_p": 0.9,
-                "do_sample": True
+                "max_new_tokens": min(2 * self._estimate_tokens(text) + 150, 800),
+                **self._enhancement_sampling(deterministic)
             }
             
-            output = ""
-            for event in replicate.stream("meta/meta-llama-3-8b-instruct", input=input_data):
-                output += str(event)
+            output = await self._stream_json(input_data, "formality", text)
             
             # Parse JSON response with better error handling
             try:
-                output = self._clean_json_output(output)
-                result = json.loads(output.strip())
+                result = self._parse_json_output(output)
                 
                 if "text" in result and isinstance(result["text"], str):
                     return {
@@ -521,9 +935,212 @@ Output:"""
                 else:
                     raise RuntimeError(f"JSON parsing failed and fallback unsuccessful: {je}")
                 
+        except BudgetExceededError:
+            raise
         except Exception as e:
             raise RuntimeError(f"Formality enhancement error: {e}")
 
+    async def correct_and_enhance(self, text, enhancement_type, deterministic=False):
+        """Correct spelling and enhance naturalness/formality in a single LLM call.
+        
+        Protected spans are masked as in correct_with_llm(), and documents that
+        correct_text_async() would segment or chunk take the two-step path.
+        Deterministic results are cached. Returns (correction, enhancement)
+        shaped like correct_text_async() and enhance_naturalness()/
+        enhance_formality() results respectively.
+        """
+        if enhancement_type not in ("naturalness", "formality"):
+            raise ValueError("Invalid enhancement type. Use 'naturalness' or 'formality'")
+        
+        segments = segment_document(text) if has_structure(text) else None
+        if self._estimate_tokens(text) > 400 or (segments and has_blocks(segments)):
+            # Long texts need chunked correction and code or tables need segmenting; one fused prompt does neither
+            return await self._correct_then_enhance(text, enhancement_type, deterministic)
+        
+        start_time = time.time()
+        method = f"Fused LLM (correct + {enhancement_type})"
+        cache_key = RESULT_CACHE.key("fused", enhancement_type, MODEL_ROUTER.cache_tag, self.cache_scope, "\x1f".join(self.protected_terms), text)
+        if deterministic:
+            cached = RESULT_CACHE.get(cache_key)
+            if cached is not None:
+                corrected, enhancement = cached
+                corrected["prompt_tokens"] = 0  # Served without a prompt
+                return self._correction_response(corrected, method, time.time() - start_time), enhancement
+        
+        masked = mask_protected(text, self.protected_trie)
+        if masked.spans and not re.search(r"[A-Za-z]{2,}", masked.text):
+            # Nothing but protected spans: no prose to correct or rewrite
+            corrected = {"text": text, "edits": [], "prompt_tokens": 0}
+            enhancement = {"text": text, "changes": [], "enhancement_type": enhancement_type}
+        else:
+            corrected, enhancement = await self._request_fused(masked, enhancement_type, deterministic)
+            if corrected is None:
+                print("⚠️  LLM damaged protected placeholders - correcting and enhancing separately")
+                return await self._correct_then_enhance(text, enhancement_type, deterministic)
+        
+        if deterministic:
+            RESULT_CACHE.set(cache_key, (corrected, enhancement))
+        USAGE_LEDGER.record_request(self.cache_scope, 1)
+        # Same schema as /correct, including prompt_tokens and usage
+        return self._correction_response(corrected, method, time.time() - start_time), enhancement
+    
+    async def _correct_then_enhance(self, text, enhancement_type, deterministic):
+        """Two-step fallback for correct_and_enhance(): the full correction pipeline, then enhancement"""
+        correction = await self.correct_text_async(text)
+        if not correction["success"]:
+            raise RuntimeError(correction["error"])
+        enhancement = await self._enhance_with_chunking(correction["text"], enhancement_type, deterministic)
+        return correction, enhancement
+    
+    async def _request_fused(self, masked, enhancement_type, deterministic):
+        """One fused round-trip for a masked text.
+        
+        Returns (corrected, enhancement) with placeholders restored and edit
+        offsets mapped back to the original, or (None, None) if the model
+        damaged a placeholder.
+        """
+        if enhancement_type == "naturalness":
+            goal = "sound more natural and fluent while keeping the original tone, mood and meaning"
+            example_enhanced = "I think we should try this approach"
+            example_change = '{"original":"I believe we should maybe try","suggestion":"I think we should try","type":"naturalness","reason":"Removed redundant hedging"}'
+        else:
+            goal = "more formal, professional and well-structured while preserving the original meaning"
+            example_enhanced = "I believe we should consider implementing this approach"
+            example_change = '{"original":"maybe try","suggestion":"consider implementing","type":"formality","reason":"More professional and decisive language"}'
+        
+        placeholder_rule = ""
+        if masked.spans:
+            placeholder_rule = "\n- Copy placeholders such as §0 or §12 exactly in every field; they stand for protected text"
+        
+        prompt = f"""You are a professional English copyeditor. First correct spelling errors and obvious typos, keeping proper nouns and technical terms. Then rewrite the corrected text to make it {goal}. Return only valid JSON.
+
+EXAMPLES:
+
+Input: "i beleive we shoud maybe try this aproach"
+Output: {{"text":"I believe we should maybe try this approach","edits":[{{"original":"i","suggestion":"I","start":0,"end":1,"type":"capitalization","confidence":0.98}},{{"original":"beleive","suggestion":"believe","start":2,"end":9,"type":"spelling","confidence":0.94}},{{"original":"shoud","suggestion":"should","start":13,"end":18,"type":"spelling","confidence":0.95}},{{"original":"aproach","suggestion":"approach","start":34,"end":41,"type":"spelling","confidence":0.95}}],"enhanced_text":"{example_enhanced}","changes":[{example_change}]}}
+
+Input: "NASA sent astronauts to space succesfully"
+Output: {{"text":"NASA sent astronauts to space successfully","edits":[{{"original":"succesfully","suggestion":"successfully","start":30,"end":41,"type":"spelling","confidence":0.96}}],"enhanced_text":"NASA sent astronauts to space successfully","changes":[]}}
+
+RULES:
+- "text" and "edits" contain spelling corrections only, with exact character positions in the input
+- "enhanced_text" is the rewrite of the corrected text; "changes" lists what the rewrite changed
+- Keep proper nouns unchanged (NASA, John, etc.)
+- Preserve the original meaning completely
+- Output valid JSON only{placeholder_rule}
+
+Input: "{masked.text}"
+Output:"""
+        
+        try:
+            # One generation carries both outputs, so budget for roughly two copies of the text
+            input_data = {
+                "prompt": prompt,
+                "max_new_tokens": min(3 * self._estimate_tokens(masked.text) + 200, 1536),
+                **self._enhancement_sampling(deterministic)
+            }
+            
+            output = await self._stream_json(input_data, enhancement_type, masked.text)
+            result = self._parse_json_output(output)
+            
+            if not isinstance(result.get("text"), str) or not isinstance(result.get("enhanced_text"), str):
+                raise ValueError("Missing 'text' or 'enhanced_text' in JSON response")
+            
+            # Offsets are checked against the masked text the model saw, then mapped back
+            edits = result.get("edits")
+            if isinstance(edits, list):
+                edits = self._verify_edits(masked.text, result["text"], edits)
+            else:
+                edits = self._compute_edits(masked.text, result["text"])
+            corrected = {"text": result["text"], "edits": edits, "chunks_processed": 1, "prompt_tokens": self._estimate_tokens(prompt)}
+            enhanced_text = result["enhanced_text"]
+            changes = result.get("changes", [])
+            
+            if masked.spans:
+                corrected = masked.restore_result(corrected)
+                enhanced_text = masked.unmask(enhanced_text)
+                if corrected is None or enhanced_text is None:
+                    return None, None
+                changes = [self._unmask_change(masked, change) for change in changes]
+            
+            enhancement = {
+                "text": enhanced_text,
+                "changes": changes,
+                "enhancement_type": enhancement_type
+            }
+            return corrected, enhancement
+        
+        except BudgetExceededError:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Fused correction error: {e}")
+    
+    @staticmethod
+    def _unmask_change(masked, change):
+        """Restore placeholders in an enhancement change record"""
+        if not isinstance(change, dict):
+            return change
+        change = dict(change)
+        for field in ("original", "suggestion"):
+            if isinstance(change.get(field), str):
+                change[field] = masked.unmask_fragment(change[field])
+        return change
+
+    async def _stream_json(self, input_data, mode="correct", text=""):
+        """Generate JSON output, continuing it when max_new_tokens cut it short.
+        
+        The router picks the model once per call from `mode` and the length of
+        `text`. A continuation replays the prompt on the same model with the
+        partial output prefilled as the assistant turn, so only the missing
+        tail is generated.
+        """
+        model = MODEL_ROUTER.choose(
+            mode, self._estimate_tokens(text), input_data.get("max_new_tokens", 1), self._remaining_ms()
+        )
+        output = await self._stream_llm(input_data, model)
+        for _ in range(MAX_CONTINUATIONS):
+            if not is_truncated(output):
+                break
+            print(f"✂️  JSON output truncated at {len(output)} chars - requesting continuation")
+            continuation = dict(
+                input_data,
+                prompt=CHAT_TEMPLATE.format(prompt=input_data["prompt"]) + output,
+                prompt_template="{prompt}",
+            )
+            tail = await self._stream_llm(continuation, model)
+            if not tail:
+                break
+            output += tail
+        return output
+    
+    def request_usage(self):
+        """Estimated prompt/output tokens and upstream calls so far for this request"""
+        return {name: self.usage[name] for name in ("prompt_tokens", "output_tokens", "calls")}
+    
+    def _remaining_ms(self):
+        """Milliseconds left before the request's deadline, or None"""
+        if self.deadline_at is None:
+            return None
+        return max(0.0, (self.deadline_at - time.monotonic()) * 1000)
+    
+    def _parse_json_output(self, output):
+        """Parse LLM JSON output, repairing it if it is still truncated.
+        
+        Repair keeps only complete values and drops a nested record that was
+        cut off mid-way, so a partial edit or change record never reaches a
+        client. Raises json.JSONDecodeError if nothing parses.
+        """
+        try:
+            result = json.loads(self._clean_json_output(output).strip())
+        except json.JSONDecodeError:
+            result = repair_json(output)
+            if result is None:
+                raise
+            print("🩹 Repaired truncated JSON output")
+        if not isinstance(result, dict):
+            raise ValueError("Expected a JSON object in LLM response")
+        return result
+    
     def _clean_json_output(self, output):
         """Clean up LLM output to extract valid JSON"""
         output = output.strip()
@@ -6,10 +6,17 @@ import os
 import re
 import time
 import json
+import atexit
 import asyncio
 from symspellpy import SymSpell, Verbosity
 from dotenv import load_dotenv
 
+from dictionary_snapshot import load_snapshot, load_word_frequency, save_snapshot, write_word_frequency
+from shared_dictionary import open_shared_dictionary
+from edit_distance import batch_distances, bounded_distance
+from candidate_cache import CandidateCache
+from ngram_model import NgramModel
+
 load_dotenv()
 
 try:
@@ -17,45 +24,65 @@ try:
 except ImportError:
     replicate = None
 
+# Score points per nat of n-gram log-probability when a language model is loaded
+LANGUAGE_MODEL_WEIGHT = 2.0
+
+# A whitespace-delimited token, and the part of it left after outer punctuation
+TOKEN_PATTERN = re.compile(r"\S+")
+CORE_PATTERN = re.compile(r"^\W*(.*?)\W*$", re.S)
+
+
+def word_spans(text):
+    """(token, start, end) per whitespace-delimited token; start/end bound its core word in `text`"""
+    spans = []
+    for match in TOKEN_PATTERN.finditer(text):
+        core = CORE_PATTERN.match(match.group())
+        spans.append((match.group(), match.start() + core.start(1), match.start() + core.end(1)))
+    return spans
+
 class ContextEngine:
     def __init__(self, max_edit_distance=3):
         self.max_edit_distance = max_edit_distance
-        self.symspell = SymSpell(max_dictionary_edit_distance=max_edit_distance, prefix_length=6)
+        self.symspell = None
+        self.shared = None
+        self.frequency_index = {}
         self._load_dictionary()
         self._load_bigrams()
+        self._load_language_model()
+        self._setup_candidate_cache()
         self._setup_llm()
     
     def _load_dictionary(self):
-        """Load 200k word dictionary from wordfreq"""
-        data_dir = os.path.join(os.path.dirname(__file__), "data")
-        freq_path = os.path.join(data_dir, "word_frequency.txt")
+        """Load 200k word dictionary, from the prebuilt snapshot when it is current"""
+        freq_path = os.path.join(os.path.dirname(__file__), "data", "word_frequency.txt")
         
         self.word_list = []
         
-        if os.path.exists(freq_path):
-            with open(freq_path, "r", encoding="utf8") as fh:
-                for line in fh:
-                    parts = line.strip().split()
-                    if not parts:
-                        continue
-                    word = parts[0]
-                    freq = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 1
-                    self.symspell.create_dictionary_entry(word, freq)
-                    self.word_list.append(word)
-        else:
-            try:
-                from wordfreq import top_n_list
-                words = top_n_list("en", 200000)
-                
-                os.makedirs(data_dir, exist_ok=True)
-                with open(freq_path, "w", encoding="utf8") as out:
-                    for rank, word in enumerate(words, start=1):
-                        freq = max(1, int(1_000_000 / rank))
-                        self.symspell.create_dictionary_entry(word, freq)
-                        self.word_list.append(word)
-                        out.write(f"{word}\t{freq}\n")
-            except:
-                return
+        shared_path = os.getenv("GFP_SHARED_DICTIONARY")
+        if shared_path and (os.path.exists(shared_path) or os.path.exists(freq_path) or write_word_frequency(freq_path)):
+            # One mapped copy shared by every worker instead of a SymSpell index each
+            self.shared = open_shared_dictionary(shared_path, freq_path, self.max_edit_distance)
+            self.word_list = self.shared
+            self.frequency_index = self.shared
+            return
+        
+        self.symspell = SymSpell(max_dictionary_edit_distance=self.max_edit_distance, prefix_length=6)
+        if not os.path.exists(freq_path) and not write_word_frequency(freq_path):
+            return
+        
+        if load_snapshot(self.symspell, freq_path):
+            self.word_list = list(self.symspell.words)
+            self.frequency_index = self.symspell.words
+            return
+        
+        # First start or the word list changed: build once, then snapshot for the next worker
+        self.word_list = load_word_frequency(self.symspell, freq_path)
+        # SymSpell's own word -> count dict; reading it directly skips a lookup() per count
+        self.frequency_index = self.symspell.words
+        try:
+            save_snapshot(self.symspell, freq_path)
+        except OSError as e:
+            print(f"⚠️  Could not write dictionary snapshot: {e}")
     
     def _load_bigrams(self):
         """Load common English bigrams for context"""
@@ -70,6 +97,44 @@ class ContextEngine:
             ('i', 'think'), ('i', 'believe'), ('i', 'know'), ('i', 'see'),
             ('you', 'are'), ('you', 'can'), ('you', 'will'), ('you', 'should'),
         ])
+        self._bigram_firsts = {first for first, _ in self.common_bigrams}
+        self._bigram_seconds = {second for _, second in self.common_bigrams}
+    
+    def _load_language_model(self):
+        """Map the offline-built n-gram model; without one, scoring falls back to the bigram list"""
+        path = os.getenv("GFP_NGRAM_MODEL", os.path.join(os.path.dirname(__file__), "data", "ngrams.bin"))
+        self.language_model = None
+        if not os.path.exists(path):
+            return
+        try:
+            self.language_model = NgramModel(path)
+            print(f"📈 N-gram model: {self.language_model.vocabulary:,} words")
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Could not load n-gram model: {e}")
+    
+    def _setup_candidate_cache(self):
+        """Memoize candidates across requests, starting from the tokens the last process saw most"""
+        self.candidate_cache = CandidateCache()
+        self.hot_tokens_path = os.getenv(
+            "GFP_CANDIDATE_WARM_FILE", os.path.join(os.path.dirname(__file__), "data", "hot_tokens.txt")
+        )
+        if self.word_list:
+            warmed = self.candidate_cache.warm(self.hot_tokens_path, self._candidate_profile)
+            if warmed:
+                print(f"🔥 Candidate cache warmed with {warmed:,} tokens")
+        atexit.register(self.save_hot_tokens)
+    
+    def save_hot_tokens(self):
+        """Persist the most requested tokens so the next start is warm"""
+        try:
+            return self.candidate_cache.save(self.hot_tokens_path)
+        except OSError as e:
+            print(f"⚠️  Could not save hot tokens: {e}")
+            return 0
+    
+    def cache_stats(self):
+        """Hit rates of the token and context-pick caches"""
+        return self.candidate_cache.stats()
     
     def _setup_llm(self):
         """Setup LLM for high-accuracy spell correction"""
@@ -81,79 +146,129 @@ class ContextEngine:
     
     def get_candidates(self, word):
         """Get candidates from SymSpell"""
+        if self.shared is not None:
+            return self.shared.get_candidates(word, self.max_edit_distance)
         suggestions = self.symspell.lookup(word, Verbosity.ALL, max_edit_distance=self.max_edit_distance)
         candidates = [s.term for s in suggestions if s.term.lower() != word.lower()]
         return candidates[:10]
     
     def get_word_frequency(self, word):
-        """Get frequency from SymSpell"""
-        suggestions = self.symspell.lookup(word, Verbosity.CLOSEST, max_edit_distance=0)
-        if suggestions and suggestions[0].term == word:
-            return suggestions[0].count
-        return 0
+        """Get frequency from the dictionary's frequency index"""
+        return self.frequency_index.get(word, 0)
+    
+    def get_word_frequencies(self, words):
+        """Frequencies for a batch of words, e.g. every token of a sentence"""
+        lookup = self.frequency_index.get
+        return [lookup(word, 0) for word in words]
     
     def calculate_edit_distance(self, s1, s2):
-        """Calculate edit distance"""
-        if len(s1) < len(s2):
-            return self.calculate_edit_distance(s2, s1)
-        
-        if len(s2) == 0:
-            return len(s1)
-        
-        previous_row = list(range(len(s2) + 1))
-        for i, c1 in enumerate(s1):
-            current_row = [i + 1]
-            for j, c2 in enumerate(s2):
-                insertions = previous_row[j + 1] + 1
-                deletions = current_row[j] + 1
-                substitutions = previous_row[j] + (c1 != c2)
-                current_row.append(min(insertions, deletions, substitutions))
-            previous_row = current_row
-        
-        return previous_row[-1]
+        """Calculate edit distance (adjacent transpositions count as one edit)"""
+        return bounded_distance(s1, s2)
+    
+    def _candidate_distances(self, original, candidates):
+        """Bounded distance from the word to every candidate, computed once per candidate"""
+        too_far = self.max_edit_distance + 1
+        distances = batch_distances(original.lower(), candidates, self.max_edit_distance)
+        return [distance if distance >= 0 else too_far for distance in distances]
     
     def pick_best_candidate(self, original, candidates, words, position):
         """Pick best candidate using enhanced heuristics"""
+        return self._rank_candidates(original, candidates, words, position)[0]
+    
+    def _candidate_profile(self, token):
+        """Candidates for a lowercased token with their distances and frequencies; context free, so cacheable"""
+        candidates = self.get_candidates(token)
+        return (
+            tuple(candidates),
+            tuple(self._candidate_distances(token, candidates)),
+            tuple(self.get_word_frequencies(candidates)),
+        )
+    
+    def _neighbors(self, words, position):
+        """Normalized two words before and two after, None past the edges"""
+        def word_at(index):
+            if 0 <= index < len(words):
+                return words[index].lower().strip('.,!?\"')
+            return None
+        return word_at(position-2), word_at(position-1), word_at(position+1), word_at(position+2)
+    
+    def _context_signature(self, words, position):
+        """The part of the context the score depends on"""
+        before_prev, prev_word, next_word, after_next = self._neighbors(words, position)
+        if self.language_model is not None:
+            # Words the model has never seen all score alike, so they share one entry
+            return tuple(
+                word if word is None or word in self.language_model else ""
+                for word in (before_prev, prev_word, next_word, after_next)
+            )
+        return (
+            prev_word if prev_word in self._bigram_firsts else None,
+            next_word if next_word in self._bigram_seconds else None,
+        )
+    
+    def _cached_choice(self, clean_word, words, position):
+        """(best candidate, edit distance, frequency), or None without candidates, memoized across requests"""
+        token = clean_word.lower()
+        key = (token, self._context_signature(words, position))
+        choice = self.candidate_cache.choices.get(key, False)
+        if choice is not False:
+            return choice
+        
+        profile = self.candidate_cache.tokens.get(token)
+        if profile is None:
+            profile = self._candidate_profile(token)
+            self.candidate_cache.tokens.set(token, profile)
+        
+        candidates, distances, frequencies = profile
+        choice = self._rank_candidates(token, candidates, words, position, distances, frequencies) if candidates else None
+        self.candidate_cache.choices.set(key, choice)
+        return choice
+    
+    def _rank_candidates(self, original, candidates, words, position, distances=None, frequencies=None):
+        """Best candidate with its edit distance and frequency, so should_correct need not recompute them"""
         if not candidates:
-            return original
+            return original, 0, self.get_word_frequency(original)
         
         scored_candidates = []
+        if distances is None:
+            distances = self._candidate_distances(original, candidates)
+        if frequencies is None:
+            frequencies = self.get_word_frequencies(candidates)
+        before_prev, prev_word, next_word, after_next = self._neighbors(words, position)
+        if self.language_model is not None:
+            context_scores = self.language_model.candidate_scores(candidates, before_prev, prev_word, next_word, after_next)
+        else:
+            context_scores = [0] * len(candidates)
         
-        for candidate in candidates:
+        for candidate, edit_dist, freq, context_score in zip(candidates, distances, frequencies, context_scores):
             score = 0
             
             # Frequency score (high weight)
-            freq = self.get_word_frequency(candidate)
             score += (freq / 1000000) * 20
             
             # Edit distance score
-            edit_dist = self.calculate_edit_distance(original.lower(), candidate)
             score += 25 / (edit_dist + 1)
             
             # Length similarity
             length_diff = abs(len(original) - len(candidate))
             score += 10 / (length_diff + 1)
             
-            # Context scoring using bigrams
-            if position > 0:
-                prev_word = words[position-1].lower().strip('.,!?\"')
-                if (prev_word, candidate) in self.common_bigrams:
+            # Context scoring: smoothed n-gram log-probability, else the built-in bigrams
+            if self.language_model is not None:
+                score += LANGUAGE_MODEL_WEIGHT * context_score
+            else:
+                if prev_word is not None and (prev_word, candidate) in self.common_bigrams:
                     score += 30
-            
-            if position < len(words) - 1:
-                next_word = words[position+1].lower().strip('.,!?\"')
-                if (candidate, next_word) in self.common_bigrams:
+                
+                if next_word is not None and (candidate, next_word) in self.common_bigrams:
                     score += 30
             
-            scored_candidates.append((candidate, score))
+            scored_candidates.append((candidate, score, edit_dist, freq))
         
-        if not scored_candidates:
-            return original
-            
         best = max(scored_candidates, key=lambda x: x[1])
-        return best[0]
+        return best[0], best[2], best[3]
     
-    def should_correct(self, original, candidate):
+    def should_correct(self, original, candidate, edit_dist=None, orig_freq=None, cand_freq=None):
         """Advanced correction decision optimized for 95% accuracy"""
         # Don't correct very common words 
         very_common = ['is', 'in', 'it', 'to', 'at', 'on', 'an', 'or', 'as', 'be', 'we', 'he', 'me', 'the', 'and', 'a']
@@ -168,12 +283,15 @@ class ContextEngine:
         if original.lower() == candidate.lower():
             return False
         
-        # Get frequencies
-        orig_freq = self.get_word_frequency(original.lower())
-        cand_freq = self.get_word_frequency(candidate)
+        # Get frequencies unless the caller already has them
+        if orig_freq is None:
+            orig_freq = self.get_word_frequency(original.lower())
+        if cand_freq is None:
+            cand_freq = self.get_word_frequency(candidate)
         
-        # Calculate edit distance
-        edit_dist = self.calculate_edit_distance(original.lower(), candidate)
+        # Calculate edit distance unless the ranking already did
+        if edit_dist is None:
+            edit_dist = self._candidate_distances(original, [candidate])[0]
         
         # AGGRESSIVE: Correct if original not in 200k dictionary and candidate is
         if orig_freq == 0 and cand_freq > 0:
@@ -315,23 +433,27 @@ Output:"""
                 print(f"LLM fallback to local: {e}")
         
         # Fallback to local enhanced heuristics
-        words = text.split()
-        corrected_words = words.copy()
+        spans = word_spans(text)
+        words = [token for token, _, _ in spans]
+        clean_words = [text[start:end] for _, start, end in spans]
+        word_freqs = self.get_word_frequencies([clean_word.lower() for clean_word in clean_words])
         suggestions = []
+        edits = []
+        pieces = []
+        position = 0
         
-        for i, word in enumerate(words):
-            clean_word = re.sub(r'[^\w]', '', word)
+        for i, (_, start, end) in enumerate(spans):
+            clean_word = clean_words[i]
             if not clean_word.isalpha():
                 continue
             
-            candidates = self.get_candidates(clean_word.lower())
-            if not candidates:
-                continue
-            
             # Pick best candidate using enhanced heuristics
-            best_candidate = self.pick_best_candidate(clean_word, candidates, words, i)
+            choice = self._cached_choice(clean_word, words, i)
+            if choice is None:
+                continue
+            best_candidate, edit_dist, cand_freq = choice
             
-            if self.should_correct(clean_word, best_candidate):
+            if self.should_correct(clean_word, best_candidate, edit_dist, word_freqs[i], cand_freq):
                 # Preserve case
                 if clean_word.isupper():
                     corrected = best_candidate.upper()
@@ -340,17 +462,29 @@ Output:"""
                 else:
                     corrected = best_candidate
                 
-                # Replace in original word (preserve punctuation)
-                corrected_words[i] = word.replace(clean_word, corrected)
+                # Splice by offset; punctuation and whitespace around it stay as they were
+                pieces.append(text[position:start])
+                pieces.append(corrected)
+                position = end
                 suggestions.append(f"{clean_word} → {corrected}")
+                edits.append({
+                    "original": clean_word,
+                    "suggestion": corrected,
+                    "start": start,
+                    "end": end,
+                    "type": "spelling",
+                    "confidence": 0.75
+                })
         
+        pieces.append(text[position:])
         elapsed = time.time() - start_time
         
         return {
-            "text": " ".join(corrected_words),
+            "text": "".join(pieces),
             "suggestions": suggestions,
             "time": elapsed,
             "method": "Enhanced Local Engine + 200k Dictionary",
+            "edits": edits,
             "confidence": "medium"
         }
 
@@ -383,4 +517,6 @@ if __name__ == "__main__":
             print(f"  🏠 Local: {result['text']} ({result['time']:.2f}s)")
         print()
     
+    tokens = engine.cache_stats()["tokens"]
+    print(f"🗂️  Candidate cache: {tokens['entries']:,} tokens, {tokens['hit_rate']:.0%} hit rate")
     print("✅ Engine ready!")
\ No newline at end of file
@@ -0,0 +1,301 @@
+"""
+Asynchronous document correction jobs
+Chunk results are persisted as they complete, so a crashed server or a
+retrying client resumes from the last finished chunk. Every uvicorn worker
+shares the database, so a running job is owned by one worker, which keeps a
+heartbeat; only jobs whose heartbeat went stale count as interrupted
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(__file__), "data", "jobs.sqlite3")
+
+# Terminal states; everything else can still make progress
+FINISHED_STATES = ("completed", "failed")
+
+# Jobs untouched for this long are deleted along with their document text
+DEFAULT_RETENTION_HOURS = 72
+
+# A running job's owner refreshes its heartbeat this often (seconds); after
+# STALE_AFTER without one, the owner is presumed dead and others may take over
+HEARTBEAT_INTERVAL = 10
+STALE_AFTER = 3 * HEARTBEAT_INTERVAL
+
+# Added after the first release; older databases get them on open
+ADDED_COLUMNS = {
+    "protected_terms": "TEXT NOT NULL DEFAULT '[]'",
+    "output_format": "TEXT NOT NULL DEFAULT 'full'",
+    "owner": "TEXT",
+    "heartbeat": "REAL",
+}
+
+
+class JobStore:
+    def __init__(self, path=None, retention_hours=None):
+        self.path = path or os.getenv("GFP_JOB_DB", DEFAULT_DB_PATH)
+        if retention_hours is None:
+            retention_hours = float(os.getenv("GFP_JOB_RETENTION_HOURS", DEFAULT_RETENTION_HOURS))
+        self.retention = retention_hours * 3600
+        # Identifies this worker process as a job owner
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    scope TEXT NOT NULL,
+                    digest TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    total_chunks INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    error TEXT,
+                    result TEXT,
+                    protected_terms TEXT NOT NULL DEFAULT '[]',
+                    output_format TEXT NOT NULL DEFAULT 'full',
+                    owner TEXT,
+                    heartbeat REAL
+                );
+                CREATE INDEX IF NOT EXISTS jobs_by_digest ON jobs (scope, digest);
+                CREATE TABLE IF NOT EXISTS chunks (
+                    job_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    text TEXT NOT NULL,
+                    result TEXT,
+                    PRIMARY KEY (job_id, idx)
+                );
+            """)
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for name, definition in ADDED_COLUMNS.items():
+                if name not in columns:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {definition}")
+        return self._conn
+
+    @staticmethod
+    def digest(text):
+        return hashlib.sha256(text.encode("utf8")).hexdigest()
+
+    def create_job(self, scope, text, chunks, protected_terms=(), output_format="full"):
+        """Persist a new job, the engine settings it runs with and its chunk texts; returns the job id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute(
+                    "INSERT INTO jobs (id, scope, digest, status, text, total_chunks, created, updated, "
+                    "protected_terms, output_format) VALUES (?, ?, ?, 'queued', ?, ?, ?, ?, ?, ?)",
+                    (job_id, scope, self.digest(text), text, len(chunks), now, now,
+                     json.dumps(sorted(set(protected_terms))), output_format),
+                )
+                db.executemany(
+                    "INSERT INTO chunks (job_id, idx, text) VALUES (?, ?, ?)",
+                    [(job_id, idx, chunk) for idx, chunk in enumerate(chunks)],
+                )
+        return job_id
+
+    def find_job(self, scope, text, protected_terms=(), output_format="full"):
+        """Latest job with the same key scope, text and settings, so a retried submit resumes it"""
+        with self._lock:
+            row = self._db().execute(
+                "SELECT id FROM jobs WHERE scope = ? AND digest = ? AND protected_terms = ? AND output_format = ? "
+                "ORDER BY created DESC LIMIT 1",
+                (scope, self.digest(text), json.dumps(sorted(set(protected_terms))), output_format),
+            ).fetchone()
+        return row["id"] if row else None
+
+    def get_job(self, job_id):
+        """Job status and progress, or None"""
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            done = db.execute(
+                "SELECT COUNT(*) FROM chunks WHERE job_id = ? AND result IS NOT NULL", (job_id,)
+            ).fetchone()[0]
+        status = row["status"]
+        if status == "running" and self._is_stale(row["heartbeat"]):
+            # Its worker died without recording why
+            status = "interrupted"
+        return {
+            "job_id": row["id"],
+            "scope": row["scope"],
+            "status": status,
+            "chunks_total": row["total_chunks"],
+            "chunks_done": done,
+            "created": row["created"],
+            "updated": row["updated"],
+            "error": row["error"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "protected_terms": json.loads(row["protected_terms"]),
+            "output_format": row["output_format"],
+        }
+
+    def pending_chunks(self, job_id):
+        """(index, text) for chunks that have no stored result yet"""
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT idx, text FROM chunks WHERE job_id = ? AND result IS NULL ORDER BY idx", (job_id,)
+            ).fetchall()
+        return [(row["idx"], row["text"]) for row in rows]
+
+    def chunk_results(self, job_id):
+        """Stored chunk results in document order"""
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT result FROM chunks WHERE job_id = ? ORDER BY idx", (job_id,)
+            ).fetchall()
+        return [json.loads(row["result"]) if row["result"] else None for row in rows]
+
+    def save_chunk_result(self, job_id, idx, result):
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute(
+                    "UPDATE chunks SET result = ? WHERE job_id = ? AND idx = ?",
+                    (json.dumps(result), job_id, idx),
+                )
+                db.execute("UPDATE jobs SET updated = ? WHERE id = ?", (time.time(), job_id))
+
+    def set_status(self, job_id, status, result=None, error=None):
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute(
+                    "UPDATE jobs SET status = ?, result = ?, error = ?, updated = ? WHERE id = ?",
+                    (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+                )
+
+    @staticmethod
+    def _is_stale(heartbeat):
+        return heartbeat is None or heartbeat < time.time() - STALE_AFTER
+
+    def claim(self, job_id):
+        """Atomically make this worker the job's owner; False if another live worker runs it"""
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            with db:
+                cursor = db.execute(
+                    "UPDATE jobs SET status = 'running', owner = ?, heartbeat = ?, updated = ? "
+                    "WHERE id = ? AND status != 'completed' "
+                    "AND (status != 'running' OR owner = ? OR heartbeat IS NULL OR heartbeat < ?)",
+                    (self.owner, now, now, job_id, self.owner, now - STALE_AFTER),
+                )
+        return cursor.rowcount == 1
+
+    def heartbeat(self, job_id):
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute(
+                    "UPDATE jobs SET heartbeat = ? WHERE id = ? AND owner = ?", (time.time(), job_id, self.owner)
+                )
+
+    def mark_interrupted(self):
+        """At startup, flag jobs whose owner stopped sending heartbeats; live workers keep theirs"""
+        with self._lock:
+            db = self._db()
+            with db:
+                cursor = db.execute(
+                    "UPDATE jobs SET status = 'interrupted', updated = ? WHERE status IN ('queued', 'running') "
+                    "AND (heartbeat IS NULL OR heartbeat < ?)",
+                    (time.time(), time.time() - STALE_AFTER),
+                )
+        return cursor.rowcount
+
+    def purge_expired(self):
+        """Delete jobs (and their document text) not updated within the retention window"""
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            # A job some worker is still running is never purged, however old
+            expired = [
+                row["id"] for row in db.execute(
+                    "SELECT id FROM jobs WHERE updated < ? AND (status != 'running' OR heartbeat IS NULL OR heartbeat < ?)",
+                    (now - self.retention, now - STALE_AFTER),
+                )
+            ]
+            with db:
+                db.executemany("DELETE FROM chunks WHERE job_id = ?", [(job_id,) for job_id in expired])
+                db.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in expired])
+        return len(expired)
+
+
+class JobRunner:
+    def __init__(self, store):
+        self.store = store
+        self._tasks = {}
+
+    def is_running(self, job_id):
+        task = self._tasks.get(job_id)
+        return task is not None and not task.done()
+
+    def start(self, job_id, engine):
+        """Process the job's unfinished chunks in the background; False if another worker is running it"""
+        if self.is_running(job_id):
+            return True
+        if not self.store.claim(job_id):
+            return False
+        self._tasks[job_id] = asyncio.create_task(self._run(job_id, engine))
+        return True
+
+    async def _heartbeat(self, job_id):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            self.store.heartbeat(job_id)
+
+    async def _run(self, job_id, engine):
+        start_time = time.time()
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+
+        async def process(idx, chunk):
+            result = await engine.correct_with_llm(chunk)
+            # _merge_chunk_results only merges chunks marked successful
+            result["success"] = True
+            self.store.save_chunk_result(job_id, idx, result)
+
+        try:
+            pending = self.store.pending_chunks(job_id)
+            # The upstream limiter bounds how many chunks are in flight
+            outcomes = await asyncio.gather(
+                *(process(idx, chunk) for idx, chunk in pending), return_exceptions=True
+            )
+            errors = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+            if errors:
+                # Finished chunks stay stored; resuming only retries the failed ones
+                self.store.set_status(job_id, "failed", error=str(errors[0]))
+                return
+
+            chunk_results = self.store.chunk_results(job_id)
+            if len(chunk_results) == 1:
+                merged = chunk_results[0]
+            else:
+                merged = engine._merge_chunk_results(chunk_results)
+                merged["chunks_processed"] = len(chunk_results)
+            method = f"Chunked LLM job ({len(chunk_results)} chunks)"
+            response = engine._correction_response(merged, method, time.time() - start_time)
+            self.store.set_status(job_id, "completed", result=response)
+        except asyncio.CancelledError:
+            self.store.set_status(job_id, "interrupted")
+            raise
+        except Exception as e:
+            self.store.set_status(job_id, "failed", error=str(e))
+        finally:
+            heartbeat.cancel()
+            self._tasks.pop(job_id, None)
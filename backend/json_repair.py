@@ -0,0 +1,119 @@
+"""
+Truncated JSON detection and repair
+LLM output that hits max_new_tokens stops mid-object; these helpers tell
+whether that happened and close the partial object at its last complete value,
+dropping any nested record that was still being written
+"""
+import json
+
+CLOSERS = {"{": "}", "[": "]"}
+
+
+def _strip_fences(output):
+    output = output.strip()
+    if output.startswith("```json"):
+        output = output[7:]
+    elif output.startswith("```"):
+        output = output[3:]
+    return output
+
+
+def _scan(text):
+    """Walk the JSON object starting at text[0].
+
+    Returns (end, safe): `end` is the offset just past the closed top-level
+    object or -1 if it never closes; `safe` lists (offset, closers) for every
+    point where the prefix can be closed into valid JSON without leaving a
+    nested object incomplete.
+    """
+    stack = []  # [opener, state]; state is key/colon/value/comma
+    safe = []
+    in_string = is_key = escaped = in_literal = False
+
+    def closers():
+        return "".join(CLOSERS[opener] for opener, _ in reversed(stack))
+
+    def mark_safe(offset):
+        # Closing a nested object early would keep a half-written record; only
+        # the top-level object and lists may be cut short
+        if all(opener == "[" for opener, _ in stack[1:]):
+            safe.append((offset, closers()))
+
+    def value_done(offset):
+        stack[-1][1] = "comma"
+        mark_safe(offset)
+
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+                if is_key:
+                    stack[-1][1] = "colon"
+                else:
+                    value_done(i + 1)
+            continue
+        if in_literal:
+            if char not in ",}] \t\r\n":
+                continue
+            in_literal = False
+            value_done(i)
+
+        if char == '"':
+            in_string = True
+            is_key = stack[-1][0] == "{" and stack[-1][1] == "key"
+        elif char in CLOSERS:
+            stack.append([char, "key" if char == "{" else "value"])
+            if char == "[":
+                mark_safe(i + 1)
+        elif char in "}]":
+            stack.pop()
+            if not stack:
+                return i + 1, safe
+            value_done(i + 1)
+        elif char == ":":
+            stack[-1][1] = "value"
+        elif char == ",":
+            stack[-1][1] = "key" if stack[-1][0] == "{" else "value"
+        elif not char.isspace():
+            in_literal = True
+    return -1, safe
+
+
+def is_truncated(output):
+    """True when `output` opens a JSON object that never closes"""
+    output = _strip_fences(output)
+    start = output.find("{")
+    if start < 0:
+        return False
+    end, _ = _scan(output[start:])
+    return end < 0
+
+
+def repair_json(output):
+    """Parse the longest valid prefix of a truncated JSON object; None if nothing survives
+
+    A trailing record cut mid-way (`{"original": "x"` inside a list) is dropped
+    whole; only the top-level object and lists are closed early.
+    """
+    output = _strip_fences(output)
+    start = output.find("{")
+    if start < 0:
+        return None
+    text = output[start:]
+    end, safe = _scan(text)
+    if end >= 0:
+        try:
+            return json.loads(text[:end])
+        except json.JSONDecodeError:
+            return None
+    # Latest safe point first; older ones only matter if the scan was fooled
+    for offset, closers in reversed(safe):
+        try:
+            return json.loads(text[:offset] + closers)
+        except json.JSONDecodeError:
+            continue
+    return None
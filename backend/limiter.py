@@ -0,0 +1,152 @@
+"""
+Adaptive concurrency limiter for upstream LLM calls
+AIMD with a latency gradient: probe upward while latency stays near the
+observed baseline, back off multiplicatively on errors or latency spikes
+"""
+import asyncio
+import collections
+import contextlib
+import threading
+import time
+
+
+class AdaptiveLimiter:
+    def __init__(self, initial_limit=4, min_limit=1, max_limit=64,
+                 backoff=0.7, tolerance=2.0, smoothing=0.05):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+
+        self._limit = float(initial_limit)
+        self._inflight = 0
+        self._waiters = collections.deque()
+        self._lock = threading.Lock()
+        self._pressure_listeners = []
+
+        self._baseline = None
+        self._last_latency = None
+        self._successes = 0
+        self._errors = 0
+        self._backoffs = 0
+
+    @property
+    def limit(self):
+        """Current concurrency limit (whole slots)"""
+        return max(self.min_limit, int(self._limit))
+
+    async def acquire(self):
+        """Wait for a free slot; works from any event loop"""
+        with self._lock:
+            if self._inflight < self.limit and not self._waiters:
+                self._inflight += 1
+                return
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters.append(fut)
+
+        # Someone has to queue: let low-priority work get out of the way
+        for listener in list(self._pressure_listeners):
+            listener()
+
+        try:
+            await fut
+        except asyncio.CancelledError:
+            with self._lock:
+                if fut in self._waiters:
+                    # Never granted a slot
+                    self._waiters.remove(fut)
+                    raise
+            if fut.done() and not fut.cancelled():
+                # Slot was granted just before we were cancelled
+                self.release()
+            raise
+
+    def release(self, latency=None, error=False):
+        """Free a slot and feed the outcome into the limit estimate"""
+        with self._lock:
+            self._inflight -= 1
+            if error:
+                self._errors += 1
+                self._decrease()
+            elif latency is not None:
+                self._successes += 1
+                self._observe(latency)
+            self._wake_waiters()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, cost=1):
+        """Hold a slot for one upstream call; latency is normalised by `cost`
+
+        Yields a timer dict; callers that queue again after acquiring (e.g. for a
+        worker thread) reset timer["start"] once the call really begins, so local
+        queueing is not mistaken for upstream latency.
+        """
+        await self.acquire()
+        timer = {"start": time.monotonic()}
+        try:
+            yield timer
+        except asyncio.CancelledError:
+            # Abandoned calls say nothing about upstream health
+            self.release()
+            raise
+        except Exception:
+            self.release(error=True)
+            raise
+        else:
+            self.release(latency=(time.monotonic() - timer["start"]) / max(cost, 1))
+
+    def add_pressure_listener(self, callback):
+        """Call `callback()` whenever a caller has to queue for a slot"""
+        self._pressure_listeners.append(callback)
+
+    def has_headroom(self, fraction=0.5):
+        """True when in-flight work is below `fraction` of the limit and nobody waits"""
+        with self._lock:
+            return not self._waiters and self._inflight < self.limit * fraction
+
+    def snapshot(self):
+        """Current state for the metrics endpoint"""
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "inflight": self._inflight,
+                "queued": len(self._waiters),
+                "baseline_latency": self._baseline,
+                "last_latency": self._last_latency,
+                "successes": self._successes,
+                "errors": self._errors,
+                "backoffs": self._backoffs,
+            }
+
+    def _observe(self, latency):
+        """Grow additively while latency is stable, back off on spikes"""
+        self._last_latency = latency
+        if self._baseline is None or latency < self._baseline:
+            self._baseline = latency
+        else:
+            # Let the baseline drift up slowly so it tracks real upstream changes
+            self._baseline += (latency - self._baseline) * self.smoothing
+
+        if latency > self._baseline * self.tolerance:
+            self._decrease()
+        elif self._inflight + 1 >= self.limit // 2:
+            # Only probe upward when we are actually using the current limit
+            self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
+
+    def _decrease(self):
+        self._backoffs += 1
+        self._limit = max(self.min_limit, self._limit * self.backoff)
+
+    def _wake_waiters(self):
+        while self._waiters and self._inflight < self.limit:
+            fut = self._waiters.popleft()
+            self._inflight += 1
+            fut.get_loop().call_soon_threadsafe(self._grant, fut)
+
+    def _grant(self, fut):
+        if fut.done():
+            # Waiter was cancelled after the slot was assigned
+            self.release()
+        else:
+            fut.set_result(None)
@@ -0,0 +1,204 @@
+"""
+Protected-span masking
+Replaces URLs, emails, numbers, identifiers, acronyms, inline code and
+tenant-protected terms with compact placeholders before prompting, then
+restores them and maps edit offsets back to the original text
+"""
+import bisect
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from segmenter import HTML_TAG_PATTERN, INLINE_CODE_PATTERN, URL_PATTERN
+
+PLACEHOLDER_MARK = "§"
+PLACEHOLDER_PATTERN = re.compile(PLACEHOLDER_MARK + r"(\d+)")
+
+# Ordered by priority for spans that start at the same offset
+PROTECTED_PATTERNS = [
+    ("inline_code", INLINE_CODE_PATTERN),
+    ("url", URL_PATTERN),
+    ("email", re.compile(r"\b[\w.+-]+@[\w-]+(?:\.[\w-]+)+\b")),
+    ("html_tag", HTML_TAG_PATTERN),
+    ("identifier", re.compile(
+        r"\b(?:[A-Za-z]\w*_\w+"                        # snake_case
+        r"|[a-z]+[A-Z]\w*"                             # camelCase
+        r"|[a-z_]\w+(?:\.[a-z_]\w+)+(?:\(\))?)\b"      # dotted.names, module.call()
+    )),
+    ("number", re.compile(r"(?<![\w.])[-+]?\d+(?:[.,:/]\d+)*%?(?![\w])")),
+    # Short all-caps tokens only; longer ones are usually emphasis, not acronyms
+    ("acronym", re.compile(r"\b[A-Z]{2,5}[0-9]*s?\b")),
+]
+
+# Text where this many words, and at least half of all words, are upper case is
+# written in caps; its words are not acronyms and must stay correctable
+SHOUTING_MIN_WORDS = 3
+WORD_PATTERN = re.compile(r"[A-Za-z]+")
+
+# (placeholder, original, start, end, masked_start, masked_end)
+MaskedSpan = namedtuple("MaskedSpan", ["placeholder", "original", "start", "end", "masked_start", "masked_end"])
+
+
+class TermTrie:
+    """Longest-match trie over protected terms, matched at word boundaries"""
+
+    def __init__(self, terms):
+        self.root = {}
+        self.size = 0
+        for term in terms:
+            term = term.strip()
+            if not term:
+                continue
+            node = self.root
+            for char in term:
+                node = node.setdefault(char, {})
+            node[None] = True
+            self.size += 1
+
+    def find_all(self, text):
+        """(start, end) of non-overlapping longest matches"""
+        spans = []
+        length = len(text)
+        i = 0
+        while i < length:
+            if (i > 0 and text[i - 1].isalnum()) or text[i] not in self.root:
+                i += 1
+                continue
+            node = self.root
+            j = i
+            match_end = -1
+            while j < length and text[j] in node:
+                node = node[text[j]]
+                j += 1
+                if None in node and (j == length or not text[j].isalnum()):
+                    match_end = j
+            if match_end > 0:
+                spans.append((i, match_end))
+                i = match_end
+            else:
+                i += 1
+        return spans
+
+
+@lru_cache(maxsize=256)
+def build_term_trie(terms):
+    """Prebuilt trie for a tenant's protected terms; `terms` must be a tuple"""
+    return TermTrie(terms)
+
+
+class MaskedText:
+    def __init__(self, original, text, spans):
+        self.original = original
+        self.text = text
+        self.spans = spans
+        self._masked_starts = [span.masked_start for span in spans]
+
+    def unmask(self, masked):
+        """Replace placeholders in `masked`; None if any placeholder is missing or invented"""
+        seen = set()
+
+        def replace(match):
+            index = int(match.group(1))
+            if index >= len(self.spans):
+                raise KeyError(index)
+            seen.add(index)
+            return self.spans[index].original
+
+        try:
+            restored = PLACEHOLDER_PATTERN.sub(replace, masked)
+        except KeyError:
+            return None
+        return restored if len(seen) == len(self.spans) else None
+
+    def unmask_fragment(self, fragment):
+        """Best-effort restore for edit strings, which may hold any subset of placeholders"""
+        return PLACEHOLDER_PATTERN.sub(
+            lambda m: self.spans[int(m.group(1))].original if int(m.group(1)) < len(self.spans) else m.group(0),
+            fragment,
+        )
+
+    def to_original(self, position, is_end=False):
+        """Map an offset in the masked text to the original text"""
+        index = bisect.bisect_right(self._masked_starts, position) - 1
+        if index < 0:
+            return position
+        span = self.spans[index]
+        if position < span.masked_end and position > span.masked_start:
+            # Inside a placeholder: snap to the protected span's bounds
+            return span.end if is_end else span.start
+        if position == span.masked_start:
+            return span.start
+        return span.end + (position - span.masked_end)
+
+    def restore_result(self, result):
+        """Unmask an LLM correction result; None if the model damaged a placeholder"""
+        corrected = self.unmask(result["text"])
+        if corrected is None:
+            return None
+
+        edits = []
+        for edit in result.get("edits", []):
+            try:
+                start = self.to_original(int(edit["start"]))
+                end = self.to_original(int(edit["end"]), is_end=True)
+            except (KeyError, TypeError, ValueError):
+                continue
+            restored = dict(edit)
+            restored["start"] = start
+            restored["end"] = max(start, end)
+            restored["original"] = self.unmask_fragment(str(edit.get("original", "")))
+            restored["suggestion"] = self.unmask_fragment(str(edit.get("suggestion", "")))
+            edits.append(restored)
+
+        restored_result = dict(result)
+        restored_result["text"] = corrected
+        restored_result["edits"] = edits
+        return restored_result
+
+
+def _is_shouting(text):
+    """True for all-caps writing such as "THIS IS A TSET", where caps do not mark acronyms"""
+    words = WORD_PATTERN.findall(text)
+    upper = sum(word.isupper() for word in words)
+    return upper >= SHOUTING_MIN_WORDS and upper * 2 >= len(words)
+
+
+def mask_protected(text, trie=None):
+    """Mask protected spans in `text`; returns a MaskedText"""
+    if PLACEHOLDER_MARK in text:
+        # Placeholders would be ambiguous; send the text as-is
+        return MaskedText(text, text, [])
+
+    shouting = _is_shouting(text)
+    candidates = []
+    for priority, (kind, pattern) in enumerate(PROTECTED_PATTERNS):
+        if kind == "acronym" and shouting:
+            continue
+        for match in pattern.finditer(text):
+            candidates.append((match.start(), -match.end(), priority))
+    if trie is not None and trie.size:
+        for start, end in trie.find_all(text):
+            # Tenant terms win ties against the generic patterns
+            candidates.append((start, -end, -1))
+    if not candidates:
+        return MaskedText(text, text, [])
+    candidates.sort()
+
+    pieces = []
+    spans = []
+    position = 0
+    masked_length = 0
+    for start, negative_end, _ in candidates:
+        end = -negative_end
+        if start < position:
+            continue
+        pieces.append(text[position:start])
+        masked_length += start - position
+        placeholder = f"{PLACEHOLDER_MARK}{len(spans)}"
+        spans.append(MaskedSpan(placeholder, text[start:end], start, end, masked_length, masked_length + len(placeholder)))
+        pieces.append(placeholder)
+        masked_length += len(placeholder)
+        position = end
+    pieces.append(text[position:])
+
+    return MaskedText(text, "".join(pieces), spans)
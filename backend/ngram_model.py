@@ -0,0 +1,167 @@
+"""
+Compact n-gram language model for local context scoring
+Unigram, bigram and trigram counts from an offline corpus, stored as sorted
+64-bit key hashes with parallel count arrays in one file that workers mmap;
+candidates are scored by interpolated (Jelinek-Mercer) log-probability
+
+Usage:
+    python ngram_model.py corpus.txt [more.txt ...] [--output data/ngrams.bin] [--min-count 2]
+"""
+import argparse
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from array_file import write_array
+from shared_dictionary import key_hash
+
+MAGIC = b"GFPNGRM\0"
+FORMAT_VERSION = 1
+
+# magic, version, unigrams, bigrams, trigrams, total tokens
+HEADER = struct.Struct("<8sIIIIQ")
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+DEFAULT_OUTPUT = os.path.join(DATA_DIR, "ngrams.bin")
+
+TOKEN_PATTERN = re.compile(r"[a-z]+(?:'[a-z]+)?")
+
+# Share of probability mass kept by the longer context at each interpolation step
+BIGRAM_WEIGHT = 0.7
+TRIGRAM_WEIGHT = 0.6
+
+
+def tokenize(line):
+    return TOKEN_PATTERN.findall(line.lower())
+
+
+def _sorted_table(counter):
+    """(hashes, counts) sorted by hash; a 64-bit collision merges two n-grams, which we accept"""
+    merged = {}
+    for ngram, count in counter.items():
+        h = key_hash(" ".join(ngram))
+        merged[h] = merged.get(h, 0) + count
+    hashes = array("Q", sorted(merged))
+    counts = array("I", (min(merged[h], 0xFFFFFFFF) for h in hashes))
+    return hashes, counts
+
+
+def build(corpus_paths, output_path, min_count=1):
+    """Count n-grams line by line over the corpus files and write the mapped model"""
+    counters = (Counter(), Counter(), Counter())
+    total = 0
+    for path in corpus_paths:
+        with open(path, "r", encoding="utf8", errors="replace") as fh:
+            for line in fh:
+                tokens = tokenize(line)
+                total += len(tokens)
+                for order, counter in enumerate(counters, start=1):
+                    for i in range(len(tokens) - order + 1):
+                        counter[tuple(tokens[i:i + order])] += 1
+
+    tables = []
+    for order, counter in enumerate(counters, start=1):
+        if order > 1 and min_count > 1:
+            counter = Counter({ngram: count for ngram, count in counter.items() if count >= min_count})
+        tables.append(_sorted_table(counter))
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    tmp_path = output_path + f".{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as fh:
+        fh.write(HEADER.pack(MAGIC, FORMAT_VERSION, *(len(hashes) for hashes, _ in tables), total))
+        fh.write(b"\0" * (-HEADER.size % 8))
+        for hashes, counts in tables:
+            write_array(fh, hashes)
+            write_array(fh, counts)
+    os.replace(tmp_path, output_path)
+    return [len(hashes) for hashes, _ in tables]
+
+
+class NgramModel:
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise RuntimeError("N-gram model files are little-endian")
+        self.path = path
+        with open(path, "rb") as fh:
+            self._map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, unigrams, bigrams, trigrams, self.total = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} n-gram model")
+        self.vocabulary = unigrams
+
+        view = memoryview(self._map)
+        position = HEADER.size + (-HEADER.size % 8)
+        self._tables = []
+        for length in (unigrams, bigrams, trigrams):
+            hashes = view[position:position + 8 * length].cast("Q")
+            position += 8 * length
+            counts = view[position:position + 4 * length].cast("I")
+            position += 4 * length
+            position += -position % 8
+            self._tables.append((hashes, counts))
+
+    def count(self, *words):
+        """Corpus count of the 1-3 word n-gram"""
+        hashes, counts = self._tables[len(words) - 1]
+        h = key_hash(" ".join(words))
+        index = bisect_left(hashes, h)
+        if index < len(hashes) and hashes[index] == h:
+            return counts[index]
+        return 0
+
+    def __contains__(self, word):
+        return self.count(word) > 0
+
+    def log_prob(self, word, previous=None, before_previous=None):
+        """Interpolated log P(word | before_previous previous); unseen context words add nothing"""
+        prob = (self.count(word) + 1) / (self.total + self.vocabulary)
+        if previous is None:
+            return math.log(prob)
+        previous_count = self.count(previous)
+        if previous_count:
+            bigram = self.count(previous, word) / previous_count
+            prob = BIGRAM_WEIGHT * bigram + (1 - BIGRAM_WEIGHT) * prob
+            if before_previous is not None:
+                context_count = self.count(before_previous, previous)
+                if context_count:
+                    trigram = self.count(before_previous, previous, word) / context_count
+                    prob = TRIGRAM_WEIGHT * trigram + (1 - TRIGRAM_WEIGHT) * prob
+        return math.log(prob)
+
+    def candidate_scores(self, candidates, before_previous, previous, next_word, after_next):
+        """Log-probability of each candidate's window: itself plus the two words that follow it"""
+        scores = []
+        for candidate in candidates:
+            score = self.log_prob(candidate, previous, before_previous)
+            if next_word is not None:
+                score += self.log_prob(next_word, candidate, previous)
+                if after_next is not None:
+                    score += self.log_prob(after_next, next_word, candidate)
+            scores.append(score)
+        return scores
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the n-gram model used by the local engine for context scoring")
+    parser.add_argument("corpus", nargs="+", help="Plain-text corpus files, one sentence or paragraph per line")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Output file (default: data/ngrams.bin)")
+    parser.add_argument("--min-count", type=int, default=2, help="Drop bigrams and trigrams seen fewer times (default: 2)")
+    args = parser.parse_args(argv)
+
+    start = time.time()
+    unigrams, bigrams, trigrams = build(args.corpus, args.output, args.min_count)
+    print(f"📦 Built {args.output} ({os.path.getsize(args.output) / 1e6:.1f} MB) in {time.time() - start:.1f}s: "
+          f"{unigrams:,} unigrams, {bigrams:,} bigrams, {trigrams:,} trigrams")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""
+Few-shot correction prompt builder
+Keeps a pool of worked examples and puts only the few most relevant to each
+input into the prompt, within a token budget, behind a cached static prefix
+"""
+import json
+import threading
+from functools import lru_cache
+
+from masking import PLACEHOLDER_MARK
+
+# (input, corrected, [(original, suggestion, type, confidence), ...]) in input order
+EXAMPLE_POOL = [
+    ("thsi is the werst test.", "this is the worst test.",
+     [("thsi", "this", "spelling", 0.95), ("werst", "worst", "spelling", 0.92)]),
+    ("i beleive John recieved the mesage", "I believe John received the message",
+     [("i", "I", "capitalization", 0.98), ("beleive", "believe", "spelling", 0.94),
+      ("recieved", "received", "spelling", 0.96), ("mesage", "message", "spelling", 0.93)]),
+    ("the qick brwn fox jumps ovr the lzy dog", "the quick brown fox jumps over the lazy dog",
+     [("qick", "quick", "spelling", 0.97), ("brwn", "brown", "spelling", 0.94),
+      ("ovr", "over", "spelling", 0.96), ("lzy", "lazy", "spelling", 0.95)]),
+    ("definitly recieve the necesary mesage immediatly", "definitely receive the necessary message immediately",
+     [("definitly", "definitely", "spelling", 0.96), ("recieve", "receive", "spelling", 0.95),
+      ("necesary", "necessary", "spelling", 0.94), ("mesage", "message", "spelling", 0.93),
+      ("immediatly", "immediately", "spelling", 0.97)]),
+    ("seperate the wrd and chek qualiy", "separate the word and check quality",
+     [("seperate", "separate", "spelling", 0.95), ("wrd", "word", "spelling", 0.92),
+      ("chek", "check", "spelling", 0.94), ("qualiy", "quality", "spelling", 0.93)]),
+    ("NASA sent astronauts to space succesfully", "NASA sent astronauts to space successfully",
+     [("succesfully", "successfully", "spelling", 0.96)]),
+    ("we shoud go to the stor todya and buy som things", "we should go to the store today and buy some things",
+     [("shoud", "should", "spelling", 0.95), ("stor", "store", "spelling", 0.94),
+      ("todya", "today", "spelling", 0.96), ("som", "some", "spelling", 0.93)]),
+    ("The report is ready.", "The report is ready.", []),
+    ("Run §0 to instal the dependancies", "Run §0 to install the dependencies",
+     [("instal", "install", "spelling", 0.95), ("dependancies", "dependencies", "spelling", 0.96)]),
+    ("Pleese send the invoce to §0 by Friday", "Please send the invoice to §0 by Friday",
+     [("Pleese", "Please", "spelling", 0.96), ("invoce", "invoice", "spelling", 0.95)]),
+    ("teh API retuns a JSON objet", "the API returns a JSON object",
+     [("teh", "the", "spelling", 0.97), ("retuns", "returns", "spelling", 0.95), ("objet", "object", "spelling", 0.93)]),
+    ("The comittee will anounce the resluts tommorow", "The committee will announce the results tomorrow",
+     [("comittee", "committee", "spelling", 0.95), ("anounce", "announce", "spelling", 0.94),
+      ("resluts", "results", "spelling", 0.95), ("tommorow", "tomorrow", "spelling", 0.96)]),
+]
+
+HEADERS = {
+    "full": "You are a professional English copyeditor. Correct spelling errors and obvious typos while preserving meaning, proper nouns, and technical terms. Return only valid JSON.",
+    "edits": "You are a professional English copyeditor. Find spelling errors and obvious typos while preserving meaning, proper nouns, and technical terms. Return only valid JSON listing each fix as [\"original\",\"suggestion\",start] where start is the character offset of original in the input. Do not repeat the corrected text.",
+}
+
+RULES = {
+    "full": [
+        "Fix obvious spelling mistakes only",
+        "Keep proper nouns unchanged (NASA, John, etc.)",
+        "Preserve technical terms and abbreviations",
+        "Copy placeholders such as §0 or §12 exactly; they stand for protected text",
+        "Use high confidence (0.90+) for obvious errors",
+        "Return exact character positions",
+        "Output valid JSON only",
+    ],
+    "edits": [
+        "Fix obvious spelling mistakes only",
+        "Keep proper nouns unchanged (NASA, John, etc.)",
+        "Copy placeholders such as §0 or §12 exactly; never edit them",
+        "Output valid JSON only",
+    ],
+}
+
+# The examples the fixed prompts used to embed; the baseline for measuring savings
+LEGACY_EXAMPLES = {"full": (0, 1, 2, 3, 4, 5, 6), "edits": (0, 1, 5, 7)}
+
+EXAMPLE_TOKEN_BUDGET = 300
+MAX_EXAMPLES = 3
+
+
+def estimate_tokens(text):
+    """Same rough heuristic as LLMEngine._estimate_tokens"""
+    return len(text) // 3
+
+
+def _trigrams(text):
+    padded = f" {text.lower()} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+POOL_TRIGRAMS = [_trigrams(example[0]) for example in EXAMPLE_POOL]
+
+
+@lru_cache(maxsize=None)
+def render_example(output_format, index):
+    """One 'Input/Output' example block in the given output format"""
+    source, corrected, fixes = EXAMPLE_POOL[index]
+    position = 0
+    records = []
+    for original, suggestion, kind, confidence in fixes:
+        start = source.index(original, position)
+        position = start + len(original)
+        records.append((original, suggestion, start, kind, confidence))
+
+    if output_format == "edits":
+        output = {"e": [[original, suggestion, start] for original, suggestion, start, _, _ in records]}
+    else:
+        output = {"text": corrected, "edits": [
+            {"original": original, "suggestion": suggestion, "start": start, "end": start + len(original),
+             "type": kind, "confidence": confidence}
+            for original, suggestion, start, kind, confidence in records
+        ]}
+    return f'Input: "{source}"\nOutput: {json.dumps(output, ensure_ascii=False, separators=(",", ":"))}\n\n'
+
+
+@lru_cache(maxsize=None)
+def static_prefix(output_format):
+    """Instructions and rules, identical for every request in a format"""
+    rules = "\n".join(f"- {rule}" for rule in RULES[output_format])
+    return f"{HEADERS[output_format]}\n\nRULES:\n{rules}\n\nEXAMPLES:\n\n"
+
+
+def select_examples(text, budget=EXAMPLE_TOKEN_BUDGET, output_format="full"):
+    """Indices of the most relevant pool examples that fit in `budget` tokens"""
+    grams = _trigrams(text)
+    masked = PLACEHOLDER_MARK in text
+    scored = []
+    for index, example_grams in enumerate(POOL_TRIGRAMS):
+        score = len(grams & example_grams) / (len(example_grams) ** 0.5)
+        if masked and PLACEHOLDER_MARK in EXAMPLE_POOL[index][0]:
+            score += 10.0  # Show the model what to do with placeholders
+        scored.append((-score, index))
+    scored.sort()
+
+    chosen = []
+    spent = 0
+    for _, index in scored:
+        cost = estimate_tokens(render_example(output_format, index))
+        if chosen and spent + cost > budget:
+            continue
+        chosen.append(index)
+        spent += cost
+        if len(chosen) == MAX_EXAMPLES:
+            break
+    return sorted(chosen)
+
+
+@lru_cache(maxsize=None)
+def _examples_block(output_format, indices):
+    return "".join(render_example(output_format, index) for index in indices)
+
+
+def build_prompt(text, output_format="full", budget=EXAMPLE_TOKEN_BUDGET):
+    """Correction prompt for `text`; returns (prompt, estimated_prompt_tokens)"""
+    indices = tuple(select_examples(text, budget, output_format))
+    prompt = f'{static_prefix(output_format)}{_examples_block(output_format, indices)}Input: "{text}"\nOutput:'
+    prompt_tokens = estimate_tokens(prompt)
+    PROMPT_STATS.record(prompt_tokens, baseline_tokens(output_format, text), len(indices))
+    return prompt, prompt_tokens
+
+
+def baseline_tokens(output_format, text):
+    """Estimated prompt size had the fixed example set been used"""
+    return estimate_tokens(_examples_block(output_format, LEGACY_EXAMPLES[output_format])) + estimate_tokens(
+        f'{static_prefix(output_format)}Input: "{text}"\nOutput:'
+    )
+
+
+class PromptStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._prompts = 0
+        self._tokens = 0
+        self._baseline = 0
+        self._examples = 0
+
+    def record(self, tokens, baseline, examples):
+        with self._lock:
+            self._prompts += 1
+            self._tokens += tokens
+            self._baseline += baseline
+            self._examples += examples
+
+    def snapshot(self):
+        with self._lock:
+            prompts = self._prompts
+            return {
+                "prompts": prompts,
+                "prompt_tokens": self._tokens,
+                "avg_prompt_tokens": self._tokens / prompts if prompts else 0.0,
+                "avg_examples": self._examples / prompts if prompts else 0.0,
+                "baseline_prompt_tokens": self._baseline,
+                "tokens_saved": self._baseline - self._tokens,
+            }
+
+
+PROMPT_STATS = PromptStats()
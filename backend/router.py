@@ -0,0 +1,103 @@
+"""
+Latency-aware model routing
+Picks the small or large Llama-3 model per upstream call from the mode, input
+length, the caller's remaining deadline and each model's observed latency
+"""
+import os
+import threading
+from collections import defaultdict
+
+SMALL_MODEL = "meta/meta-llama-3-8b-instruct"
+LARGE_MODEL = "meta/meta-llama-3-70b-instruct"
+
+# Priors (seconds per requested output token) until a model has been observed
+LATENCY_PRIORS = {SMALL_MODEL: 0.01, LARGE_MODEL: 0.03}
+DEFAULT_LATENCY_PRIOR = 0.02
+
+
+class ModelRouter:
+    def __init__(self, small_model=None, large_model=None, large_modes=None,
+                 long_input_tokens=None, smoothing=0.2):
+        self.small_model = small_model or os.getenv("GFP_SMALL_MODEL", SMALL_MODEL)
+        self.large_model = large_model or os.getenv("GFP_LARGE_MODEL", LARGE_MODEL)
+        if large_modes is None:
+            large_modes = os.getenv("GFP_LARGE_MODEL_MODES", "formality,naturalness").split(",")
+        self.large_modes = frozenset(mode.strip() for mode in large_modes if mode.strip())
+        # Inputs at least this long (estimated tokens) in a large mode go to the large model
+        self.long_input_tokens = long_input_tokens or int(os.getenv("GFP_LARGE_MODEL_MIN_TOKENS", "150"))
+        self.smoothing = smoothing
+
+        self._lock = threading.Lock()
+        self._latency = {}  # model -> EWMA seconds per requested token
+        self._calls = defaultdict(int)
+        self._errors = defaultdict(int)
+        self._total_latency = defaultdict(float)
+        self._decisions = defaultdict(int)
+
+    @property
+    def cache_tag(self):
+        """Identifies the routing configuration for result cache keys"""
+        return f"{self.small_model}|{self.large_model}|{','.join(sorted(self.large_modes))}|{self.long_input_tokens}"
+
+    def estimate(self, model, max_new_tokens):
+        """Expected seconds for a call to `model` that may generate `max_new_tokens`"""
+        with self._lock:
+            per_token = self._latency.get(model, LATENCY_PRIORS.get(model, DEFAULT_LATENCY_PRIOR))
+        return per_token * max(max_new_tokens, 1)
+
+    def choose(self, mode, input_tokens, max_new_tokens, deadline_ms=None):
+        """Model for one upstream call"""
+        if mode in self.large_modes and input_tokens >= self.long_input_tokens:
+            model, reason = self.large_model, "long_rewrite"
+        else:
+            model, reason = self.small_model, "default"
+
+        if deadline_ms is not None and model != self.small_model:
+            if self.estimate(model, max_new_tokens) * 1000 > deadline_ms:
+                # The stronger model would likely miss the deadline
+                model, reason = self.small_model, "deadline"
+
+        with self._lock:
+            self._decisions[(mode, model, reason)] += 1
+        return model
+
+    def record(self, model, latency, cost=1, error=False):
+        """Feed one finished call's outcome back into the latency estimates"""
+        with self._lock:
+            self._calls[model] += 1
+            if error:
+                self._errors[model] += 1
+                return
+            self._total_latency[model] += latency
+            per_token = latency / max(cost, 1)
+            previous = self._latency.get(model)
+            self._latency[model] = per_token if previous is None else previous + (per_token - previous) * self.smoothing
+
+    def snapshot(self):
+        """Routing decisions and per-model outcomes for the metrics endpoint"""
+        with self._lock:
+            models = {}
+            for model in {self.small_model, self.large_model} | set(self._calls):
+                calls = self._calls[model]
+                successes = calls - self._errors[model]
+                per_token = self._latency.get(model)
+                models[model] = {
+                    "calls": calls,
+                    "errors": self._errors[model],
+                    "avg_latency": self._total_latency[model] / successes if successes else None,
+                    "latency_per_token": per_token,
+                }
+            decisions = [
+                {"mode": mode, "model": model, "reason": reason, "count": count}
+                for (mode, model, reason), count in sorted(self._decisions.items())
+            ]
+            return {
+                "policy": {
+                    "small_model": self.small_model,
+                    "large_model": self.large_model,
+                    "large_modes": sorted(self.large_modes),
+                    "long_input_tokens": self.long_input_tokens,
+                },
+                "models": models,
+                "decisions": decisions,
+            }
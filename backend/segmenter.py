@@ -0,0 +1,95 @@
+"""
+Structure-aware segmentation for Markdown, HTML and code
+Splits a document into prose regions (sent to the LLM) and non-prose spans
+(code, URLs, tags, tables) that pass through byte-for-byte
+"""
+import re
+from collections import namedtuple
+
+# start/end are offsets into the original document; kind is "prose" or the pattern name
+Segment = namedtuple("Segment", ["start", "end", "kind"])
+
+# Inline spans; masking.py protects the same ones inside prose
+INLINE_CODE_PATTERN = re.compile(r"`[^`\n]+`")
+URL_PATTERN = re.compile(r"\b(?:https?://|www\.)[^\s<>()\[\]\"']*[^\s<>()\[\]\"'.,;:!?]")
+HTML_TAG_PATTERN = re.compile(r"</?[A-Za-z][A-Za-z0-9-]*(?:\s[^<>]*)?/?>")
+
+# Ordered by priority: when two spans start at the same offset the earlier pattern wins
+NON_PROSE_PATTERNS = [
+    ("code_block", re.compile(r"^[ \t]*(```|~~~)[^\n]*\n.*?^[ \t]*\1[ \t]*$", re.M | re.S)),
+    ("html_block", re.compile(r"<(pre|code|script|style)\b[^>]*>.*?</\1\s*>", re.S | re.I)),
+    ("html_comment", re.compile(r"<!--.*?-->", re.S)),
+    ("table", re.compile(r"^[ \t]*\|.*\|[ \t]*$(?:\n[ \t]*\|.*\|[ \t]*$)*", re.M)),
+    ("inline_code", INLINE_CODE_PATTERN),
+    ("url", URL_PATTERN),
+    ("html_tag", HTML_TAG_PATTERN),
+]
+
+# Spans that end a prose region; inline spans stay inside it and are masked instead
+BLOCK_KINDS = ("code_block", "html_block", "html_comment", "table")
+
+# Cheap pre-check; plain prose takes no regex passes at all
+STRUCTURE_HINTS = ("`", "~~~", "<", "|", "http", "www.")
+
+WORD_PATTERN = re.compile(r"[A-Za-z]{2,}")
+
+
+def has_structure(text):
+    """True when the text may contain non-prose spans"""
+    return any(hint in text for hint in STRUCTURE_HINTS)
+
+
+def segment_document(text):
+    """Split text into contiguous segments that cover it exactly"""
+    if not has_structure(text):
+        return [Segment(0, len(text), "prose")]
+
+    matches = []
+    for priority, (kind, pattern) in enumerate(NON_PROSE_PATTERNS):
+        for match in pattern.finditer(text):
+            if match.end() > match.start():
+                matches.append((match.start(), -match.end(), priority, kind))
+    # Earliest start first, then the longest span, then pattern priority
+    matches.sort()
+
+    segments = []
+    position = 0
+    for start, negative_end, _, kind in matches:
+        end = -negative_end
+        if start < position:
+            continue  # Overlaps a span we already took
+        if start > position:
+            segments.append(Segment(position, start, "prose"))
+        segments.append(Segment(start, end, kind))
+        position = end
+    if position < len(text):
+        segments.append(Segment(position, len(text), "prose"))
+
+    return segments
+
+
+def has_blocks(segments):
+    """True when any segment is block-level non-prose"""
+    return any(segment.kind in BLOCK_KINDS for segment in segments)
+
+
+def prose_regions(text, segments=None):
+    """Regions between block-level spans that are worth sending to the LLM.
+    
+    Inline spans (inline code, URLs, tags) stay inside their region so the
+    sentence around them is corrected in one piece; the masking pre-pass keeps
+    them out of the prompt.
+    """
+    if segments is None:
+        segments = segment_document(text)
+
+    regions = []
+    start = None
+    for segment in segments + [Segment(len(text), len(text), "end")]:
+        if segment.kind in BLOCK_KINDS or segment.kind == "end":
+            if start is not None and WORD_PATTERN.search(text, start, segment.start):
+                regions.append(Segment(start, segment.start, "prose"))
+            start = None
+        elif start is None:
+            start = segment.start
+    return regions
@@ -0,0 +1,302 @@
+"""
+Memory-mapped, read-only spelling dictionary
+Words, frequencies and the SymSpell-style deletes index live in flat arrays
+inside one file that every worker maps read-only, so N workers share a single
+physical copy through the page cache instead of building N sets of dicts
+
+Usage:
+    python shared_dictionary.py [--source data/word_frequency.txt] [--output data/word_frequency.dict]
+"""
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+
+from array_file import write_array
+from edit_distance import batch_distances
+
+MAGIC = b"GFPDICT\0"
+FORMAT_VERSION = 1
+
+# magic, version, max_edit_distance, prefix_length, words, word_slots, delete_slots,
+# postings, blob_size, source_size, source_mtime_ns
+HEADER = struct.Struct("<8sIIIIIIIIQQ")
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+DEFAULT_SOURCE = os.path.join(DATA_DIR, "word_frequency.txt")
+
+
+def key_hash(text):
+    """64-bit key for the open-addressing tables; 0 marks an empty slot"""
+    value = int.from_bytes(hashlib.blake2b(text.encode("utf8"), digest_size=8).digest(), "little")
+    return value or 1
+
+
+def _table_size(entries):
+    size = 1
+    while size < entries * 2:
+        size <<= 1
+    return size
+
+
+def _edits(word, max_distance, prefix_length):
+    """The word's prefix and every delete of it within `max_distance`, down to the empty string"""
+    key = word[:prefix_length]
+    found = {key}
+    frontier = [key]
+    for _ in range(max_distance):
+        following = []
+        for item in frontier:
+            for i in range(len(item)):
+                delete = item[:i] + item[i + 1:]
+                if delete not in found:
+                    found.add(delete)
+                    following.append(delete)
+        frontier = following
+    return found
+
+
+def build(source_path, output_path, max_edit_distance=3, prefix_length=6):
+    """Build the mapped dictionary file from a 'word<TAB>count' list"""
+    words = []
+    counts = array("Q")
+    index = {}
+    with open(source_path, "r", encoding="utf8") as fh:
+        for line in fh:
+            parts = line.strip().split()
+            if not parts:
+                continue
+            count = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 1
+            if parts[0] in index:
+                # Repeated entries add up, as with SymSpell.create_dictionary_entry
+                counts[index[parts[0]]] += count
+                continue
+            index[parts[0]] = len(words)
+            words.append(parts[0])
+            counts.append(count)
+
+    deletes = {}
+    for word_index, word in enumerate(words):
+        for delete in _edits(word, max_edit_distance, prefix_length):
+            deletes.setdefault(delete, []).append(word_index)
+
+    blob = bytearray()
+    word_offsets = array("I", [0])
+    for word in words:
+        blob += word.encode("utf8")
+        word_offsets.append(len(blob))
+
+    word_slots = _table_size(len(words))
+    word_hashes = array("Q", bytes(8 * word_slots))
+    word_entries = array("I", bytes(4 * word_slots))
+    for word_index, word in enumerate(words):
+        h = key_hash(word)
+        slot = h & (word_slots - 1)
+        while word_hashes[slot]:
+            slot = (slot + 1) & (word_slots - 1)
+        word_hashes[slot] = h
+        word_entries[slot] = word_index + 1
+
+    delete_slots = _table_size(len(deletes))
+    delete_hashes = array("Q", bytes(8 * delete_slots))
+    delete_starts = array("I", bytes(4 * delete_slots))
+    delete_lengths = array("I", bytes(4 * delete_slots))
+    postings = array("I")
+    for delete, word_indices in deletes.items():
+        h = key_hash(delete)
+        slot = h & (delete_slots - 1)
+        while delete_hashes[slot]:
+            slot = (slot + 1) & (delete_slots - 1)
+        delete_hashes[slot] = h
+        delete_starts[slot] = len(postings)
+        delete_lengths[slot] = len(word_indices)
+        postings.extend(word_indices)
+
+    stat = os.stat(source_path)
+    tmp_path = output_path + f".{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as fh:
+        fh.write(HEADER.pack(
+            MAGIC, FORMAT_VERSION, max_edit_distance, prefix_length, len(words), word_slots,
+            delete_slots, len(postings), len(blob), stat.st_size, stat.st_mtime_ns,
+        ))
+        fh.write(b"\0" * (-HEADER.size % 8))
+        # 8-byte arrays first so every section stays aligned for memoryview.cast
+        for values in (counts, word_hashes, delete_hashes, word_offsets, word_entries,
+                       delete_starts, delete_lengths, postings):
+            write_array(fh, values)
+        fh.write(blob)
+    os.replace(tmp_path, output_path)
+
+
+class SharedDictionary:
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise RuntimeError("Shared dictionary files are little-endian")
+        self.path = path
+        with open(path, "rb") as fh:
+            self._map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, self.max_edit_distance, self.prefix_length, self._words, self._word_slots,
+         self._delete_slots, postings, blob_size, self.source_size, self.source_mtime_ns) = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} shared dictionary")
+
+        view = memoryview(self._map)
+        position = HEADER.size + (-HEADER.size % 8)
+
+        def section(typecode, length, width):
+            nonlocal position
+            values = view[position:position + length * width].cast(typecode)
+            position += length * width
+            position += -position % 8
+            return values
+
+        self._counts = section("Q", self._words, 8)
+        self._word_hashes = section("Q", self._word_slots, 8)
+        self._delete_hashes = section("Q", self._delete_slots, 8)
+        self._word_offsets = section("I", self._words + 1, 4)
+        self._word_entries = section("I", self._word_slots, 4)
+        self._delete_starts = section("I", self._delete_slots, 4)
+        self._delete_lengths = section("I", self._delete_slots, 4)
+        self._postings = section("I", postings, 4)
+        self._blob = view[position:position + blob_size]
+
+    def __len__(self):
+        return self._words
+
+    def __iter__(self):
+        return (self._word(i) for i in range(self._words))
+
+    def is_current(self, source_path):
+        """True when the file was built from `source_path` as it is now"""
+        try:
+            stat = os.stat(source_path)
+        except OSError:
+            return True  # Nothing to compare against; the mapped file is all we have
+        return stat.st_size == self.source_size and stat.st_mtime_ns == self.source_mtime_ns
+
+    def _word(self, word_index):
+        return bytes(self._blob[self._word_offsets[word_index]:self._word_offsets[word_index + 1]]).decode("utf8")
+
+    def _find_word(self, word):
+        h = key_hash(word)
+        mask = self._word_slots - 1
+        slot = h & mask
+        while True:
+            stored = self._word_hashes[slot]
+            if not stored:
+                return -1
+            if stored == h:
+                word_index = self._word_entries[slot] - 1
+                if self._word(word_index) == word:
+                    return word_index
+            slot = (slot + 1) & mask
+
+    def _postings_for(self, delete):
+        h = key_hash(delete)
+        mask = self._delete_slots - 1
+        slot = h & mask
+        while True:
+            stored = self._delete_hashes[slot]
+            if not stored:
+                return ()
+            if stored == h:
+                start = self._delete_starts[slot]
+                return self._postings[start:start + self._delete_lengths[slot]]
+            slot = (slot + 1) & mask
+
+    def get_word_frequency(self, word):
+        """Frequency count of `word`, 0 if it is not in the dictionary"""
+        word_index = self._find_word(word)
+        return self._counts[word_index] if word_index >= 0 else 0
+
+    def get(self, word, default=0):
+        """dict-style frequency lookup, so the engine can treat this like SymSpell.words"""
+        word_index = self._find_word(word)
+        return self._counts[word_index] if word_index >= 0 else default
+
+    def lookup(self, phrase, max_edit_distance=None):
+        """All (term, distance, count) within `max_edit_distance`, closest and most frequent first"""
+        if max_edit_distance is None or max_edit_distance > self.max_edit_distance:
+            max_edit_distance = self.max_edit_distance
+        results = []
+        phrase_index = self._find_word(phrase)
+        if phrase_index >= 0:
+            results.append((phrase, 0, self._counts[phrase_index]))
+
+        phrase_prefix = phrase[:self.prefix_length]
+        candidates = [phrase_prefix]
+        considered_deletes = {phrase_prefix}
+        considered_words = {phrase_index}
+        matched = []
+        pointer = 0
+        while pointer < len(candidates):
+            candidate = candidates[pointer]
+            pointer += 1
+            length_difference = len(phrase_prefix) - len(candidate)
+            if length_difference > max_edit_distance:
+                continue
+
+            for word_index in self._postings_for(candidate):
+                if word_index not in considered_words:
+                    considered_words.add(word_index)
+                    matched.append(word_index)
+
+            if length_difference < max_edit_distance:
+                for i in range(len(candidate)):
+                    delete = candidate[:i] + candidate[i + 1:]
+                    if delete not in considered_deletes:
+                        considered_deletes.add(delete)
+                        candidates.append(delete)
+
+        words = [self._word(word_index) for word_index in matched]
+        for word_index, word, distance in zip(matched, words, batch_distances(phrase, words, max_edit_distance)):
+            if distance >= 0:
+                results.append((word, distance, self._counts[word_index]))
+
+        results.sort(key=lambda result: (result[1], -result[2]))
+        return results
+
+    def get_candidates(self, word, max_edit_distance=None, limit=10):
+        """Correction candidates for `word`, same shape as ContextEngine.get_candidates"""
+        lowered = word.lower()
+        candidates = [term for term, _, _ in self.lookup(word, max_edit_distance) if term.lower() != lowered]
+        return candidates[:limit]
+
+
+def open_shared_dictionary(path, source_path=DEFAULT_SOURCE, max_edit_distance=3, prefix_length=6):
+    """Map `path`, building it from `source_path` first if it is missing, stale or built differently"""
+    if os.path.exists(path):
+        dictionary = SharedDictionary(path)
+        if (dictionary.is_current(source_path) and dictionary.max_edit_distance >= max_edit_distance
+                and dictionary.prefix_length == prefix_length):
+            return dictionary
+    print(f"📦 Building shared dictionary {path} (run shared_dictionary.py before starting workers to skip this)")
+    build(source_path, path, max_edit_distance, prefix_length)
+    return SharedDictionary(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the memory-mapped dictionary shared by engine workers")
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help="Word frequency list (default: data/word_frequency.txt)")
+    parser.add_argument("--output", default=os.path.join(DATA_DIR, "word_frequency.dict"), help="Output file (default: data/word_frequency.dict)")
+    parser.add_argument("--max-edit-distance", type=int, default=3, help="Deletes index depth (default: 3)")
+    parser.add_argument("--prefix-length", type=int, default=6, help="Prefix length (default: 6)")
+    args = parser.parse_args(argv)
+
+    start = time.time()
+    build(args.source, args.output, args.max_edit_distance, args.prefix_length)
+    print(f"📦 Built {args.output} ({os.path.getsize(args.output) / 1e6:.1f} MB) in {time.time() - start:.1f}s")
+
+    start = time.time()
+    dictionary = SharedDictionary(args.output)
+    print(f"⚡ Mapped {len(dictionary):,} words in {(time.time() - start) * 1000:.1f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
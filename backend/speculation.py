@@ -0,0 +1,114 @@
+"""
+Speculative background enhancement
+After /correct, enhance the corrected text at low priority so a following
+/enhance call can answer immediately
+"""
+import asyncio
+import hashlib
+
+ENHANCEMENT_TYPES = ("naturalness", "formality")
+
+
+class Speculator:
+    def __init__(self, limiter, headroom=0.5):
+        self.limiter = limiter
+        self.headroom = headroom
+        self._tasks = {}      # (scope, type, digest) -> task
+        self._claimed = set() # keys a foreground request is waiting on
+        self._latest = {}     # scope -> digest of the latest corrected text, while it has tasks
+        self._stats = {
+            "scheduled": 0,
+            "skipped_load": 0,
+            "cancelled": 0,
+            "hits": 0,
+            "failed": 0,
+        }
+        limiter.add_pressure_listener(self.cancel_unclaimed)
+
+    @staticmethod
+    def _digest(text):
+        return hashlib.sha256(text.encode("utf8")).hexdigest()
+
+    def schedule(self, engine, text, enhancement_types=ENHANCEMENT_TYPES):
+        """Start background enhancement of `text` for each requested type"""
+        scope = engine.cache_scope
+        digest = self._digest(text)
+
+        # A new corrected text from this user makes older speculation useless
+        if self._latest.get(scope) != digest:
+            self.cancel_scope(scope)
+        self._latest[scope] = digest
+
+        for enhancement_type in enhancement_types:
+            if enhancement_type not in ENHANCEMENT_TYPES:
+                continue
+            key = (scope, enhancement_type, digest)
+            if key in self._tasks or engine.cached_enhancement(text, enhancement_type) is not None:
+                continue
+            if not self.limiter.has_headroom(self.headroom):
+                self._stats["skipped_load"] += 1
+                continue
+            self._stats["scheduled"] += 1
+            self._tasks[key] = asyncio.create_task(self._run(engine, text, enhancement_type, key))
+        self._forget_idle_scope(scope)
+
+    async def _run(self, engine, text, enhancement_type, key):
+        try:
+            # Deterministic so the result lands in the shared result cache
+            if enhancement_type == "naturalness":
+                await engine.enhance_naturalness(text, deterministic=True)
+            else:
+                await engine.enhance_formality(text, deterministic=True)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            self._stats["failed"] += 1
+        finally:
+            if self._tasks.get(key) is asyncio.current_task():
+                del self._tasks[key]
+                self._claimed.discard(key)
+                self._forget_idle_scope(key[0])
+
+    async def take(self, engine, text, enhancement_type):
+        """Return a speculative result for `text`, waiting on it if still running; None if absent"""
+        result = engine.cached_enhancement(text, enhancement_type)
+        key = (engine.cache_scope, enhancement_type, self._digest(text))
+        task = self._tasks.get(key)
+
+        if result is None and task is not None:
+            # A real request depends on it now; load shedding must not cancel it
+            self._claimed.add(key)
+            await asyncio.wait({task})
+            result = engine.cached_enhancement(text, enhancement_type)
+
+        if result is not None:
+            self._stats["hits"] += 1
+        return result
+
+    def cancel_scope(self, scope):
+        """Cancel unclaimed speculation belonging to one API key"""
+        for key in list(self._tasks):
+            if key[0] == scope:
+                self._cancel(key)
+
+    def cancel_unclaimed(self):
+        """Drop all speculation nobody is waiting for (called under upstream load)"""
+        for key in list(self._tasks):
+            self._cancel(key)
+
+    def _cancel(self, key):
+        task = self._tasks.get(key)
+        if task is not None and key not in self._claimed and not task.done():
+            task.cancel()
+            # Forget it now; a task cancelled before it started never runs its cleanup
+            del self._tasks[key]
+            self._stats["cancelled"] += 1
+            self._forget_idle_scope(key[0])
+
+    def _forget_idle_scope(self, scope):
+        """Drop a scope's latest digest once nothing of it is running, so _latest stays bounded"""
+        if not any(key[0] == scope for key in self._tasks):
+            self._latest.pop(scope, None)
+
+    def stats(self):
+        return dict(self._stats, running=len(self._tasks), scopes=len(self._latest))
@@ -0,0 +1,104 @@
+"""
+Tests for token reservations and budgets
+Upstream calls use a stand-in Replicate client; no API key needed
+"""
+import asyncio
+import types
+
+import pytest
+
+import accounting
+import engine
+from accounting import BudgetExceededError, UsageLedger
+
+
+def test_reserve_then_settle_books_actual_usage():
+    ledger = UsageLedger(request_budget=0, key_budget=0)
+    usage = ledger.new_request()
+    ledger.reserve("key", 100, usage)
+    assert usage["reserved"] == 100
+    ledger.settle("key", 100, 30, 20, usage)
+    assert usage == {"prompt_tokens": 30, "output_tokens": 20, "calls": 1, "reserved": 0}
+    state = ledger.snapshot()
+    assert state["by_key"]["key"]["window_tokens"] == 50
+    assert state["prompt_tokens"] == 30 and state["output_tokens"] == 20
+
+
+def test_request_budget_counts_reservations():
+    ledger = UsageLedger(request_budget=100, key_budget=0)
+    usage = ledger.new_request()
+    ledger.reserve("key", 60, usage)
+    # A concurrent chunk cannot reserve past the budget before the first settles
+    with pytest.raises(BudgetExceededError):
+        ledger.reserve("key", 60, usage)
+    ledger.settle("key", 60, 10, 10, usage)
+    ledger.reserve("key", 60, usage)
+    # Another request has its own budget
+    ledger.reserve("key", 60, ledger.new_request())
+    assert ledger.snapshot()["rejected"] == 1
+
+
+def test_key_budget_resets_with_the_window(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(accounting, "time", types.SimpleNamespace(time=lambda: clock[0]))
+    ledger = UsageLedger(request_budget=0, key_budget=100, key_window=60)
+    usage = ledger.new_request()
+    ledger.reserve("key", 80, usage)
+    ledger.settle("key", 80, 50, 40, usage)
+    with pytest.raises(BudgetExceededError):
+        ledger.reserve("key", 20, ledger.new_request())
+    # Other keys are unaffected
+    ledger.reserve("other", 20, ledger.new_request())
+
+    clock[0] += 60
+    ledger.reserve("key", 20, ledger.new_request())
+
+
+def test_idle_keys_are_evicted(monkeypatch):
+    clock = iter(range(100))
+    monkeypatch.setattr(accounting, "time", types.SimpleNamespace(time=lambda: next(clock)))
+    ledger = UsageLedger(request_budget=0, key_budget=0, max_keys=2)
+    for scope in ("a", "b", "a", "c"):
+        ledger.record_request(scope, 1)
+    assert set(ledger.snapshot()["by_key"]) == {"a", "c"}
+
+
+class FakePrediction:
+    def __init__(self, events, metrics=None, fail=False):
+        self.events = events
+        self.metrics = metrics
+        self.fail = fail
+
+    def stream(self):
+        for event in self.events:
+            yield event
+        if self.fail:
+            raise RuntimeError("stream dropped")
+
+    def cancel(self):
+        pass
+
+
+def stream(offline_engine, monkeypatch, prediction):
+    ledger = UsageLedger(request_budget=0, key_budget=0)
+    monkeypatch.setattr(engine, "USAGE_LEDGER", ledger)
+    predictions = types.SimpleNamespace(create=lambda **kwargs: prediction)
+    offline_engine.client = types.SimpleNamespace(models=types.SimpleNamespace(predictions=predictions))
+    input_data = {"prompt": "x" * 300, "max_new_tokens": 50}
+    return ledger, asyncio.run(offline_engine._stream_llm(input_data))
+
+
+def test_stream_settles_metered_tokens(offline_engine, monkeypatch):
+    prediction = FakePrediction(["Hello", " world"], {"input_token_count": 90, "output_token_count": 3})
+    ledger, output = stream(offline_engine, monkeypatch, prediction)
+    assert output == "Hello world"
+    assert offline_engine.usage == {"prompt_tokens": 90, "output_tokens": 3, "calls": 1, "reserved": 0}
+    assert ledger.snapshot()["by_key"][offline_engine.cache_scope]["window_tokens"] == 93
+
+
+def test_failed_stream_still_books_what_it_generated(offline_engine, monkeypatch):
+    prediction = FakePrediction(["abcdef"], fail=True)
+    with pytest.raises(RuntimeError):
+        stream(offline_engine, monkeypatch, prediction)
+    # No metrics: estimates from the prompt and the partial output
+    assert offline_engine.usage == {"prompt_tokens": 100, "output_tokens": 2, "calls": 1, "reserved": 0}
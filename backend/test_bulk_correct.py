@@ -0,0 +1,59 @@
+"""
+Tests for the bulk correction CLI
+A stand-in engine upper-cases each text, so no API key is needed
+"""
+import json
+
+import bulk_correct
+
+
+class FakeEngine:
+    def __init__(self, api_key=None):
+        self.usage = None
+
+    async def correct_text_async(self, text, use_chunking=True):
+        return {"text": text.upper(), "suggestions": [], "success": True, "method": "Fake"}
+
+
+def run_cli(tmp_path, monkeypatch, lines, *extra):
+    monkeypatch.setattr(bulk_correct, "LLMEngine", FakeEngine)
+    source = tmp_path / "input.jsonl"
+    source.write_bytes(b"".join(line + b"\n" for line in lines))
+    output = tmp_path / "output.jsonl"
+    assert bulk_correct.main([str(source), str(output), "--api-key", "test", *extra]) == 0
+    return [json.loads(line) for line in output.read_text(encoding="utf8").splitlines()]
+
+
+def test_every_input_record_reaches_the_output(tmp_path, monkeypatch):
+    lines = [
+        b'{"id": 1, "text": "fine"}',
+        b'{"id": 2, "text": 5}',
+        b'{"id": 3, "body": "no text field"}',
+        b'{not json',
+        b'[1, 2]',
+        b'{"id": 6, "text": "   "}',
+        b'\xff\xfe',
+        b'{"id": 8, "text": "last"}',
+    ]
+    records = run_cli(tmp_path, monkeypatch, lines)
+    assert len(records) == len(lines)
+
+    results = [record["correction"] for record in records]
+    assert [result["success"] for result in results] == [True, False, False, False, False, True, False, True]
+    assert results[0]["text"] == "FINE" and results[-1]["text"] == "LAST"
+    assert records[2]["id"] == 3
+    assert results[2]["error"] == "missing field text"
+    assert results[3]["error"].startswith("Invalid JSON")
+
+
+def test_blank_lines_are_not_records(tmp_path, monkeypatch):
+    records = run_cli(tmp_path, monkeypatch, [b'{"text": "a"}', b"", b'{"text": "b"}'])
+    assert [record["correction"]["text"] for record in records] == ["A", "B"]
+
+
+def test_custom_field(tmp_path, monkeypatch):
+    lines = [b'{"body": "one"}', b'{"text": "wrong field"}']
+    records = run_cli(tmp_path, monkeypatch, lines, "--field", "body")
+    assert len(records) == len(lines)
+    assert records[0]["correction"]["text"] == "ONE"
+    assert records[1]["correction"]["error"] == "missing field body"
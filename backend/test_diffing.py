@@ -0,0 +1,70 @@
+"""
+Deterministic tests for word-level edit diffing
+Edits must reproduce the corrected text and land on word boundaries; no API key needed
+"""
+import random
+
+from diffing import compute_word_edits
+
+
+def apply_edits(text, edits):
+    for edit in sorted(edits, key=lambda e: e["start"], reverse=True):
+        text = text[:edit["start"]] + edit["suggestion"] + text[edit["end"]:]
+    return text
+
+
+def test_identical():
+    assert compute_word_edits("Nothing to fix.", "Nothing to fix.") == []
+
+
+def test_single_word():
+    original = "I recieve the package tomorrow."
+    edits = compute_word_edits(original, "I receive the package tomorrow.")
+    assert edits == [{
+        "original": "recieve", "suggestion": "receive", "start": 2, "end": 9,
+        "type": "spelling", "confidence": 0.90,
+    }]
+
+
+def test_edit_types():
+    original = "i went to to the store"
+    corrected = "I went to the big store"
+    edits = compute_word_edits(original, corrected)
+    assert [edit["type"] for edit in edits] == ["capitalization", "deletion", "insertion"]
+    assert apply_edits(original, edits) == corrected
+
+
+def test_word_boundaries():
+    # A shared prefix must not split "their" into "the" + "ir" -> "re"
+    original = "Put it over their."
+    edits = compute_word_edits(original, "Put it over there.")
+    assert [(edit["original"], edit["suggestion"]) for edit in edits] == [("their", "there")]
+
+
+def test_random_corrections_round_trip():
+    rng = random.Random(7)
+    vocabulary = ["the", "cat", "sat", "on", "a", "mat", "and", "then", "slept", ",", "."]
+    for _ in range(200):
+        words = [rng.choice(vocabulary) for _ in range(rng.randint(0, 40))]
+        changed = list(words)
+        for _ in range(rng.randint(1, 5)):
+            position = rng.randint(0, len(changed))
+            action = rng.choice(("insert", "delete", "replace"))
+            if action == "insert" or not changed:
+                changed.insert(position, rng.choice(vocabulary))
+            elif action == "delete":
+                del changed[min(position, len(changed) - 1)]
+            else:
+                changed[min(position, len(changed) - 1)] = rng.choice(vocabulary).upper()
+        original, corrected = " ".join(words), " ".join(changed)
+        assert apply_edits(original, compute_word_edits(original, corrected)) == corrected, (original, corrected)
+
+
+def test_unrelated_texts_become_one_replace():
+    rng = random.Random(11)
+    vocabulary = ["".join(rng.choice("abcdefghij") for _ in range(5)) for _ in range(2000)]
+    original = " ".join(rng.choice(vocabulary) for _ in range(2000))
+    corrected = " ".join(rng.choice(vocabulary) for _ in range(2000))
+    edits = compute_word_edits(original, corrected)
+    assert len(edits) == 1 and edits[0]["type"] == "spelling"
+    assert apply_edits(original, edits) == corrected
@@ -0,0 +1,94 @@
+"""
+Tests for bounded edit distance
+Every backend must agree with a plain OSA reference; the C kernel and NumPy
+checks are skipped when editdistpy or numpy is not installed
+"""
+import random
+
+import pytest
+
+import edit_distance
+from edit_distance import batch_distances, bounded_distance
+
+
+def reference(a, b):
+    """Textbook optimal string alignment distance"""
+    rows = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+    for i in range(len(a) + 1):
+        rows[i][0] = i
+    for j in range(len(b) + 1):
+        rows[0][j] = j
+    for i in range(1, len(a) + 1):
+        for j in range(1, len(b) + 1):
+            rows[i][j] = min(
+                rows[i - 1][j] + 1,
+                rows[i][j - 1] + 1,
+                rows[i - 1][j - 1] + (a[i - 1] != b[j - 1]),
+            )
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                rows[i][j] = min(rows[i][j], rows[i - 2][j - 2] + 1)
+    return rows[len(a)][len(b)]
+
+
+def bounded_reference(a, b, max_distance):
+    distance = reference(a, b)
+    return distance if distance <= max_distance else -1
+
+
+def random_pairs(count=400, seed=3):
+    rng = random.Random(seed)
+    pairs = [("", ""), ("", "abc"), ("thsi", "this"), ("ca", "abc"), ("naïve", "naive"), ("a", "a")]
+    for _ in range(count):
+        word = "".join(rng.choice("abcde") for _ in range(rng.randint(0, 8)))
+        other = list(word)
+        for _ in range(rng.randint(0, 4)):
+            action = rng.randrange(3)
+            position = rng.randint(0, len(other))
+            if action == 0:
+                other.insert(position, rng.choice("abcde"))
+            elif other and position < len(other):
+                if action == 1:
+                    del other[position]
+                elif position + 1 < len(other):
+                    other[position], other[position + 1] = other[position + 1], other[position]
+        pairs.append((word, "".join(other)))
+    return pairs
+
+
+@pytest.fixture
+def pure_python(monkeypatch):
+    monkeypatch.setattr(edit_distance, "damerau_osa", None)
+    monkeypatch.setattr(edit_distance, "np", None)
+
+
+def test_python_path_matches_reference(pure_python):
+    for a, b in random_pairs():
+        assert bounded_distance(a, b) == reference(a, b), (a, b)
+        for max_distance in (0, 1, 2, 3):
+            assert bounded_distance(a, b, max_distance) == bounded_reference(a, b, max_distance), (a, b, max_distance)
+
+
+def test_python_batch(pure_python):
+    candidates = ["this", "thus", "tihs", "th", "these", ""]
+    assert batch_distances("thsi", candidates, 2) == [bounded_reference("thsi", c, 2) for c in candidates]
+
+
+def test_c_kernel_matches_reference():
+    pytest.importorskip("editdistpy")
+    assert edit_distance.damerau_osa is not None
+    for a, b in random_pairs():
+        for max_distance in (1, 2, 3):
+            assert bounded_distance(a, b, max_distance) == bounded_reference(a, b, max_distance), (a, b, max_distance)
+
+
+def test_numpy_batch_matches_reference(monkeypatch):
+    pytest.importorskip("numpy")
+    monkeypatch.setattr(edit_distance, "damerau_osa", None)
+    rng = random.Random(5)
+    pairs = random_pairs()
+    for word in {a for a, _ in pairs if a}:
+        candidates = [b for _, b in rng.sample(pairs, edit_distance.BATCH_MIN_CANDIDATES)] + [word, ""]
+        for max_distance in (1, 2, 3):
+            expected = [bounded_reference(word, candidate, max_distance) for candidate in candidates]
+            assert edit_distance._batch_numpy(word, candidates, max_distance) == expected, (word, max_distance)
+            assert batch_distances(word, candidates, max_distance) == expected
@@ -0,0 +1,94 @@
+"""
+Tests for placing model-reported edits on the original text
+Records with wrong offsets are realigned, unplaceable ones dropped; no API key needed
+"""
+TEXT = "Teh cat sat on teh mat."
+
+
+def apply_edits(text, edits):
+    for edit in sorted(edits, key=lambda e: e["start"], reverse=True):
+        text = text[:edit["start"]] + edit["suggestion"] + text[edit["end"]:]
+    return text
+
+
+def test_records_rebuild_the_corrected_text(offline_engine):
+    records = [["teh", "the", 15], ["Teh", "The", 0], ["mat", "Mat", 19]]
+    result = offline_engine._apply_edit_records(TEXT, records)
+    assert result["text"] == "The cat sat on the Mat."
+    assert [(edit["start"], edit["end"]) for edit in result["edits"]] == [(0, 3), (15, 18), (19, 22)]
+    assert [edit["type"] for edit in result["edits"]] == ["spelling", "spelling", "capitalization"]
+
+
+def test_misplaced_records_are_realigned(offline_engine):
+    # Offsets a few characters off, and one given as a string
+    result = offline_engine._apply_edit_records(TEXT, [["teh", "the", 12], ["sat", "sits", "7"]])
+    assert result["text"] == "Teh cat sits on the mat."
+    assert [edit["start"] for edit in result["edits"]] == [8, 15]
+
+
+def test_bad_records_are_dropped(offline_engine):
+    records = [
+        ["dog", "cat", 0],          # not in the text
+        ["cat", "cat", 4],          # no change
+        ["§0", "x", 0],             # protected placeholder
+        ["cat"],                    # too short
+        {"original": "cat"},        # wrong shape
+        [None, "x", 0],
+        ["cat", "kitten", None],    # bad offset falls back to a search from 0
+    ]
+    result = offline_engine._apply_edit_records(TEXT, records)
+    assert result["text"] == "Teh kitten sat on teh mat."
+    assert len(result["edits"]) == 1
+
+
+def test_overlapping_records_keep_the_first(offline_engine):
+    result = offline_engine._apply_edit_records(TEXT, [["cat sat", "cats sit", 4], ["sat", "sits", 8]])
+    assert result["text"] == "Teh cats sit on teh mat."
+    assert len(result["edits"]) == 1
+
+
+def test_locate_prefers_whole_words_near_the_hint(offline_engine):
+    text = "other the then the"
+    # "the" inside "other" is closer to the hint but not a whole word
+    assert offline_engine._locate_original(text, "the", 0) == 6
+    assert offline_engine._locate_original(text, "the", 14) == 15
+    assert offline_engine._locate_original(text, "the", 200, window=10) == -1
+    assert offline_engine._locate_original(text, "", 3) == 3
+
+
+def make_edit(original, suggestion, start, end=None):
+    return {"original": original, "suggestion": suggestion, "start": start,
+            "end": start + len(original) if end is None else end}
+
+
+def test_verified_edits_pass_untouched(offline_engine):
+    edits = [make_edit("Teh", "The", 0), make_edit("teh", "the", 15)]
+    verified = offline_engine._verify_edits(TEXT, "The cat sat on the mat.", edits)
+    assert verified == edits
+    assert verified[0] is edits[0]
+
+
+def test_verify_repairs_offsets(offline_engine):
+    edits = [make_edit("teh", "the", 11, 99), make_edit("Teh", "The", "0", 3)]
+    verified = offline_engine._verify_edits(TEXT, "The cat sat on the mat.", edits)
+    assert [(edit["start"], edit["end"]) for edit in verified] == [(0, 3), (15, 18)]
+    # The caller's dicts are not mutated
+    assert edits[0]["start"] == 11
+
+
+def test_verify_fills_gaps_from_a_diff(offline_engine):
+    corrected = "The cat sat on the rug."
+    # One edit invented, one missing, one malformed
+    edits = [make_edit("dog", "cat", 4), make_edit("Teh", "The", 0), {"original": "teh"}]
+    verified = offline_engine._verify_edits(TEXT, corrected, edits)
+    assert apply_edits(TEXT, verified) == corrected
+    assert verified[0] == edits[1]
+    assert {edit["original"] for edit in verified} >= {"teh", "mat"}
+
+
+def test_verify_drops_overlaps(offline_engine):
+    corrected = "Teh cats sit on teh mat."
+    edits = [make_edit("cat sat", "cats sit", 4), make_edit("sat", "sits", 8)]
+    verified = offline_engine._verify_edits(TEXT, corrected, edits)
+    assert apply_edits(TEXT, verified) == corrected
+    assert verified == [edits[0]]
@@ -0,0 +1,52 @@
+"""
+Tests for chunked enhancement
+Chunks must rebuild the input exactly and stitched rewrites must keep its layout
+"""
+import asyncio
+
+SENTENCE = "This is a fairly long sentence number {}. "
+
+
+def long_paragraph(count=6):
+    return "".join(SENTENCE.format(i) for i in range(count))
+
+
+def test_chunks_rebuild_the_text(offline_engine):
+    for text in (
+        long_paragraph(),
+        long_paragraph().rstrip(),
+        "Short intro.\n\n" + long_paragraph() + "\n\nOutro. ",
+        long_paragraph() + "\n  \n" + long_paragraph(),
+    ):
+        chunks = offline_engine._paragraph_chunk_text(text, max_chunk_tokens=20)
+        assert "".join(chunk + separator for chunk, separator in chunks) == text
+        # Whitespace lives in separators, never at the end of a chunk
+        assert all(chunk == chunk.rstrip() for chunk, _ in chunks)
+
+
+def enhance(engine, monkeypatch, text, fail=()):
+    async def fake_chunk(chunk, deterministic=False):
+        if any(marker in chunk for marker in fail):
+            raise RuntimeError("upstream failure")
+        return {"text": chunk.upper(), "changes": [], "enhancement_type": "naturalness"}
+
+    monkeypatch.setattr(engine, "_enhance_naturalness_chunk", fake_chunk)
+    original = engine._paragraph_chunk_text
+    monkeypatch.setattr(engine, "_paragraph_chunk_text", lambda text: original(text, max_chunk_tokens=20))
+    return asyncio.run(engine._enhance_uncached(text, "naturalness", False))
+
+
+def test_trailing_whitespace_survives_enhancement(offline_engine, monkeypatch):
+    text = "Intro.\n\n" + long_paragraph()
+    result = enhance(offline_engine, monkeypatch, text)
+    assert result["text"] == text.upper()
+    assert result["text"].endswith(". ")
+    assert result["partial"] is False
+
+
+def test_failed_chunk_marks_result_partial(offline_engine, monkeypatch):
+    text = long_paragraph()
+    result = enhance(offline_engine, monkeypatch, text, fail=("number 2",))
+    assert result["partial"] is True
+    assert "This is a fairly long sentence number 2." in result["text"]
+    assert len(result["text"]) == len(text)
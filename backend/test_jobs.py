@@ -0,0 +1,74 @@
+"""
+Tests for the document job store
+Two JobStore instances on one database stand in for two uvicorn workers
+"""
+import asyncio
+
+import jobs
+from jobs import JobRunner, JobStore
+
+
+def make_job(store, text="Some document.", **settings):
+    return store.create_job("scope", text, [text], **settings)
+
+
+def test_settings_are_part_of_the_lookup(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    job_id = make_job(store, protected_terms=("B", "A"), output_format="edits")
+    assert store.find_job("scope", "Some document.", ("A", "B"), "edits") == job_id
+    assert store.find_job("scope", "Some document.") is None
+    job = store.get_job(job_id)
+    assert job["protected_terms"] == ["A", "B"] and job["output_format"] == "edits"
+
+
+def test_only_one_worker_can_claim_a_job(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    first, second = JobStore(path), JobStore(path)
+    job_id = make_job(first)
+    assert first.claim(job_id)
+    assert not second.claim(job_id)
+    # Claiming again from the owner is allowed
+    assert first.claim(job_id)
+
+
+def test_startup_leaves_live_jobs_alone(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    first, second = JobStore(path), JobStore(path)
+    job_id = make_job(first)
+    first.claim(job_id)
+    # A second worker starting up must not flag the first worker's job
+    assert second.mark_interrupted() == 0
+    assert second.get_job(job_id)["status"] == "running"
+
+
+def test_stale_jobs_are_interrupted_and_can_be_taken_over(tmp_path, monkeypatch):
+    path = str(tmp_path / "jobs.db")
+    first, second = JobStore(path), JobStore(path)
+    job_id = make_job(first)
+    first.claim(job_id)
+    monkeypatch.setattr(jobs, "STALE_AFTER", -1)
+    assert second.get_job(job_id)["status"] == "interrupted"
+    assert second.claim(job_id)
+
+
+def test_runner_does_not_start_a_job_owned_elsewhere(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    first, second = JobStore(path), JobStore(path)
+    job_id = make_job(first)
+    first.claim(job_id)
+
+    async def start():
+        return JobRunner(second).start(job_id, engine=None)
+
+    assert asyncio.run(start()) is False
+
+
+def test_purge_keeps_running_jobs(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"), retention_hours=-1)
+    running = make_job(store, "running")
+    finished = make_job(store, "finished")
+    store.claim(running)
+    store.set_status(finished, "failed", error="boom")
+    assert store.purge_expired() == 1
+    assert store.get_job(finished) is None
+    assert store.get_job(running) is not None
@@ -0,0 +1,86 @@
+"""
+Deterministic tests for truncated JSON detection and repair
+Feeds LLM-style outputs cut off at various points; no API key needed
+"""
+import json
+
+from json_repair import is_truncated, repair_json
+
+COMPLETE = {
+    "corrected": "He said \"hi\", then left {quietly}.",
+    "edits": [
+        {"original": "sayed", "suggestion": "said", "start": 3, "end": 8},
+        {"original": "lef", "suggestion": "left", "start": 20, "end": 23},
+    ],
+    "done": True,
+    "score": 0.9,
+}
+
+
+def test_complete_output():
+    output = json.dumps(COMPLETE)
+    assert not is_truncated(output)
+    assert repair_json(output) == COMPLETE
+    # Fences and trailing chatter around a closed object are ignored
+    assert repair_json("```json\n" + output + "\n```") == COMPLETE
+    assert repair_json("Here you go: " + output + " Hope it helps") == COMPLETE
+
+
+def test_no_object():
+    assert not is_truncated("Sorry, I can't help with that")
+    assert repair_json("Sorry, I can't help with that") is None
+    assert repair_json("") is None
+
+
+def test_truncated_mid_edit_list():
+    output = json.dumps(COMPLETE)
+    cut = output[:output.index('"lef"') + 3]
+    assert is_truncated(cut)
+    repaired = repair_json(cut)
+    assert repaired["corrected"] == COMPLETE["corrected"]
+    # Only the complete first edit survives
+    assert repaired["edits"] == COMPLETE["edits"][:1]
+
+
+def test_partial_trailing_record_is_dropped():
+    output = json.dumps(COMPLETE)
+    # The second edit has a complete "original" value but nothing else
+    cut = output[:output.index('"lef"') + 5]
+    repaired = repair_json(cut)
+    assert repaired["edits"] == COMPLETE["edits"][:1]
+    # Same for a nested object that is not in a list
+    repaired = repair_json('{"text": "ok", "meta": {"model": "small", "tok')
+    assert repaired == {"text": "ok"}
+    repaired = repair_json('{"enhanced": "Hi.", "changes": [{"from": "hey", "to": "Hi"}, {"from": "x"')
+    assert repaired == {"enhanced": "Hi.", "changes": [{"from": "hey", "to": "Hi"}]}
+
+
+def test_truncated_inside_string_with_braces_and_quotes():
+    output = json.dumps(COMPLETE)
+    cut = output[:output.index("{quietly}") + 4]
+    assert is_truncated(cut)
+    # Braces and escaped quotes inside the string don't count; no value completed yet
+    assert repair_json(cut) is None
+
+
+def test_truncated_inside_literal():
+    output = json.dumps(COMPLETE)
+    cut = output[:output.index("true") + 2]
+    repaired = repair_json(cut)
+    assert "done" not in repaired
+    assert len(repaired["edits"]) == 2
+
+
+def test_every_prefix_parses_or_gives_up():
+    output = json.dumps(COMPLETE)
+    previous_keys = 0
+    for end in range(1, len(output)):
+        repaired = repair_json(output[:end])
+        assert repaired is None or isinstance(repaired, dict), output[:end]
+        # Every surviving edit record is complete
+        for edit in (repaired or {}).get("edits", []):
+            assert set(edit) == {"original", "suggestion", "start", "end"}, output[:end]
+        # Cutting later never loses keys that an earlier cut kept
+        keys = len(repaired) if repaired else 0
+        assert keys >= previous_keys, output[:end]
+        previous_keys = keys
@@ -0,0 +1,159 @@
+"""
+Tests for the adaptive upstream limiter
+Latencies are fed in directly, so the AIMD steps are deterministic
+"""
+import asyncio
+
+import pytest
+
+from limiter import AdaptiveLimiter
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_limit_caps_concurrency_and_queues_in_order():
+    limiter = AdaptiveLimiter(initial_limit=2)
+    pressure = []
+    limiter.add_pressure_listener(lambda: pressure.append(True))
+
+    async def scenario():
+        await limiter.acquire()
+        await limiter.acquire()
+        order = []
+
+        async def waiter(name):
+            await limiter.acquire()
+            order.append(name)
+
+        tasks = [asyncio.create_task(waiter(name)) for name in ("first", "second")]
+        await asyncio.sleep(0)
+        assert limiter.snapshot()["queued"] == 2
+        assert not limiter.has_headroom(fraction=1.0)
+
+        limiter.release()
+        await asyncio.sleep(0.01)
+        assert order == ["first"]
+        limiter.release()
+        await asyncio.gather(*tasks)
+        assert order == ["first", "second"]
+        assert limiter.snapshot()["inflight"] == 2
+
+    run(scenario())
+    assert len(pressure) == 2
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    limiter = AdaptiveLimiter(initial_limit=1)
+
+    async def scenario():
+        await limiter.acquire()
+        task = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        limiter.release()
+        assert limiter.snapshot()["inflight"] == 0
+        assert limiter.snapshot()["queued"] == 0
+
+    run(scenario())
+
+
+def test_errors_back_off_multiplicatively():
+    limiter = AdaptiveLimiter(initial_limit=10, backoff=0.5)
+
+    async def scenario():
+        await limiter.acquire()
+        limiter.release(error=True)
+        assert limiter.limit == 5
+        for _ in range(5):
+            await limiter.acquire()
+            limiter.release(error=True)
+        # Never below the floor
+        assert limiter.limit == limiter.min_limit
+
+    run(scenario())
+    assert limiter.snapshot()["errors"] == 6
+
+
+def test_stable_latency_grows_the_limit_when_busy():
+    limiter = AdaptiveLimiter(initial_limit=4)
+
+    async def scenario():
+        # Idle: a single call in flight says nothing about spare capacity
+        await limiter.acquire()
+        limiter.release(latency=1.0)
+        assert limiter._limit == 4.0
+
+        for _ in range(8):
+            await limiter.acquire()
+            await limiter.acquire()
+            limiter.release(latency=1.0)
+            limiter.release()
+        assert limiter.limit == 5
+
+    run(scenario())
+
+
+def test_latency_spike_backs_off():
+    limiter = AdaptiveLimiter(initial_limit=8, backoff=0.5, tolerance=2.0)
+
+    async def scenario():
+        await limiter.acquire()
+        limiter.release(latency=1.0)
+        await limiter.acquire()
+        limiter.release(latency=5.0)
+
+    run(scenario())
+    state = limiter.snapshot()
+    assert state["limit"] == 4
+    assert state["backoffs"] == 1
+    assert state["baseline_latency"] == pytest.approx(1.2)
+    assert state["last_latency"] == 5.0
+
+
+def test_slot_reports_outcomes():
+    limiter = AdaptiveLimiter(initial_limit=4)
+
+    async def failing():
+        async with limiter.slot():
+            raise RuntimeError("upstream failure")
+
+    async def cancelled():
+        async with limiter.slot():
+            raise asyncio.CancelledError()
+
+    async def normalised():
+        async with limiter.slot(cost=4) as timer:
+            # Pretend the call started 2s ago; cost spreads that over 4 units
+            timer["start"] -= 2.0
+
+    with pytest.raises(RuntimeError):
+        run(failing())
+    assert limiter.snapshot()["errors"] == 1
+
+    with pytest.raises(asyncio.CancelledError):
+        run(cancelled())
+    assert limiter.snapshot()["errors"] == 1
+    assert limiter.snapshot()["successes"] == 0
+
+    run(normalised())
+    state = limiter.snapshot()
+    assert state["successes"] == 1 and state["inflight"] == 0
+    assert state["last_latency"] == pytest.approx(0.5, abs=0.05)
+
+
+def test_has_headroom():
+    limiter = AdaptiveLimiter(initial_limit=4)
+
+    async def scenario():
+        assert limiter.has_headroom()
+        await limiter.acquire()
+        assert limiter.has_headroom()
+        await limiter.acquire()
+        assert not limiter.has_headroom()
+        assert limiter.has_headroom(fraction=1.0)
+
+    run(scenario())
@@ -0,0 +1,102 @@
+"""
+Deterministic tests for protected-span masking
+Checks placeholder restore and masked-to-original offset mapping; no API key needed
+"""
+from masking import build_term_trie, mask_protected
+
+TEXT = "Email bob@example.com about teh NASA launch"
+
+
+def apply_edits(text, edits):
+    for edit in sorted(edits, key=lambda e: e["start"], reverse=True):
+        text = text[:edit["start"]] + edit["suggestion"] + text[edit["end"]:]
+    return text
+
+
+def test_mask_and_unmask():
+    masked = mask_protected(TEXT)
+    assert masked.text == "Email §0 about teh §1 launch", masked.text
+    assert [span.original for span in masked.spans] == ["bob@example.com", "NASA"]
+    assert masked.unmask(masked.text) == TEXT
+
+
+def test_unmask_rejects_damaged_placeholders():
+    masked = mask_protected(TEXT)
+    assert masked.unmask("Email about the §1 launch") is None  # §0 dropped
+    assert masked.unmask("Email §0 about the §1 §2 launch") is None  # §2 invented
+
+
+def test_to_original():
+    masked = mask_protected(TEXT)
+    # Before the first placeholder nothing moves
+    assert masked.to_original(3) == 3
+    # Placeholder bounds map to the protected span's bounds
+    assert masked.to_original(6) == 6
+    assert masked.to_original(8, is_end=True) == 21
+    # Inside a placeholder snaps outward
+    assert masked.to_original(7) == 6
+    assert masked.to_original(7, is_end=True) == 21
+    # After it, shifted by the length difference
+    masked_teh = masked.text.index("teh")
+    assert masked.to_original(masked_teh) == TEXT.index("teh")
+
+
+def test_restore_result():
+    masked = mask_protected(TEXT)
+    start = masked.text.index("teh")
+    result = {
+        "text": masked.text.replace("teh", "the"),
+        "edits": [
+            {"original": "teh", "suggestion": "the", "start": start, "end": start + 3, "type": "spelling"},
+            {"original": "§1 launch", "suggestion": "§1 launches", "start": start + 4, "end": start + 13},
+        ],
+    }
+    restored = masked.restore_result(result)
+    assert restored["text"] == "Email bob@example.com about the NASA launch"
+    first, second = restored["edits"]
+    assert TEXT[first["start"]:first["end"]] == "teh"
+    assert first["type"] == "spelling"
+    assert second["original"] == "NASA launch" and second["suggestion"] == "NASA launches"
+    assert TEXT[second["start"]:second["end"]] == "NASA launch"
+    assert apply_edits(TEXT, restored["edits"]) == "Email bob@example.com about the NASA launches"
+
+
+def test_restore_result_skips_bad_offsets():
+    masked = mask_protected(TEXT)
+    result = {"text": masked.text, "edits": [{"original": "x", "suggestion": "y", "start": "?", "end": 2}]}
+    assert masked.restore_result(result)["edits"] == []
+    assert masked.restore_result({"text": "Email about teh launch", "edits": []}) is None
+
+
+def test_protected_terms():
+    text = "Ship GrammarFixer Pro and GrammarFixer Pros"
+    masked = mask_protected(text, build_term_trie(("GrammarFixer Pro",)))
+    # Longest match at word boundaries only
+    assert [span.original for span in masked.spans] == ["GrammarFixer Pro"]
+    assert masked.unmask(masked.text) == text
+
+
+def test_text_with_placeholder_mark_is_left_alone():
+    masked = mask_protected("Costs §5 at NASA")
+    assert masked.text == "Costs §5 at NASA" and masked.spans == []
+
+
+def test_all_caps_text_stays_correctable():
+    masked = mask_protected("THIS IS A TSET")
+    assert masked.text == "THIS IS A TSET" and masked.spans == []
+
+
+def test_acronyms_in_normal_text():
+    masked = mask_protected("The IMPORTNAT deadline from NASA and the EU")
+    # Long all-caps words are emphasis and can hold typos; short ones are acronyms
+    assert [span.original for span in masked.spans] == ["NASA", "EU"]
+
+
+def test_inline_patterns_match_segmenter():
+    import segmenter
+    from masking import PROTECTED_PATTERNS
+
+    patterns = dict(PROTECTED_PATTERNS)
+    inline = dict(segmenter.NON_PROSE_PATTERNS)
+    for kind in ("inline_code", "url", "html_tag"):
+        assert patterns[kind] is inline[kind]
@@ -0,0 +1,66 @@
+"""
+Tests for structure-aware segmentation
+Segments must cover the document exactly and keep code, tables and markup out of prose
+"""
+from segmenter import Segment, has_blocks, prose_regions, segment_document
+
+DOCUMENT = (
+    "# Setup\n"
+    "Run `pip install` from https://example.com/docs.\n"
+    "\n"
+    "```python\n"
+    "print('teh code')\n"
+    "```\n"
+    "\n"
+    "| col | val |\n"
+    "| --- | --- |\n"
+    "\n"
+    "<!-- draft -->Then <b>restart</b> the server.\n"
+)
+
+
+def kinds(text):
+    return [(text[segment.start:segment.end], segment.kind) for segment in segment_document(text) if segment.kind != "prose"]
+
+
+def test_plain_prose_is_one_segment():
+    text = "Just a sentence, nothing else."
+    assert segment_document(text) == [Segment(0, len(text), "prose")]
+    assert not has_blocks(segment_document(text))
+
+
+def test_segments_cover_the_document():
+    segments = segment_document(DOCUMENT)
+    assert "".join(DOCUMENT[segment.start:segment.end] for segment in segments) == DOCUMENT
+    assert all(left.end == right.start for left, right in zip(segments, segments[1:]))
+
+
+def test_non_prose_kinds():
+    found = kinds(DOCUMENT)
+    assert ("`pip install`", "inline_code") in found
+    # Trailing punctuation is not part of the URL
+    assert ("https://example.com/docs", "url") in found
+    assert ("```python\nprint('teh code')\n```", "code_block") in found
+    assert ("| col | val |\n| --- | --- |", "table") in found
+    assert ("<!-- draft -->", "html_comment") in found
+    assert ("<b>", "html_tag") in found and ("</b>", "html_tag") in found
+
+
+def test_overlaps_keep_the_longest_span():
+    text = "See <pre>`x` at http://a.b/c</pre> now"
+    assert kinds(text) == [("<pre>`x` at http://a.b/c</pre>", "html_block")]
+
+
+def test_prose_regions_split_on_blocks_only():
+    regions = prose_regions(DOCUMENT)
+    texts = [DOCUMENT[region.start:region.end] for region in regions]
+    # Inline spans stay inside their sentence; block spans end the region
+    assert texts[0].startswith("# Setup\nRun `pip install` from https://example.com/docs.")
+    assert texts[-1] == "Then <b>restart</b> the server.\n"
+    assert not any("teh code" in text or "col" in text for text in texts)
+    assert has_blocks(segment_document(DOCUMENT))
+
+
+def test_regions_without_words_are_skipped():
+    text = "```\ncode\n```\n  \n| a |\n"
+    assert prose_regions(text) == []
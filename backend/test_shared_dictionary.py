@@ -0,0 +1,84 @@
+"""
+Tests for the memory-mapped spelling dictionary
+Builds a small dictionary file and checks lookups against a brute-force scan
+"""
+import os
+import random
+
+from edit_distance import bounded_distance
+from shared_dictionary import SharedDictionary, build, open_shared_dictionary
+
+WORDS = {
+    "the": 500, "there": 120, "their": 110, "then": 90, "this": 200, "these": 40,
+    "receive": 30, "recipe": 25, "believe": 20, "spelling": 15, "speling": 1,
+    "correct": 60, "correction": 12, "corrections": 8, "cat": 50, "cart": 5, "a": 300,
+}
+
+
+def write_source(path, words=WORDS):
+    path.write_text("".join(f"{word}\t{count}\n" for word, count in words.items()), encoding="utf8")
+    return str(path)
+
+
+def brute_force(phrase, max_distance):
+    results = []
+    for word, count in WORDS.items():
+        distance = bounded_distance(phrase, word, max_distance)
+        if distance >= 0:
+            results.append((word, distance, count))
+    return sorted(results, key=lambda result: (result[1], -result[2]))
+
+
+def test_frequencies(tmp_path):
+    source = tmp_path / "words.txt"
+    write_source(source)
+    with open(source, "a", encoding="utf8") as fh:
+        fh.write("cat 7\n\nlonely\n")
+    build(str(source), str(tmp_path / "words.dict"))
+    dictionary = SharedDictionary(str(tmp_path / "words.dict"))
+    assert len(dictionary) == len(WORDS) + 1
+    # Repeated entries add up; a missing count is 1
+    assert dictionary.get_word_frequency("cat") == 57
+    assert dictionary.get("lonely") == 1
+    assert dictionary.get("missing", None) is None
+    assert set(dictionary) == set(WORDS) | {"lonely"}
+
+
+def test_lookup_matches_brute_force(tmp_path):
+    # A prefix longer than every word makes the deletes index exact
+    build(write_source(tmp_path / "words.txt"), str(tmp_path / "words.dict"), max_edit_distance=2, prefix_length=16)
+    dictionary = SharedDictionary(str(tmp_path / "words.dict"))
+    rng = random.Random(7)
+    phrases = ["teh", "thier", "recieve", "speling", "corection", "", "xyz", "a"]
+    for _ in range(50):
+        word = list(rng.choice(list(WORDS)))
+        for _ in range(rng.randint(0, 2)):
+            word.insert(rng.randint(0, len(word)), rng.choice("aeiourst"))
+        phrases.append("".join(word))
+    for phrase in phrases:
+        for max_distance in (1, 2):
+            assert dictionary.lookup(phrase, max_distance) == brute_force(phrase, max_distance), phrase
+
+
+def test_candidates(tmp_path):
+    build(write_source(tmp_path / "words.txt"), str(tmp_path / "words.dict"))
+    dictionary = SharedDictionary(str(tmp_path / "words.dict"))
+    assert dictionary.get_candidates("recieve", max_edit_distance=1) == ["receive"]
+    # Equal distances rank by frequency
+    assert dictionary.get_candidates("thes", max_edit_distance=1) == ["the", "this", "then", "these"]
+    # The word itself, in any case, is never its own candidate
+    assert dictionary.get_candidates("cat", max_edit_distance=1) == ["cart"]
+    assert dictionary.get_candidates("Cat", max_edit_distance=1) == []
+
+
+def test_stale_file_is_rebuilt(tmp_path):
+    source = write_source(tmp_path / "words.txt")
+    path = str(tmp_path / "words.dict")
+    dictionary = open_shared_dictionary(path, source)
+    assert dictionary.is_current(source)
+    assert dictionary.get("zebra") == 0
+
+    write_source(tmp_path / "words.txt", dict(WORDS, zebra=3))
+    os.utime(source, ns=(dictionary.source_mtime_ns + 10**9,) * 2)
+    assert not dictionary.is_current(source)
+    assert open_shared_dictionary(path, source).get("zebra") == 3